@@ -3,6 +3,39 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from .converter import convert
+import sys
 
-__all__ = ['convert']
+from typing import Any, List, Text
+
+__all__ = ['convert', 'ConversionSession', 'analyze', 'analyze_memory']
+
+# The converter pulls in coremltools and all the layer converters, which takes a noticeable
+# amount of time. Load it on first access, so that importing the package (e.g. for the CLI
+# or the onnx backend compatibility checks) stays cheap.
+_LAZY_ATTRIBUTES = {
+    'convert': '.converter',
+    'ConversionSession': '._session',
+    'analyze': '._analysis',
+    'analyze_memory': '._memory',
+}
+
+if sys.version_info < (3, 7):
+    # module level __getattr__ (PEP 562) needs Python 3.7, import everything upfront instead
+    from .converter import convert
+    from ._session import ConversionSession
+    from ._analysis import analyze
+    from ._memory import analyze_memory
+
+
+def __getattr__(name):  # type: (Text) -> Any
+    if name in _LAZY_ATTRIBUTES:
+        import importlib
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():  # type: () -> List[Text]
+    return sorted(list(globals().keys()) + list(_LAZY_ATTRIBUTES.keys()))
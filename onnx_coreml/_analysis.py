@@ -0,0 +1,281 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from typing import Text, Union, Optional, Dict, Any, List, Set, Tuple
+
+import onnx
+from onnx import shape_inference
+
+
+# values of NodeAnalysis.status
+CONVERTED = 'converted'
+TRANSFORMED = 'transformed'
+CUSTOM_FUNCTION = 'custom_function'
+CUSTOM_LAYER = 'custom_layer'
+UNSUPPORTED = 'unsupported'
+
+
+class NodeAnalysis(object):
+    '''
+    How a single ONNX node is going to be handled by the converter.
+
+    status: one of 'converted' (a layer converter handles it), 'transformed' (removed or
+        folded by a graph transformation), 'custom_function' (handled by one of the
+        custom_conversion_functions), 'custom_layer' (becomes a CoreML custom layer) or
+        'unsupported' (the conversion will fail).
+    converter: name of the function converting the node, if any.
+    dynamic_layer: True if some parameter of the layer is only known at runtime.
+    missing_shapes: names of the node inputs whose shape is unknown.
+    message: why the node is unsupported, transformed or dynamic.
+    '''
+    def __init__(self,
+                 node,  # type: onnx.NodeProto
+                 status,  # type: Text
+                 converter=None,  # type: Optional[Text]
+                 dynamic_layer=False,  # type: bool
+                 missing_shapes=None,  # type: Optional[List[Text]]
+                 message='',  # type: Text
+                 ):
+        # type: (...) -> None
+        self.name = node.name
+        self.op_type = node.op_type
+        self.outputs = list(node.output)
+        self.status = status
+        self.converter = converter
+        self.dynamic_layer = dynamic_layer
+        self.missing_shapes = missing_shapes if missing_shapes is not None else []
+        self.message = message
+
+    @property
+    def custom_layer(self):  # type: () -> bool
+        return self.status == CUSTOM_LAYER
+
+    def to_dict(self):  # type: () -> Dict[Text, Any]
+        return {
+            'name': self.name,
+            'op_type': self.op_type,
+            'outputs': self.outputs,
+            'status': self.status,
+            'converter': self.converter,
+            'custom_layer': self.custom_layer,
+            'dynamic_layer': self.dynamic_layer,
+            'missing_shapes': self.missing_shapes,
+            'message': self.message,
+        }
+
+
+class ModelAnalysis(object):
+    '''
+    Result of analyze(): one NodeAnalysis per node of the ONNX graph, in graph order.
+    '''
+    def __init__(self,
+                 nodes,  # type: List[NodeAnalysis]
+                 disable_coreml_rank5_mapping,  # type: bool
+                 ):
+        # type: (...) -> None
+        self.nodes = nodes
+        self.disable_coreml_rank5_mapping = disable_coreml_rank5_mapping
+
+    @property
+    def is_compatible(self):  # type: () -> bool
+        return len(self.unsupported_nodes) == 0
+
+    @property
+    def unsupported_nodes(self):  # type: () -> List[NodeAnalysis]
+        return [n for n in self.nodes if n.status == UNSUPPORTED]
+
+    @property
+    def unsupported_op_types(self):  # type: () -> List[Text]
+        op_types = []  # type: List[Text]
+        for n in self.unsupported_nodes:
+            if n.op_type not in op_types:
+                op_types.append(n.op_type)
+        return op_types
+
+    @property
+    def custom_layer_nodes(self):  # type: () -> List[NodeAnalysis]
+        return [n for n in self.nodes if n.custom_layer]
+
+    @property
+    def dynamic_layer_nodes(self):  # type: () -> List[NodeAnalysis]
+        return [n for n in self.nodes if n.dynamic_layer]
+
+    def to_dict(self):  # type: () -> Dict[Text, Any]
+        return {
+            'compatible': self.is_compatible,
+            'disable_coreml_rank5_mapping': self.disable_coreml_rank5_mapping,
+            'num_nodes': len(self.nodes),
+            'unsupported_op_types': self.unsupported_op_types,
+            'num_custom_layers': len(self.custom_layer_nodes),
+            'num_dynamic_layers': len(self.dynamic_layer_nodes),
+            'nodes': [n.to_dict() for n in self.nodes],
+        }
+
+    def summary(self):  # type: () -> Text
+        '''
+        Human readable table, one row per node.
+        '''
+        header = ('#', 'op type', 'name', 'status', 'converter', 'dynamic', 'inputs without shape')
+        rows = [header]
+        for i, n in enumerate(self.nodes):
+            rows.append((str(i + 1), n.op_type, n.name or n.outputs[0], n.status, n.converter or '-',
+                         'yes' if n.dynamic_layer else '', ', '.join(n.missing_shapes)))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        lines = ['  '.join(value.ljust(widths[i]) for i, value in enumerate(row)).rstrip() for row in rows]
+        lines.insert(1, '-' * len(lines[0]))
+        verdict = 'compatible' if self.is_compatible else \
+            'NOT compatible, unsupported ops: {}'.format(', '.join(self.unsupported_op_types))
+        lines.append('')
+        lines.append('{} nodes, {} custom layers, {} dynamic layers: {}'.format(
+            len(self.nodes), len(self.custom_layer_nodes), len(self.dynamic_layer_nodes), verdict))
+        return '\n'.join(lines)
+
+
+def _transformed_op_types(disable_coreml_rank5_mapping):  # type: (bool) -> Tuple[Set[Text], Set[Text]]
+    '''
+    Op types that never reach a layer converter, as declared by the graph transformations
+    applied by convert(): the ones always removed, and the ones folded into a constant
+    when all their inputs are constant.
+    '''
+    from .converter import _graph_transformers
+    from ._transformers import ImageScalerRemover
+    # ImageScalerRemover is applied last, once the preprocessing parameters have been read
+    transformers = _graph_transformers(disable_coreml_rank5_mapping, [], {}) + [ImageScalerRemover()]
+    removed = set()  # type: Set[Text]
+    folded = set()  # type: Set[Text]
+    for transformer in transformers:
+        removed.update(getattr(transformer, 'removed_op_types', ()))
+        folded.update(getattr(transformer, 'constant_folded_op_types', ()))
+    return removed, folded
+
+
+def _get_attribute(node, name):  # type: (onnx.NodeProto, Text) -> Any
+    for attribute in node.attribute:
+        if attribute.name == name:
+            return onnx.helper.get_attribute_value(attribute)
+    return None
+
+
+def _has_shape(value_info):  # type: (onnx.ValueInfoProto) -> bool
+    return value_info.type.HasField('tensor_type') and value_info.type.tensor_type.HasField('shape')
+
+
+def _live_nodes(graph):  # type: (onnx.GraphProto) -> Set[int]
+    '''
+    Indices of the nodes contributing to the graph outputs, the other ones are
+    removed by DeadCodeEliminator.
+    '''
+    needed = set(o.name for o in graph.output)
+    live = set()  # type: Set[int]
+    for i in reversed(range(len(graph.node))):
+        node = graph.node[i]
+        if any(o in needed for o in node.output):
+            live.add(i)
+            needed.update(node.input)
+    return live
+
+
+def analyze(model,  # type: Union[onnx.ModelProto, Text]
+            disable_coreml_rank5_mapping=False,  # type: bool
+            add_custom_layers=False,  # type: bool
+            custom_conversion_functions=None,  # type: Optional[Dict[Text, Any]]
+            infer_shapes=False,  # type: bool
+            ):
+    # type: (...) -> ModelAnalysis
+    '''
+    Report how each node of an ONNX model would be converted, without converting it.
+
+    Nodes are visited in graph order; initializers are only looked up by name and never
+    decoded, so this is cheap even for large models. The arguments have the same meaning
+    as in onnx_coreml.convert. If infer_shapes is True, ONNX shape inference is run first
+    (as convert() does), which gives a more accurate list of inputs without shapes.
+    '''
+    if isinstance(model, Text):
+        onnx_model = onnx.load(model, load_external_data=False)
+    elif isinstance(model, onnx.ModelProto):
+        onnx_model = model
+    else:
+        raise TypeError(
+            "Model must be file path to .onnx file or onnx loaded model"
+        )
+    if infer_shapes:
+        onnx_model = shape_inference.infer_shapes(onnx_model)
+    if custom_conversion_functions is None:
+        custom_conversion_functions = {}
+
+    from ._transformers import NoOpRemover
+    if disable_coreml_rank5_mapping:
+        from ._operators_nd import _ONNX_NODE_REGISTRY_ND as registry, \
+            _CONSTANT_INPUTS_ND as constant_inputs, _RUNTIME_PARAMETER_INPUTS_ND as runtime_inputs
+    else:
+        from ._operators import _ONNX_NODE_REGISTRY as registry, _CONSTANT_INPUTS as constant_inputs
+        runtime_inputs = {}
+    removed_ops, folded_ops = _transformed_op_types(disable_coreml_rank5_mapping)
+
+    graph = onnx_model.graph
+    constants = set(t.name for t in graph.initializer)  # type: Set[Text]
+    known_shapes = set(constants)
+    for value_info in list(graph.input) + list(graph.value_info) + list(graph.output):
+        if _has_shape(value_info):
+            known_shapes.add(value_info.name)
+
+    live = _live_nodes(graph)
+    nodes = []  # type: List[NodeAnalysis]
+    for index, node in enumerate(graph.node):
+        inputs = [i for i in node.input if i]
+        missing_shapes = [i for i in inputs if i not in known_shapes]
+        all_inputs_constant = all(i in constants for i in inputs)
+
+        if node.name in custom_conversion_functions or node.op_type in custom_conversion_functions:
+            key = node.name if node.name in custom_conversion_functions else node.op_type
+            fn = custom_conversion_functions[key]
+            nodes.append(NodeAnalysis(node, CUSTOM_FUNCTION, converter=getattr(fn, '__name__', str(fn)),
+                                      missing_shapes=missing_shapes))
+            continue
+
+        transformed = ''
+        if index not in live:
+            transformed = 'removed, does not contribute to the graph outputs'
+        elif node.op_type in removed_ops:
+            transformed = 'removed by the graph transformations'
+        elif node.op_type in folded_ops and len(inputs) > 0 and all_inputs_constant:
+            transformed = 'folded into a constant'
+        elif node.op_type == 'Shape' and inputs[0] in known_shapes:
+            transformed = 'folded into a constant'
+        elif (node.op_type == 'Cast' and _get_attribute(node, 'to') in NoOpRemover._FLOAT_TYPES) or \
+                (node.op_type in NoOpRemover._VARIADIC_OPS and len(inputs) == 1):
+            transformed = 'removed by the graph transformations'
+        if transformed:
+            if node.op_type in ('Constant', 'ConstantFill') or transformed == 'folded into a constant':
+                constants.update(node.output)
+                known_shapes.update(node.output)
+            nodes.append(NodeAnalysis(node, TRANSFORMED, missing_shapes=missing_shapes, message=transformed))
+            continue
+
+        if node.op_type not in registry:
+            if add_custom_layers:
+                nodes.append(NodeAnalysis(node, CUSTOM_LAYER, converter='_convert_custom',
+                                          missing_shapes=missing_shapes))
+            else:
+                nodes.append(NodeAnalysis(node, UNSUPPORTED, missing_shapes=missing_shapes,
+                                          message='no converter for op type {}'.format(node.op_type)))
+            continue
+
+        converter = registry[node.op_type].__name__
+        non_constant_inputs = [node.input[i] for i in constant_inputs.get(node.op_type, [])
+                               if i < len(node.input) and node.input[i] and node.input[i] not in constants]
+        if non_constant_inputs:
+            # missing initializers are an error, even when custom layers are allowed
+            message = 'inputs {} must be constants'.format(', '.join(non_constant_inputs))
+            nodes.append(NodeAnalysis(node, UNSUPPORTED, missing_shapes=missing_shapes, message=message))
+            continue
+        dynamic_inputs = [node.input[i] for i in runtime_inputs.get(node.op_type, [])
+                          if i < len(node.input) and node.input[i] and node.input[i] not in constants]
+        dynamic_layer = len(dynamic_inputs) > 0
+        message = 'runtime inputs: {}'.format(', '.join(dynamic_inputs)) if dynamic_layer else ''
+        nodes.append(NodeAnalysis(node, CONVERTED, converter=converter, dynamic_layer=dynamic_layer,
+                                  missing_shapes=missing_shapes, message=message))
+
+    return ModelAnalysis(nodes, disable_coreml_rank5_mapping)
@@ -6,13 +6,15 @@ from __future__ import unicode_literals
 from typing import Any, Text, Dict, Tuple
 from onnx import ModelProto
 from onnx.backend.base import Backend
-from onnx_coreml._backend_rep import CoreMLRep
-from onnx_coreml import convert
+from onnx_coreml import ConversionSession, analyze
 import onnx
 from ._graph import _input_from_onnx_input, EdgeInfo
 
 DEBUG = False
 
+# shared by all backend instances: conversions reuse the warm session and its cache
+_SESSION = ConversionSession()
+
 def _get_onnx_outputs_info(model): # type: (...) -> Dict[Text, EdgeInfo]
     """
     Takes in an onnx model and returns a dictionary 
@@ -45,9 +47,10 @@ class CoreMLBackend(Backend):
             with open('/tmp/node_model.onnx', 'wb') as f:
                 s = model.SerializeToString()
                 f.write(s)
-        coreml_model = convert(model, disable_coreml_rank5_mapping=disable_rank5_mapping)
+        coreml_model = _SESSION.convert(model, disable_coreml_rank5_mapping=disable_rank5_mapping)
         if DEBUG:
             coreml_model.save('/tmp/node_model.mlmodel')
+        from onnx_coreml._backend_rep import CoreMLRep
         onnx_outputs_info = _get_onnx_outputs_info(model)
         return CoreMLRep(coreml_model, onnx_outputs_info, device == 'CPU', disable_rank5_mapping=disable_rank5_mapping)
 
@@ -57,49 +60,13 @@ class CoreMLBackend(Backend):
                        device='CPU',  # type: Text
                        **kwargs  # type: Any
                        ):  # type: (...) -> bool
-         # Return whether the model is compatible with CoreML.
-         '''
-         This function will gradually grow to cover more cases. 
-         Need to be careful of false negatives. There are some cases that seemingly 
-         are not supported on CoreML, which the graph transformer optimizes and converts to 
-         a graph that can be converted to CoreML. 
-         
-         1. Check whether the layers for which CoreML expects constant weights are in
-            the list of initializers in the onnx graph
-         2. unsupported ops like "And", "Or" etc
-            
-         '''
-
-         node_set = set()
-         initializer_set = set()
-         graph = model.graph
-         for t in graph.initializer:
-             initializer_set.add(t.name)
-         for node in graph.node:
-             if node.op_type in ['ConvTranspose',
-                                 'Conv',
-                                 'BatchNormalization',
-                                 'InstanceNormalization',
-                                 'PRelu']:
-                if len(node.input) > 1 and node.input[1] not in initializer_set:
-                    return False
-             node_set.add(node.op_type)
-
-         # unsupported ops remove
-         for node in graph.node:
-             if node.op_type in ['Cast',
-                                 'And',
-                                 'Or',
-                                 'Xor',
-                                 'Not',
-                                 'Less',
-                                 'Greater',
-                                 'Equal',
-                                 'Ceil',
-                                 'Floor']:
-                 return False
-
-         return True
+        # Return whether the model is compatible with CoreML.
+        '''
+        Checks, without converting the model, that every node either has a layer converter
+        or is removed by the graph transformations, and that the layers for which CoreML
+        expects constant weights get them from initializers. See onnx_coreml.analyze.
+        '''
+        return analyze(model).is_compatible
 
     @classmethod
     def supports_device(cls,
@@ -123,9 +90,10 @@ class CoreMLBackendND(Backend):
             with open('/tmp/node_model.onnx', 'wb') as f:
                 s = model.SerializeToString()
                 f.write(s)
-        coreml_model = convert(model, disable_coreml_rank5_mapping=disable_rank5_mapping)
+        coreml_model = _SESSION.convert(model, disable_coreml_rank5_mapping=disable_rank5_mapping)
         if DEBUG:
             coreml_model.save('/tmp/node_model.mlmodel')
+        from onnx_coreml._backend_rep import CoreMLRep
         onnx_outputs_info = _get_onnx_outputs_info(model)
         return CoreMLRep(coreml_model, onnx_outputs_info, device == 'CPU', disable_rank5_mapping=disable_rank5_mapping)
 
@@ -137,21 +105,10 @@ class CoreMLBackendND(Backend):
                        ):  # type: (...) -> bool
         # Return whether the model is compatible with CoreML.
         '''
-        This function will gradually grow to cover more cases. 
-        Need to be careful of false negatives. There are some cases that seemingly 
-        are not supported on CoreML, which the graph transformer optimizes and converts to 
-        a graph that can be converted to CoreML. 
-        
-        2. Unsupported ops: If graph has one of unsupported op, exit
-           
+        Checks, without converting the model, that every node either has a layer converter
+        or is removed by the graph transformations. See onnx_coreml.analyze.
         '''
-        ## TODO: Add un-supported ops
-        unsupported_ops = []
-        graph = model.graph
-        for node in graph.node:
-            if node.op_type in unsupported_ops:
-                return False
-        return True
+        return analyze(model, disable_coreml_rank5_mapping=True).is_compatible
 
     @classmethod
     def supports_device(cls,
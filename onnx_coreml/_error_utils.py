@@ -2,10 +2,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from typing import Dict, Text, Any, Callable
-from coremltools.models.neural_network import NeuralNetworkBuilder  #type: ignore
+from typing import Dict, Text, Any, Callable, List, Optional, TYPE_CHECKING
 from ._graph import Node, Graph
 
+if TYPE_CHECKING:
+    from coremltools.models.neural_network import NeuralNetworkBuilder  #type: ignore
+
 class ErrorHandling(object):
   '''
   To handle errors and addition of custom layers
@@ -13,15 +15,18 @@ class ErrorHandling(object):
 
   def __init__(self,
                add_custom_layers = False, # type: bool
-               custom_conversion_functions = dict(), # type: Dict[Text, Any]
-               custom_layer_nodes = [], # type : List[Node]
-               disable_coreml_rank5_mapping = False
+               custom_conversion_functions = None, # type: Optional[Dict[Text, Any]]
+               custom_layer_nodes = None, # type: Optional[List[Node]]
+               disable_coreml_rank5_mapping = False,
+               minimum_ios_deployment_target = '13' # type: Text
                ):
       # type: (...) -> None
       self.add_custom_layers = add_custom_layers
-      self.custom_conversion_functions = custom_conversion_functions
-      self.custom_layer_nodes = custom_layer_nodes
+      self.custom_conversion_functions = custom_conversion_functions if custom_conversion_functions is not None else {}
+      self.custom_layer_nodes = custom_layer_nodes if custom_layer_nodes is not None else []
       self.disable_coreml_rank5_mapping = disable_coreml_rank5_mapping
+      # layer converters only add the layers available on this iOS version
+      self.minimum_ios_deployment_target = minimum_ios_deployment_target
       # TODO: Remove following error message once, disable_coreml_rank5_mapping is default to True
       self.coreml_3_rerun_message = ''
       if not disable_coreml_rank5_mapping:
@@ -0,0 +1,340 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from typing import Text, Dict, List, Any, Sequence, Optional, Union
+
+import numpy as np
+import onnx
+
+from ._graph import Graph, Node
+
+
+# CoreML neural network activations are float32
+_BYTES_PER_ELEMENT = 4
+
+# ops whose output can be much larger than their inputs, by materializing a broadcast or a fill
+_EXPANDING_OPS = {'ConstantOfShape', 'Expand', 'Resize', 'Tile', 'Upsample'}
+
+
+def _blob_bytes(graph, name):  # type: (Graph, Text) -> int
+    '''
+    Estimated size in bytes of a data blob, from graph.shape_dict. Unknown shapes count as 0,
+    unknown dimensions (<= 0) as 1.
+    '''
+    if name not in graph.shape_dict:
+        return 0
+    size = 1
+    for dim in graph.shape_dict[name]:
+        size *= max(int(dim), 1)
+    return size * _BYTES_PER_ELEMENT
+
+
+def _output_bytes(graph, node, output):  # type: (Graph, Node, Text) -> int
+    if output not in graph.shape_dict and node.op_type == 'ConstantOfShape' and \
+            node.inputs[0] in node.input_tensors:
+        # filled by a constant layer whose shape is known, see _convert_constant_of_shape
+        return int(np.prod(node.input_tensors[node.inputs[0]])) * _BYTES_PER_ELEMENT
+    return _blob_bytes(graph, output)
+
+
+def _data_inputs(node):  # type: (Node) -> List[Text]
+    '''
+    Inputs of a node that are activations, i.e. not constants (weights are not counted).
+    '''
+    return [i for i in node.inputs if i != '' and i not in node.input_tensors]
+
+
+def _is_topological(graph, nodes):  # type: (Graph, Sequence[Node]) -> bool
+    produced = set(output for node in nodes for output in node.outputs)
+    available = set(input_[0] for input_ in graph.inputs)
+    for node in nodes:
+        for input_ in _data_inputs(node):
+            if input_ in produced and input_ not in available:
+                return False
+        available.update(node.outputs)
+    return True
+
+
+def estimate_peak_memory(graph, nodes=None):  # type: (Graph, Any) -> int
+    '''
+    Estimated peak of the bytes of the activations that are alive at the same time when the
+    nodes are run in the given order (graph.nodes by default). A blob is alive from the
+    node producing it (or the start, for the model inputs) to its last consumer
+    (or the end, for the model outputs).
+    '''
+    nodes = graph.nodes if nodes is None else nodes
+    graph_outputs = set(output[0] for output in graph.outputs)
+    last_use = {}  # type: Dict[Text, int]
+    for i, node in enumerate(nodes):
+        for input_ in _data_inputs(node):
+            last_use[input_] = i
+    live = set(input_[0] for input_ in graph.inputs)
+    live_bytes = sum(_blob_bytes(graph, name) for name in live)
+    peak = live_bytes
+    for i, node in enumerate(nodes):
+        for output in node.outputs:
+            if output not in live:
+                live.add(output)
+                live_bytes += _blob_bytes(graph, output)
+        peak = max(peak, live_bytes)
+        for name in set(_data_inputs(node)) | set(node.outputs):
+            if name in live and name not in graph_outputs and last_use.get(name, -1) <= i:
+                live.remove(name)
+                live_bytes -= _blob_bytes(graph, name)
+    return peak
+
+
+class MemoryAwareScheduler(object):
+    '''
+    Reorders the nodes in a topological order that keeps the estimated peak activation
+    memory low, since CoreML allocates the layer outputs following the order of the layers.
+    Nodes are scheduled greedily: among the nodes whose inputs are available, the one that
+    allocates the fewest bytes net of the bytes it frees (inputs it is the last consumer of)
+    is picked, ties going to the original order. The original order is kept if it is
+    topological and the new one does not lower the estimated peak.
+    '''
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = self._schedule(graph)
+        before = estimate_peak_memory(graph) if _is_topological(graph, graph.nodes) else None
+        after = estimate_peak_memory(graph, nodes)
+        if before is not None and after >= before:
+            return graph
+        if before is None:
+            print('MemoryAwareScheduler: nodes sorted topologically, estimated peak activation memory {} bytes'
+                  .format(after))
+        else:
+            print('MemoryAwareScheduler: estimated peak activation memory {} bytes before, {} bytes after'
+                  .format(before, after))
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    @staticmethod
+    def _schedule(graph):  # type: (Graph) -> List[Node]
+        graph_outputs = set(output[0] for output in graph.outputs)
+        producers = {}  # type: Dict[Text, int]
+        for index, node in enumerate(graph.nodes):
+            for output in node.outputs:
+                producers[output] = index
+        consumers = {}  # type: Dict[Text, List[int]]
+        # number of inputs of each node that are produced by a node not scheduled yet
+        missing_inputs = [0] * len(graph.nodes)
+        for index, node in enumerate(graph.nodes):
+            for input_ in set(_data_inputs(node)):
+                consumers.setdefault(input_, []).append(index)
+                if input_ in producers:
+                    missing_inputs[index] += 1
+        # number of nodes still to be scheduled that read each blob
+        pending_uses = dict((name, len(indices)) for name, indices in consumers.items())
+
+        def net_bytes(index):  # type: (int) -> int
+            node = graph.nodes[index]
+            allocated = sum(_blob_bytes(graph, o) for o in node.outputs)
+            freed = sum(_blob_bytes(graph, i) for i in set(_data_inputs(node))
+                        if pending_uses[i] == 1 and i not in graph_outputs)
+            return allocated - freed
+
+        ready = [index for index, count in enumerate(missing_inputs) if count == 0]
+        scheduled = []  # type: List[int]
+        while len(ready) > 0:
+            # ties go to the node coming first in the original order
+            index = min(ready, key=lambda i: (net_bytes(i), i))
+            ready.remove(index)
+            scheduled.append(index)
+            node = graph.nodes[index]
+            for input_ in set(_data_inputs(node)):
+                pending_uses[input_] -= 1
+            for output in node.outputs:
+                for consumer in consumers.get(output, []):
+                    missing_inputs[consumer] -= 1
+                    if missing_inputs[consumer] == 0:
+                        ready.append(consumer)
+        # nodes in a cycle keep their original order, after the others
+        done = set(scheduled)
+        scheduled.extend(index for index in range(len(graph.nodes)) if index not in done)
+        return [graph.nodes[index] for index in scheduled]
+
+
+class BlobMemory(object):
+    '''
+    Size and live range of a data blob: it is alive from the layer producing it (first_layer,
+    -1 for the model inputs) to the last layer reading it (last_layer, the number of layers
+    for the model outputs).
+    '''
+    def __init__(self, name, size, first_layer, last_layer):  # type: (Text, int, int, int) -> None
+        self.name = name
+        self.size = size
+        self.first_layer = first_layer
+        self.last_layer = last_layer
+
+    def to_dict(self):  # type: () -> Dict[Text, Any]
+        return {
+            'name': self.name,
+            'bytes': self.size,
+            'first_layer': self.first_layer,
+            'last_layer': self.last_layer,
+        }
+
+
+class LayerMemory(object):
+    '''
+    Activation memory while running a single layer.
+
+    output_bytes: bytes of the blobs the layer produces.
+    live_bytes: bytes of all the blobs alive while the layer runs (its inputs, its outputs
+        and the blobs kept for later layers).
+    live_blobs: names of these blobs.
+    large_intermediate: True for ops such as Expand, Tile, Upsample or ConstantOfShape
+        producing more bytes than they read.
+    '''
+    def __init__(self,
+                 node,  # type: Node
+                 output_bytes,  # type: int
+                 live_blobs,  # type: List[Text]
+                 live_bytes,  # type: int
+                 large_intermediate,  # type: bool
+                 ):
+        # type: (...) -> None
+        self.name = node.name
+        self.op_type = node.op_type
+        self.outputs = list(node.outputs)
+        self.output_bytes = output_bytes
+        self.live_blobs = live_blobs
+        self.live_bytes = live_bytes
+        self.large_intermediate = large_intermediate
+
+    def to_dict(self):  # type: () -> Dict[Text, Any]
+        return {
+            'name': self.name,
+            'op_type': self.op_type,
+            'outputs': self.outputs,
+            'output_bytes': self.output_bytes,
+            'live_bytes': self.live_bytes,
+            'live_blobs': self.live_blobs,
+            'large_intermediate': self.large_intermediate,
+        }
+
+
+class MemoryReport(object):
+    '''
+    Result of memory_report() and analyze_memory(): one LayerMemory per layer, in the order
+    the layers are added to the CoreML model, and one BlobMemory per data blob.
+    Weights and other constants folded into the layers are not counted.
+    '''
+    def __init__(self, layers, blobs):  # type: (List[LayerMemory], List[BlobMemory]) -> None
+        self.layers = layers
+        self.blobs = blobs
+
+    @property
+    def peak_bytes(self):  # type: () -> int
+        return max([layer.live_bytes for layer in self.layers] + [0])
+
+    @property
+    def peak_layer(self):  # type: () -> Optional[LayerMemory]
+        if len(self.layers) == 0:
+            return None
+        return max(self.layers, key=lambda layer: layer.live_bytes)
+
+    @property
+    def large_intermediate_layers(self):  # type: () -> List[LayerMemory]
+        return [layer for layer in self.layers if layer.large_intermediate]
+
+    def to_dict(self):  # type: () -> Dict[Text, Any]
+        peak_layer = self.peak_layer
+        return {
+            'peak_bytes': self.peak_bytes,
+            'peak_layer': peak_layer.name if peak_layer is not None else None,
+            'large_intermediate_layers': [layer.name for layer in self.large_intermediate_layers],
+            'layers': [layer.to_dict() for layer in self.layers],
+            'blobs': [blob.to_dict() for blob in self.blobs],
+        }
+
+    def summary(self):  # type: () -> Text
+        '''
+        Human readable table, one row per layer.
+        '''
+        header = ('#', 'op type', 'name', 'output bytes', 'live bytes', 'live blobs', '')
+        rows = [header]
+        for i, layer in enumerate(self.layers):
+            rows.append((str(i + 1), layer.op_type, layer.name, str(layer.output_bytes), str(layer.live_bytes),
+                         str(len(layer.live_blobs)), 'large intermediate' if layer.large_intermediate else ''))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        lines = ['  '.join(value.ljust(widths[i]) for i, value in enumerate(row)).rstrip() for row in rows]
+        lines.insert(1, '-' * len(lines[0]))
+        lines.append('')
+        peak_layer = self.peak_layer
+        lines.append('{} layers, peak activation memory {} bytes{}, {} large intermediates'.format(
+            len(self.layers), self.peak_bytes, ' at ' + peak_layer.name if peak_layer is not None else '',
+            len(self.large_intermediate_layers)))
+        return '\n'.join(lines)
+
+
+def memory_report(graph):  # type: (Graph) -> MemoryReport
+    '''
+    Sizes and live ranges of the activations when the layers are run in the order of graph.nodes.
+    '''
+    graph_outputs = set(output[0] for output in graph.outputs)
+    num_layers = len(graph.nodes)
+    sizes = {}  # type: Dict[Text, int]
+    first_layer = {}  # type: Dict[Text, int]
+    last_layer = {}  # type: Dict[Text, int]
+    for input_ in graph.inputs:
+        sizes[input_[0]] = _blob_bytes(graph, input_[0])
+        first_layer[input_[0]] = -1
+        last_layer[input_[0]] = -1
+    for i, node in enumerate(graph.nodes):
+        for input_ in _data_inputs(node):
+            if input_ not in first_layer:
+                # produced by a later layer (the order is not topological) or not at all
+                sizes[input_] = _blob_bytes(graph, input_)
+                first_layer[input_] = -1
+            last_layer[input_] = i
+        for output in node.outputs:
+            if output != '':
+                sizes[output] = _output_bytes(graph, node, output)
+                first_layer.setdefault(output, i)
+                last_layer[output] = max(last_layer.get(output, i), i)
+    for name in graph_outputs:
+        if name in last_layer:
+            last_layer[name] = num_layers
+
+    blobs = [BlobMemory(name, sizes[name], first_layer[name], last_layer[name]) for name in first_layer]
+    starting = {}  # type: Dict[int, List[BlobMemory]]
+    for blob in blobs:
+        starting.setdefault(max(blob.first_layer, 0), []).append(blob)
+    live = []  # type: List[BlobMemory]
+    layers = []  # type: List[LayerMemory]
+    for i, node in enumerate(graph.nodes):
+        live = [blob for blob in live + starting.get(i, []) if blob.last_layer >= i]
+        output_bytes = sum(sizes[o] for o in node.outputs if o != '')
+        input_bytes = sum(sizes[input_] for input_ in set(_data_inputs(node)))
+        layers.append(LayerMemory(node, output_bytes, [blob.name for blob in live], sum(blob.size for blob in live),
+                                  node.op_type in _EXPANDING_OPS and output_bytes > input_bytes))
+    return MemoryReport(layers, blobs)
+
+
+def analyze_memory(model,  # type: Union[onnx.ModelProto, Text]
+                   disable_coreml_rank5_mapping=False,  # type: bool
+                   image_input_names=(),  # type: Sequence[Text]
+                   preprocessing_args=None,  # type: Optional[Dict[Text, Any]]
+                   ):
+    # type: (...) -> MemoryReport
+    '''
+    Report the activation memory of the CoreML model that onnx_coreml.convert would produce
+    with the same arguments, without converting it: the graph transformations and the layer
+    scheduling of convert() are applied, then memory_report() is computed on the result.
+    '''
+    # the converter imports this module
+    from .converter import _prepare_graph_for_conversion
+
+    if isinstance(model, Text):
+        onnx_model = onnx.load(model)
+    elif isinstance(model, onnx.ModelProto):
+        onnx_model = model
+    else:
+        raise TypeError(
+            "Model must be file path to .onnx file or onnx loaded model"
+        )
+    graph = _prepare_graph_for_conversion(onnx_model, disable_coreml_rank5_mapping, list(image_input_names),
+                                          dict(preprocessing_args or {}))
+    return memory_report(graph)
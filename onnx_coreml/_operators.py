@@ -6,12 +6,14 @@ from __future__ import unicode_literals
 import numpy as np
 import copy
 
-from typing import Sequence, Callable, List, Tuple, Optional, Text, Any
-from coremltools.models.neural_network import NeuralNetworkBuilder  #type: ignore
+from typing import Sequence, Callable, List, Tuple, Optional, Text, Any, Dict, TYPE_CHECKING
 from ._graph import Node, Graph
-from coremltools.proto import NeuralNetwork_pb2 #type: ignore
 from ._error_utils import ErrorHandling
 
+if TYPE_CHECKING:
+    # coremltools is only imported once layers are actually added, see converter.py
+    from coremltools.models.neural_network import NeuralNetworkBuilder  #type: ignore
+
 INT_MAX = 2**30
 
 '''
@@ -36,6 +38,63 @@ def _update_shape_mapping_unchanged(node, graph, err): # type: (Node, Graph, Err
         graph.onnx_coreml_shape_mapping[node.outputs[0]] = graph.onnx_coreml_shape_mapping[node.inputs[0]]
 
 
+def _have_same_shape(node, graph, input_names): # type: (Node, Graph, Sequence[Text]) -> bool
+    '''
+    Returns True if the shapes of all the inputs are known and equal.
+    Unknown dimensions are recorded as 0 in graph.shape_dict, and may broadcast at runtime.
+    '''
+    shapes = set()
+    for input_ in input_names:
+        if input_ in node.input_tensors:
+            shapes.add(tuple(node.input_tensors[input_].shape))
+        elif input_ in graph.shape_dict:
+            shapes.add(tuple(graph.shape_dict[input_]))
+        else:
+            return False
+    return len(shapes) == 1 and all(d > 0 for d in list(shapes)[0])
+
+
+def _add_balanced_tree(add_binary_op, input_names, output_name, name): # type: (Callable[[Text, List[Text], Text], None], Sequence[Text], Text, Text) -> None
+    '''
+    Reduces N inputs with N-1 layers of a binary op, add_binary_op(name, input_names, output_name),
+    arranged as a balanced tree: both halves of the inputs are reduced one after the
+    other, so that the depth and the number of live intermediate outputs are logarithmic in N.
+    The last layer is called `name` and writes `output_name`.
+    '''
+    counter = [0]
+
+    def _reduce(names, out, layer_name):  # type: (Sequence[Text], Text, Text) -> None
+        halves = []
+        for half in (names[:(len(names) + 1) // 2], names[(len(names) + 1) // 2:]):
+            if len(half) == 1:
+                halves.append(half[0])
+            else:
+                suffix = '_' + str(counter[0])
+                counter[0] += 1
+                _reduce(half, output_name + suffix, name + suffix)
+                halves.append(output_name + suffix)
+        add_binary_op(layer_name, halves, out)
+
+    _reduce(list(input_names), output_name, name)
+
+
+def _get_channel_constant(node, graph): # type: (Node, Graph) -> Any
+    '''
+    Returns the second input of a binary op, flattened, if it is a constant varying only
+    along the axis of the first input mapped to the CoreML channel axis, None otherwise.
+    '''
+    if len(node.inputs) != 2 or node.inputs[1] not in node.input_tensors or \
+            not _is_input_shape_mapping_defined(node, graph):
+        return None
+    constant = node.input_tensors[node.inputs[1]]
+    mapp = graph.onnx_coreml_shape_mapping[node.inputs[0]]
+    axes = [i for i, d in enumerate(constant.shape) if d != 1]
+    # the constant is broadcast along the last axes of the input
+    if len(axes) != 1 or len(constant.shape) > len(mapp) or mapp[len(mapp) - len(constant.shape) + axes[0]] != 2:
+        return None
+    return constant.flatten()
+
+
 def _convert_broadcast_op(builder, node, graph, err, mode): # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling, Text) -> None
     if node.op_type == 'Max' or node.op_type == 'Min' or node.op_type == 'Mean':
         if len(node.inputs) == 1:
@@ -59,6 +118,22 @@ def _convert_broadcast_op(builder, node, graph, err, mode): # type: (NeuralNetwo
             output_name=node.outputs[0],
             mode=mode
         )
+    elif len(inputs) > 2 and not _have_same_shape(node, graph, inputs):
+        # with more than two inputs, the elementwise layers do not broadcast
+        def _add_binary_op(name, input_names, output_name):  # type: (Text, List[Text], Text) -> None
+            builder.add_elementwise(name=name, input_names=input_names, output_name=output_name,
+                                    mode='ADD' if mode == 'AVE' else mode)
+        if mode == 'AVE':
+            _add_balanced_tree(_add_binary_op, inputs, node.outputs[0] + '_sum', node.name + '_sum')
+            builder.add_elementwise(
+                name=node.name,
+                input_names=[node.outputs[0] + '_sum'],
+                output_name=node.outputs[0],
+                mode='MULTIPLY',
+                alpha=1.0 / len(inputs)
+            )
+        else:
+            _add_balanced_tree(_add_binary_op, inputs, node.outputs[0], node.name)
     else:
         builder.add_elementwise(
             name=node.name,
@@ -278,6 +353,17 @@ def _convert_add(builder, node, graph, err):  # type: (NeuralNetworkBuilder, Nod
 def _convert_sub(builder, node, graph, err):  # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling) -> None
     _convert_broadcast_op(builder, node, graph, err, "ADD")
 
+def _convert_affine(builder, node, graph, err):  # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling) -> None
+    # y = alpha * x + beta, also produced by AffineFuser for scalar Add/Sub/Mul/Div
+    builder.add_activation(
+        name=node.name,
+        non_linearity='LINEAR',
+        input_name=node.inputs[0],
+        output_name=node.outputs[0],
+        params=[node.attrs.get('alpha', 1.0), node.attrs.get('beta', 0.0)]
+    )
+    _update_shape_mapping_unchanged(node, graph, err)
+
 
 def _get_conv_params(builder, node, graph, err, params_dict, axis=None):
     if 'dilations' not in node.attrs:
@@ -799,6 +885,19 @@ def _convert_instancenorm(builder, node, graph, err):  # type: (NeuralNetworkBui
     _update_shape_mapping_unchanged(node, graph, err)
 
 def _convert_mul(builder, node, graph, err):  # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling) -> None
+
+    # check if its equivalent to a scale layer
+    scale = _get_channel_constant(node, graph)
+    if scale is not None:
+        builder.add_scale(name=node.name,
+                          W=scale,
+                          b=None,
+                          has_bias=False,
+                          input_name=node.inputs[0],
+                          output_name=node.outputs[0],
+                          shape_scale=[scale.shape[0]])
+        _update_shape_mapping_unchanged(node, graph, err)
+        return
     _convert_broadcast_op(builder, node, graph, err, "MULTIPLY")
 
 def _convert_mean(builder, node, graph, err):  # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling) -> None
@@ -1133,34 +1232,69 @@ def _convert_gemm(builder, node, graph, err):  # type: (NeuralNetworkBuilder, No
     operation:  alpha * (A * B) + beta * C
     so far the case only handled is :
     - B is a constant matrix
-    - C is a constant vector
-    - alpha == beta == 1.0
-    - transA is off
+    - C is a constant vector (or scalar)
+    alpha and beta are folded into the weights and the bias of the inner_product layer.
+    With transA, the input is permuted so that the rows of A' are along the sequence axis
+    and its columns along the channel axis. A Gemm with only constant inputs is folded into a constant.
     '''
-
-    if node.attrs.get("transA",0) != 0:
-        return err.unsupported_op_configuration(builder, node, graph, "This Gemm layer cannot be converted to CoreML inner_product layer")
-
-    if abs(node.attrs.get('alpha',1.0)-1.0) > 1e-3 or abs(node.attrs.get('beta',1.0)-1.0) > 1e-3:
-        return err.unsupported_op_configuration(builder, node, graph, "This Gemm layer cannot be converted to CoreML inner_product layer")
+    alpha = node.attrs.get('alpha', 1.0)
+    beta = node.attrs.get('beta', 1.0)
+    transA = node.attrs.get("transA", 0) != 0
 
     weight_name = node.inputs[1]
     if weight_name in node.input_tensors:
-        W = node.input_tensors[weight_name]
+        W = alpha * node.input_tensors[weight_name]
         if not node.attrs.get("transB",0):
             W = np.transpose(W)
     else:
         err.missing_initializer(node, "Second input to Gemm layer must be a constant")
 
     b = None
-    if len(node.inputs) > 2:
-        b = (node.input_tensors[node.inputs[2]]).flatten()
+    if len(node.inputs) > 2 and node.inputs[2] != '' and beta != 0:
+        b = beta * (node.input_tensors[node.inputs[2]]).flatten()
+        if b.shape[0] == 1:
+            b = np.full((W.shape[0],), b[0])
     if len(W.shape) != 2 or (b is not None and len(b.shape) != 1):
         return err.unsupported_op_configuration(builder, node, graph, "This Gemm layer cannot be converted to CoreML inner_product layer")
 
     if b is not None:
         if W.shape[0] != b.shape[0]:
             return err.unsupported_op_configuration(builder, node, graph, "This Gemm layer cannot be converted to CoreML inner_product layer")
+        b = b.astype(np.float32)
+    W = W.astype(np.float32)
+
+    if node.inputs[0] in node.input_tensors:
+        A = node.input_tensors[node.inputs[0]]
+        if transA:
+            A = np.transpose(A)
+        Y = np.dot(A, np.transpose(W)) + (b if b is not None else 0)
+        builder.add_load_constant(name=node.name,
+                                  output_name=node.outputs[0],
+                                  constant_value=Y.flatten().astype(np.float32),
+                                  shape=[1, Y.shape[0], Y.shape[1]])
+        graph.onnx_coreml_shape_mapping[node.outputs[0]] = [3, 4] # [H,W]
+        return
+
+    if transA:
+        mapp = graph.onnx_coreml_shape_mapping.get(node.inputs[0], None)
+        # CoreML axes (S, C, H, W) in the order used by permute, the batch axis cannot be permuted
+        permute_axes = {0: 0, 2: 1, 3: 2, 4: 3}
+        if mapp is None or len(mapp) != 2 or any(axis not in permute_axes for axis in mapp):
+            # the batch axis cannot be transposed: the rows of A must not be mapped to it
+            return err.unsupported_op_configuration(builder, node, graph,
+                                                    "CoreML incompatible axis placement for Gemm with transA "
+                                                    "(the input can be mapped to [S,C] with onnx_coreml_input_shape_map)")
+        # A is (K, M): M goes to the sequence axis and K to the channel axis
+        rows, columns = permute_axes[mapp[1]], permute_axes[mapp[0]]
+        dims = (rows, columns) + tuple(sorted(set(range(4)) - {rows, columns}))
+        transposed = graph.get_unique_edge_name(node.name + '_transpose_A')
+        builder.add_permute(name=node.name + '_transpose_A',
+                            dim=dims,
+                            input_name=node.inputs[0],
+                            output_name=transposed)
+        _add_inner_product([transposed], node.outputs, W=W, b=b, node=node, builder=builder)
+        graph.onnx_coreml_shape_mapping[node.outputs[0]] = [0, 2] # [S,C]
+        return
 
     if node.inputs[0] in graph.onnx_coreml_shape_mapping:
         mapp = graph.onnx_coreml_shape_mapping[node.inputs[0]]
@@ -1193,20 +1327,25 @@ def _convert_matmul(builder, node, graph, err):  # type: (NeuralNetworkBuilder,
 
     W = np.transpose(W)
 
+    # bias fused by MatMulAddFuser
+    b = None
+    if len(node.inputs) > 2:
+        b = (node.input_tensors[node.inputs[2]]).flatten()
+
     if node.inputs[0] in graph.onnx_coreml_shape_mapping:
         mapp = graph.onnx_coreml_shape_mapping[node.inputs[0]]
         if mapp == [1,2] or mapp == [0,2]: #[B,C] or [S,C]
-            _add_inner_product([node.inputs[0]], node.outputs, W=W, b=None, node=node, builder=builder)
+            _add_inner_product([node.inputs[0]], node.outputs, W=W, b=b, node=node, builder=builder)
         elif mapp == [3,4]: #[H,W]
-            _add_transpose_before_after(_add_inner_product, [node.inputs[0]], node.outputs, [2,3,0,1],W=W, b=None, node=node, builder=builder)
+            _add_transpose_before_after(_add_inner_product, [node.inputs[0]], node.outputs, [2,3,0,1],W=W, b=b, node=node, builder=builder)
         elif mapp == [2,3]: #(C,H)
-            _add_transpose_before_after(_add_inner_product, [node.inputs[0]], node.outputs, [1,2,0,3],W=W, b=None, node=node, builder=builder)
+            _add_transpose_before_after(_add_inner_product, [node.inputs[0]], node.outputs, [1,2,0,3],W=W, b=b, node=node, builder=builder)
         elif mapp == [2,4]: #(C,W)
-            _add_transpose_before_after(_add_inner_product, [node.inputs[0]], node.outputs, [1,3,2,0], W=W, b=None, node=node, builder=builder)
+            _add_transpose_before_after(_add_inner_product, [node.inputs[0]], node.outputs, [1,3,2,0], W=W, b=b, node=node, builder=builder)
         else:
             return err.unsupported_op_configuration(builder, node, graph, "CoreML incompatible axis placement")
     else:
-        _add_inner_product([node.inputs[0]], node.outputs , W=W, b=None, node=node, builder=builder)
+        _add_inner_product([node.inputs[0]], node.outputs , W=W, b=b, node=node, builder=builder)
 
     if node.inputs[0] in graph.onnx_coreml_shape_mapping:
         graph.onnx_coreml_shape_mapping[node.outputs[0]] = graph.onnx_coreml_shape_mapping[node.inputs[0]]
@@ -1769,6 +1908,7 @@ def _convert_lstm(builder, node, graph, err):  # type: (NeuralNetworkBuilder, No
 
 
 def _convert_custom(builder, node, graph, err): # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling) -> None
+    from coremltools.proto import NeuralNetwork_pb2 #type: ignore
     params = NeuralNetwork_pb2.CustomLayerParams()
     params.className = node.op_type
     params.description = "Custom layer that corresponds to the ONNX op {}".format(node.op_type,)
@@ -1894,6 +2034,7 @@ def _convert_const(builder, node, graph, err): # type: (NeuralNetworkBuilder, No
 _ONNX_NODE_REGISTRY = {
     "Abs": _convert_abs,
     "Add": _convert_add,
+    "Affine": _convert_affine,
     "ArgMax": _convert_argmax,
     "ArgMin": _convert_argmax,
     "AveragePool": _convert_pool,
@@ -1963,6 +2104,18 @@ _ONNX_NODE_REGISTRY = {
 
 _SEQUENCE_LAYERS_REGISTRY = set(["LSTM"])
 
+# inputs whose value is read from node.input_tensors by the converter, i.e. must be constants
+_CONSTANT_INPUTS = {
+    "BatchNormalization": [1, 2, 3, 4],
+    "Conv": [1, 2],
+    "ConvTranspose": [1, 2],
+    "Gemm": [1, 2],
+    "InstanceNormalization": [1, 2],
+    "MatMul": [1],
+    "PRelu": [1],
+    "Reshape": [1],
+}  # type: Dict[Text, List[int]]
+
 _CONST_INPUT_ALLOWED_LAYERS = set([ "Add", "Sum", "Mul", "Concat", "Max", "Min", "Div", "Reciprocal"])
 
 def _get_node_converter_fn(builder, node, err):  # type: (NeuralNetworkBuilder, Node, ErrorHandling) -> Callable[[NeuralNetworkBuilder, Node, Graph, ErrorHandling], None]
@@ -1984,6 +2137,9 @@ def _get_node_converter_fn(builder, node, err):  # type: (NeuralNetworkBuilder,
         return err.unsupported_op(node)
 
 def _add_const_inputs_if_required(builder, node, graph, err):  # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling) -> None
+    if node.op_type in ('Add', 'Mul') and _get_channel_constant(node, graph) is not None:
+        # stored as the parameters of a bias or scale layer
+        return
     if node.op_type in _CONST_INPUT_ALLOWED_LAYERS:
         if len(node.input_tensors) > 0:
             _convert_const(builder, node, graph, err)
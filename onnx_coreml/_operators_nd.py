@@ -6,23 +6,28 @@ from __future__ import unicode_literals
 import numpy as np
 import copy
 
-from typing import Sequence, Callable, List, Tuple, Optional, Text, Any
-from coremltools.models.neural_network import NeuralNetworkBuilder  #type: ignore
+from typing import Sequence, Callable, List, Tuple, Optional, Text, Any, Dict, TYPE_CHECKING
 from onnx import TensorProto
 from ._graph import Node, Graph
-from coremltools.proto import NeuralNetwork_pb2 #type: ignore
 from ._error_utils import ErrorHandling
 
+if TYPE_CHECKING:
+    # coremltools is only imported once layers are actually added, see converter.py
+    from coremltools.models.neural_network import NeuralNetworkBuilder  #type: ignore
+
 from ._operators import _convert_abs, _convert_relu, _convert_sqrt, _convert_exp, \
                         _convert_elu, _convert_selu, _convert_sigmoid, _convert_sign, \
                         _convert_prelu, _convert_upsample, _convert_softsign, _convert_softplus, \
                         _convert_log, _convert_neg, _convert_reciprocal, _convert_hardsigmoid, \
                         _convert_reorganize_data, _add_pool, _get_pool_params, _add_conv, _get_conv_params, \
-                        _convert_thresholdedrelu, _convert_leaky_relu, _convert_lrn
+                        _convert_thresholdedrelu, _convert_leaky_relu, _convert_lrn, _convert_affine
 
 from ._operators import _convert_pad as _convert_pad_5d
+from ._operators import _have_same_shape, _add_balanced_tree
 
 INT_MAX = 2**30
+# specification version of the layers added in CoreML 4
+_SPECIFICATION_VERSION_IOS_14 = 5
 
 ## Helper functions
 def load_input_constants(builder, node, graph, err):
@@ -72,13 +77,14 @@ def _add_conv_like_op(add_func, get_params_func, params_dict,
     else:
         return err.unsupported_op_configuration(builder, node, graph, "provided number axes {} not supported".format(rank))
     
-def add_broadcastable_op_chain(builder, node, err, add_op_function):
+def add_broadcastable_op_chain(builder, node, err, add_op_function, graph=None, mode=None):
     '''
-    Splits list of input into chain of operator with two inputs
-    where output of first node is fed into next one until the final input
-    is processed
+    Splits list of input into operators with two inputs, arranged as a balanced tree
+    (see _add_balanced_tree). If `mode` is given and all the inputs have the same shape,
+    a single elementwise layer with all the inputs is added instead.
     Pass node:            Node to be converted
          add_op_function: Conversion function to be used
+         graph, mode:     Graph with the input shapes and elementwise layer mode (ADD, MULTIPLY, MAX, MIN)
     '''
     total_nodes = len(node.inputs)
     
@@ -97,29 +103,17 @@ def add_broadcastable_op_chain(builder, node, err, add_op_function):
             input_names=node.inputs,
             output_name=node.outputs[0]
         )
-    else:
-        decorator = 0
-        out_name = node.outputs[0]
-        # Add broadcastable layer for first two inputs
-        add_op_function(
+    elif mode is not None and graph is not None and _have_same_shape(node, graph, node.inputs):
+        builder.add_elementwise(
             name=node.name,
-            input_names=[node.inputs[0], node.inputs[1]],
-            output_name=out_name+'_'+str(decorator)
-        )
-        # Continue chain of broadcastable layers
-        for i in range(2, total_nodes-1):
-            add_op_function(
-                name=node.name,
-                input_names=[out_name+'_'+str(decorator), node.inputs[i]],
-                output_name=out_name+'_'+str(decorator+1)
-            )
-            decorator += 1
-        # End chain of broadcastable layers with final output
-        add_op_function(
-            name=node.name+'_'+str(decorator),
-            input_names=[out_name+'_'+str(decorator), node.inputs[total_nodes-1]],
-            output_name=out_name
+            input_names=node.inputs,
+            output_name=node.outputs[0],
+            mode=mode
         )
+    else:
+        _add_balanced_tree(lambda name, input_names, output_name: add_op_function(
+                               name=name, input_names=input_names, output_name=output_name),
+                           node.inputs, node.outputs[0], node.name)
 
 def add_bn_with_expansion(builder, node, err, node_name, channels, scale, bias, mean, var, input_name, output_name,
                           epsilon, compute_mean_var=False, instance_normalization=False, axes_for_expansion=[]):
@@ -209,7 +203,7 @@ def _convert_add(builder, node, graph, err):
     https://github.com/apple/coremltools/blob/655b3be5cc0d42c3c4fa49f0f0e4a93a26b3e492/mlmodel/format/NeuralNetwork.proto#L4117
     '''
     load_input_constants(builder, node, graph, err)
-    add_broadcastable_op_chain(builder, node, err, builder.add_add_broadcastable)
+    add_broadcastable_op_chain(builder, node, err, builder.add_add_broadcastable, graph=graph, mode='ADD')
 
 def _convert_argmax(builder, node, graph, err):
     '''
@@ -629,12 +623,35 @@ def _convert_gather(builder, node, graph, err):
     '''
     convert to CoreML Gather Along Axis Layer:
     https://github.com/apple/coremltools/blob/655b3be5cc0d42c3c4fa49f0f0e4a93a26b3e492/mlmodel/format/NeuralNetwork.proto#L4296
+    or, for a constant 2-D table gathered along axis 0, to CoreML EmbeddingND Layer
     '''
     axis = node.attrs.get('axis', 0)
 
     if len(node.inputs) != 2:
         err.unsupported_op_configuration(builder, node, graph, "Error in ONNX model: Gather expects two inputs")
-    
+
+    data = node.input_tensors.get(node.inputs[0], None)
+    if data is not None and len(data.shape) == 2 and axis in (0, -2) and node.inputs[1] not in node.input_tensors:
+        # lookup in a constant table (e.g. word embeddings): the table is stored as the weights of
+        # an EmbeddingND layer, instead of being loaded as a blob on every prediction.
+        # EmbeddingND expects indices of shape [..., 1] (negative indices are not supported)
+        indices = graph.get_unique_edge_name(node.name + '_indices')
+        builder.add_expand_dims(
+            name=node.name + '_expand_indices',
+            input_name=node.inputs[1],
+            output_name=indices,
+            axes=[-1]
+        )
+        builder.add_embedding_nd(
+            name=node.name,
+            input_name=indices,
+            output_name=node.outputs[0],
+            vocab_size=data.shape[0],
+            embedding_size=data.shape[1],
+            W=np.transpose(data).astype(np.float32)
+        )
+        return
+
     if node.inputs[0] in node.input_tensors and node.inputs[0] not in graph.constants_loaded:
         value = node.input_tensors[node.inputs[0]]
         builder.add_load_constant_nd(
@@ -674,44 +691,71 @@ def _convert_gemm(builder, node, graph, err):
     transB = node.attrs.get('transB', False)
 
     A = node.inputs[0]
-    if alpha != 1.0:
-        builder.add_load_constant_nd(
-            name=node.name + '_load_alpha',
-            output_name='alpha_for_'+A,
-            constant_value=alpha,
-            shape=[1]
-        )
-        builder.add_multiply_broadcastable(
-            name=node.name + '_alphaA',
-            input_names=[A, 'alpha_for_'+A],
-            output_name=A+'_alphaA'
-        )
-        A = A + '_alphaA'
-
     B = node.inputs[1]
-    C = node.inputs[2]
-    if B in node.input_tensors and C in node.input_tensors:
-        B = node.input_tensors[B]
-        C = node.input_tensors[C]
-
+    # C is optional since opset 11
+    C = node.inputs[2] if len(node.inputs) > 2 and node.inputs[2] != '' else None
+    if beta == 0.0:
+        C = None
+
+    if B in node.input_tensors and (C is None or C in node.input_tensors):
+        # alpha and beta are folded into the weights and the bias
+        W = alpha * node.input_tensors[B]
         if transB:
-            B = B.transpose()
-        
-        C = C.flatten()
+            W = W.transpose()
+
+        bias = None
+        if C is not None:
+            bias = beta * node.input_tensors[C]
+            if bias.size == 1:
+                bias = np.full((W.shape[1],), bias.flatten()[0])
+            elif bias.size == W.shape[1] and bias.shape[-1] == W.shape[1]:
+                bias = bias.flatten()
+            else:
+                # C is a full matrix, it is added by a separate layer
+                C = node.name + '_C'
+                builder.add_load_constant_nd(
+                    name=node.name + '_load_C',
+                    output_name=C,
+                    constant_value=bias,
+                    shape=bias.shape
+                )
+                bias = None
+
         builder.add_batched_mat_mul(
             name=node.name,
             input_names=[A],
-            output_name=node.outputs[0],
+            output_name=node.outputs[0] if C is None or bias is not None else node.outputs[0] + '_b_mat_mul',
             transpose_a=transA,
-            weight_matrix_rows=B.shape[0],
-            weight_matrix_columns=B.shape[1],
-            W=B,
-            bias=C
+            weight_matrix_rows=W.shape[0],
+            weight_matrix_columns=W.shape[1],
+            W=W.astype(np.float32),
+            bias=bias.astype(np.float32) if bias is not None else None
         )
+        if C is not None and bias is None:
+            builder.add_add_broadcastable(
+                name=node.name + '_add_bias',
+                input_names=[node.outputs[0] + '_b_mat_mul', C],
+                output_name=node.outputs[0]
+            )
     else:
+        load_input_constants(builder, node, graph, err)
+        if alpha != 1.0:
+            builder.add_load_constant_nd(
+                name=node.name + '_load_alpha',
+                output_name='alpha_for_'+A,
+                constant_value=alpha,
+                shape=[1]
+            )
+            builder.add_multiply_broadcastable(
+                name=node.name + '_alphaA',
+                input_names=[A, 'alpha_for_'+A],
+                output_name=A+'_alphaA'
+            )
+            A = A + '_alphaA'
+
         ## TODO: Test coverage when B and C are non-constant
         ## Should C be of Rank-1? or it's okay to keep it that way?
-        if beta != 1.0:
+        if C is not None and beta != 1.0:
             builder.add_load_constant_nd(
                 name=node.name + '_load_beta',
                 output_name='beta_for_'+B,
@@ -728,16 +772,90 @@ def _convert_gemm(builder, node, graph, err):
         builder.add_batched_mat_mul(
             name=node.name,
             input_names=[A, B],
-            output_name=node.outputs[0] + '_b_mat_mul',
+            output_name=node.outputs[0] + '_b_mat_mul' if C is not None else node.outputs[0],
             transpose_a=transA,
             transpose_b=transB,
         )
 
-        builder.add_add_broadcastable(
-            name=node.name+'_add_bias',
-            input_names=[node.outputs[0]+'_b_mat_mul', C],
-            output_name=node.outputs[0]
+        if C is not None:
+            builder.add_add_broadcastable(
+                name=node.name+'_add_bias',
+                input_names=[node.outputs[0]+'_b_mat_mul', C],
+                output_name=node.outputs[0]
+            )
+
+def _convert_gelu(builder, node, graph, err):  # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling) -> None
+    '''
+    convert to CoreML Gelu Layer:
+    https://github.com/apple/coremltools/blob/655b3be5cc0d42c3c4fa49f0f0e4a93a26b3e492/mlmodel/format/NeuralNetwork.proto
+    Gelu nodes are created by ActivationFuser. The Gelu layer needs iOS14 (specification
+    version 5), it is only used with minimum_ios_deployment_target='14' and versions of
+    coremltools that have it. Otherwise the shortest equivalent chain of elementwise
+    layers available on iOS13 is added.
+    '''
+    approximate = node.attrs.get('approximate', b'none')
+    if isinstance(approximate, bytes):
+        approximate = approximate.decode('utf-8')
+    if approximate not in ('none', 'tanh'):
+        return err.unsupported_op_configuration(builder, node, graph, "Unsupported approximation: {}".format(approximate))
+    x = node.inputs[0]
+    if err.minimum_ios_deployment_target == '14' and hasattr(builder, 'add_gelu'):
+        builder.add_gelu(
+            name=node.name,
+            input_name=x,
+            output_name=node.outputs[0],
+            mode='EXACT' if approximate == 'none' else 'TANH_APPROXIMATION'
         )
+        # add_gelu does not update the specification version itself
+        builder.spec.specificationVersion = max(builder.spec.specificationVersion, _SPECIFICATION_VERSION_IOS_14)
+        return
+
+    if approximate == 'none':
+        # 0.5 * (1 + erf(x / sqrt(2)))
+        scaled = graph.get_unique_edge_name(node.name + '_scaled')
+        activation = graph.get_unique_edge_name(node.name + '_erf')
+        builder.add_activation(name=node.name + '_scale', non_linearity='LINEAR', input_name=x,
+                               output_name=scaled, params=[float(np.sqrt(0.5)), 0.0])
+        builder.add_erf(node.name + '_erf', scaled, activation)
+    else:
+        # 0.5 * (1 + tanh(sqrt(2 / pi) * x * (1 + 0.044715 * x^2)))
+        c = float(np.sqrt(2.0 / np.pi))
+        square = graph.get_unique_edge_name(node.name + '_square')
+        poly = graph.get_unique_edge_name(node.name + '_poly')
+        inner = graph.get_unique_edge_name(node.name + '_inner')
+        activation = graph.get_unique_edge_name(node.name + '_tanh')
+        builder.add_multiply_broadcastable(name=node.name + '_square', input_names=[x, x], output_name=square)
+        builder.add_activation(name=node.name + '_poly', non_linearity='LINEAR', input_name=square,
+                               output_name=poly, params=[0.044715 * c, c])
+        builder.add_multiply_broadcastable(name=node.name + '_inner', input_names=[x, poly], output_name=inner)
+        builder.add_activation(name=node.name + '_tanh', non_linearity='TANH', input_name=inner,
+                               output_name=activation)
+    half = graph.get_unique_edge_name(node.name + '_half')
+    builder.add_activation(name=node.name + '_half', non_linearity='LINEAR', input_name=activation,
+                           output_name=half, params=[0.5, 0.5])
+    builder.add_multiply_broadcastable(
+        name=node.name,
+        input_names=[x, half],
+        output_name=node.outputs[0]
+    )
+
+def _convert_hard_swish(builder, node, graph, err):  # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling) -> None
+    '''
+    convert to CoreML Sigmoid Hard Activation and Multiply Broadcastable Layers:
+    x * HardSigmoid(x, alpha=1/6, beta=0.5)
+    '''
+    builder.add_activation(
+        name=node.name + '_hard_sigmoid',
+        non_linearity='SIGMOID_HARD',
+        input_name=node.inputs[0],
+        output_name=node.outputs[0] + '_hard_sigmoid',
+        params=[1.0 / 6, 0.5]
+    )
+    builder.add_multiply_broadcastable(
+        name=node.name,
+        input_names=[node.inputs[0], node.outputs[0] + '_hard_sigmoid'],
+        output_name=node.outputs[0]
+    )
 
 def _convert_greater(builder, node, graph, err):
     '''
@@ -808,6 +926,42 @@ def _convert_instancenorm(builder, node, graph, err):  # type: (NeuralNetworkBui
         # Unsupported 1D, 3D and above
         err.unsupported_op_configuration(builder, node, graph, "provided number axes {} not supported".format(rank))
 
+def _convert_layer_normalization(builder, node, graph, err):  # type: (NeuralNetworkBuilder, Node, Graph, ErrorHandling) -> None
+    '''
+    convert to CoreML Layer Normalization Layer:
+    https://github.com/apple/coremltools/blob/655b3be5cc0d42c3c4fa49f0f0e4a93a26b3e492/mlmodel/format/NeuralNetwork.proto
+    Also used for the layer normalizations fused by LayerNormFuser.
+    '''
+    if len(node.outputs) > 1:
+        return err.unsupported_op_configuration(builder, node, graph, "Mean and InvStdDev outputs are not supported")
+    if node.inputs[0] not in graph.shape_dict:
+        return err.unsupported_op_configuration(builder, node, graph, "Shape of input unknown")
+    for input_ in node.inputs[1:]:
+        if input_ not in node.input_tensors:
+            return err.unsupported_op_configuration(builder, node, graph, "CoreML LayerNorm requires Scale and Bias to be known")
+
+    input_shape = graph.shape_dict[node.inputs[0]]
+    axis = node.attrs.get('axis', -1)
+    if axis < 0:
+        axis += len(input_shape)
+    normalized_shape = [int(d) for d in input_shape[axis:]]
+    if any(d <= 0 for d in normalized_shape):
+        return err.unsupported_op_configuration(builder, node, graph, "Normalized dimensions must be known")
+
+    gamma = np.broadcast_to(node.input_tensors[node.inputs[1]], normalized_shape)
+    beta = np.zeros(normalized_shape)
+    if len(node.inputs) > 2:
+        beta = np.broadcast_to(node.input_tensors[node.inputs[2]], normalized_shape)
+    builder.add_layer_normalization(
+        name=node.name,
+        input_name=node.inputs[0],
+        output_name=node.outputs[0],
+        normalized_shape=normalized_shape,
+        gamma=np.array(gamma, dtype=np.float32),
+        beta=np.array(beta, dtype=np.float32),
+        eps=node.attrs.get('epsilon', 1e-5)
+    )
+
 def _convert_less(builder, node, graph, err):
     '''
     convert to CoreML Less Than Layer:
@@ -1160,31 +1314,51 @@ def _convert_matmul(builder, node, graph, err):
     '''
     convert to CoreML BatchedMatMul Layer:
     https://github.com/apple/coremltools/blob/655b3be5cc0d42c3c4fa49f0f0e4a93a26b3e492/mlmodel/format/NeuralNetwork.proto#L3473
+    transA and transB are not ONNX attributes, they are set by AttentionFuser.
+    A third (constant bias) input is not an ONNX input either, it is set by MatMulAddFuser.
     '''
+    transpose_a = bool(node.attrs.get('transA', 0))
+    transpose_b = bool(node.attrs.get('transB', 0))
     weight_name = node.inputs[1]
     W = None
+    b = None
     weight_as_layer_parameter = False
     if weight_name in node.input_tensors:
         W = node.input_tensors[weight_name]
+    if len(node.inputs) > 2:
+        b = node.input_tensors[node.inputs[2]].flatten()
 
     if W is not None:
-        if len(W.shape) != 2:
-            # since weight as parameter in batchedMatMul layer must be rank 2
+        if len(W.shape) != 2 or transpose_a:
+            # since weight as parameter in batchedMatMul layer must be rank 2,
+            # and transposeA is ignored by CoreML when the layer has a single input
             builder.add_load_constant_nd(node.name + '_const_weight_input', weight_name, constant_value=W,shape=W.shape)
         else:
             weight_as_layer_parameter = True
 
     if weight_as_layer_parameter:
+        if transpose_b:
+            W = np.transpose(W)
         builder.add_batched_mat_mul(name=node.name,
                                     input_names=[node.inputs[0]],
                                     output_name=node.outputs[0],
+                                    transpose_a=transpose_a,
                                     weight_matrix_rows=W.shape[0],
                                     weight_matrix_columns=W.shape[1],
-                                    W=W)
+                                    W=W,
+                                    bias=b)
     else:
+        output_name = node.outputs[0] if b is None else node.outputs[0] + '_b_mat_mul'
         builder.add_batched_mat_mul(name=node.name,
                                     input_names=[node.inputs[0], weight_name],
-                                    output_name=node.outputs[0])
+                                    output_name=output_name,
+                                    transpose_a=transpose_a,
+                                    transpose_b=transpose_b)
+        if b is not None:
+            builder.add_load_constant_nd(node.name + '_load_bias', node.inputs[2], constant_value=b, shape=b.shape)
+            builder.add_add_broadcastable(name=node.name + '_add_bias',
+                                          input_names=[output_name, node.inputs[2]],
+                                          output_name=node.outputs[0])
 
 def _convert_max(builder, node, graph, err):
     '''
@@ -1192,28 +1366,33 @@ def _convert_max(builder, node, graph, err):
     https://github.com/apple/coremltools/blob/655b3be5cc0d42c3c4fa49f0f0e4a93a26b3e492/mlmodel/format/NeuralNetwork.proto#L4126
     '''
     load_input_constants(builder, node, graph, err)
-    add_broadcastable_op_chain(builder, node, err, builder.add_max_broadcastable)
+    add_broadcastable_op_chain(builder, node, err, builder.add_max_broadcastable, graph=graph, mode='MAX')
 
 def _convert_mean(builder, node, graph, err):
     '''
-    convert to CoreML Add Broadcastable Layer and Divide BroadCastable Layer:
+    convert to CoreML Average Layer if all the inputs have the same shape, otherwise to
+    CoreML Add Broadcastable Layers and a Linear Activation Layer scaling the sum:
     https://github.com/apple/coremltools/blob/655b3be5cc0d42c3c4fa49f0f0e4a93a26b3e492/mlmodel/format/NeuralNetwork.proto#L4117
     '''
+    load_input_constants(builder, node, graph, err)
     number_of_inputs = len(node.inputs)
-    output_name = node.outputs[0]
-    node.outputs[0] = node.outputs[0] + '_sum'
+    if number_of_inputs > 1 and _have_same_shape(node, graph, node.inputs):
+        builder.add_elementwise(
+            name=node.name,
+            input_names=node.inputs,
+            output_name=node.outputs[0],
+            mode='AVE'
+        )
+        return
 
-    builder.add_load_constant_nd(
-        name=node.name + '_divider',
-        output_name=output_name+'_divider',
-        constant_value=number_of_inputs,
-        shape=[1]
-    )
-    add_broadcastable_op_chain(builder, node, err, builder.add_add_broadcastable)
-    builder.add_divide_broadcastable(
-        name=node.name+'_mean',
-        input_names=[node.outputs[0], output_name+'_divider'],
-        output_name=node.outputs[0]
+    sum_node = Node(node.name + '_sum', 'Sum', {}, node.inputs, [node.outputs[0] + '_sum'])
+    add_broadcastable_op_chain(builder, sum_node, err, builder.add_add_broadcastable)
+    builder.add_activation(
+        name=node.name,
+        non_linearity='LINEAR',
+        input_name=sum_node.outputs[0],
+        output_name=node.outputs[0],
+        params=[1.0 / number_of_inputs, 0.0]
     )
 
 def _convert_pow(builder, node, graph, err):
@@ -1282,7 +1461,7 @@ def _convert_min(builder, node, graph, err):
     https://github.com/apple/coremltools/blob/655b3be5cc0d42c3c4fa49f0f0e4a93a26b3e492/mlmodel/format/NeuralNetwork.proto#L4135
     '''
     load_input_constants(builder, node, graph, err)
-    add_broadcastable_op_chain(builder, node, err, builder.add_min_broadcastable)
+    add_broadcastable_op_chain(builder, node, err, builder.add_min_broadcastable, graph=graph, mode='MIN')
 
 def _convert_mod(builder, node, graph, err):
     '''
@@ -1725,6 +1904,7 @@ _ONNX_NODE_REGISTRY_ND = {
     "Acos": _convert_acos,
     "Acosh": _convert_acosh,
     "Add": _convert_add,
+    "Affine": _convert_affine,
     "And": _convert_logical,
     "ArgMax": _convert_argmax,
     "ArgMin": _convert_argmin,
@@ -1754,13 +1934,16 @@ _ONNX_NODE_REGISTRY_ND = {
     "Flatten": _convert_flatten,
     "Floor": _convert_floor,
     "Gather": _convert_gather,
+    "Gelu": _convert_gelu,
     "Gemm": _convert_gemm,
     "Greater": _convert_greater,
     "GlobalAveragePool": _convert_pool,
     "GlobalMaxPool": _convert_pool,
     "HardSigmoid": _convert_hardsigmoid,
+    "HardSwish": _convert_hard_swish,
     "Identity": _convert_identity,
     "InstanceNormalization": _convert_instancenorm,
+    "LayerNormalization": _convert_layer_normalization,
     "LeakyRelu": _convert_leaky_relu,
     "Log": _convert_log,
     "LogSoftmax": _convert_softmax,
@@ -1822,6 +2005,29 @@ _ONNX_NODE_REGISTRY_ND = {
     "Xor": _convert_logical,
 }
 
+# inputs whose value is read from node.input_tensors by the converter, i.e. must be constants
+_CONSTANT_INPUTS_ND = {
+    "BatchNormalization": [1, 2, 3, 4],
+    "Conv": [2],
+    "ConvTranspose": [2],
+    "InstanceNormalization": [1, 2],
+}  # type: Dict[Text, List[int]]
+
+# parameter inputs that, when not constant, are given to the layer at runtime (dynamic layer)
+_RUNTIME_PARAMETER_INPUTS_ND = {
+    "ConstantOfShape": [0],
+    "Conv": [1],
+    "ConvTranspose": [1],
+    "Expand": [1],
+    "Gemm": [1, 2],
+    "MatMul": [1],
+    "Pad": [1, 2],
+    "Reshape": [1],
+    "Slice": [1, 2, 3, 4],
+    "Tile": [1],
+    "Upsample": [1],
+}  # type: Dict[Text, List[int]]
+
 def _get_node_converter_fn(builder, node, err):  # type: (NeuralNetworkBuilder, Node, ErrorHandling) -> Callable[[NeuralNetworkBuilder, Node, Graph, ErrorHandling], None]
     """
     Get the right converter function for ONNX node op_type
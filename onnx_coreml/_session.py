@@ -0,0 +1,183 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import onnx
+from typing import Text, Union, Optional, Dict, Any, Iterable, List, Tuple
+
+
+class ConversionSession(object):
+    '''
+    Long lived conversion engine, meant to be created once per process and
+    reused for many models (CLI, onnx backend, conversion services).
+
+    The session keeps:
+     - a thread pool, created on first use of convert_many and kept alive
+       until close() is called
+     - a small LRU cache of converted models, keyed by the serialized ONNX
+       model and the conversion options. The cache keeps a private copy of
+       the model spec, every call returns a new model the caller may modify
+     - statistics about all the conversions it has run (see `stats`)
+
+    convert() is reentrant, so a single session may be shared between threads.
+    '''
+
+    def __init__(self,
+                 max_workers=None,  # type: Optional[int]
+                 cache_size=16,  # type: int
+                 **default_options  # type: Any
+                 ):
+        # type: (...) -> None
+        '''
+        max_workers: number of threads used by convert_many (defaults to the
+            ThreadPoolExecutor default).
+        cache_size: number of converted models kept in memory, 0 disables caching.
+        default_options: keyword arguments forwarded to onnx_coreml.convert for
+            every conversion, unless overridden per call.
+        '''
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.default_options = default_options
+        self._cache = OrderedDict()  # type: OrderedDict[Tuple[Text, Text], Any]
+        self._lock = threading.Lock()
+        self._pool = None  # type: Optional[ThreadPoolExecutor]
+        self._stats = {
+            'conversions': 0,
+            'failures': 0,
+            'cache_hits': 0,
+            'conversion_time': 0.0,
+        }  # type: Dict[Text, Any]
+
+    @property
+    def stats(self):  # type: () -> Dict[Text, Any]
+        '''
+        Snapshot of the session statistics: number of successful conversions,
+        failed conversions, cache hits and the total time (in seconds) spent converting.
+        '''
+        with self._lock:
+            return dict(self._stats)
+
+    def convert(self,
+                model,  # type: Union[onnx.ModelProto, Text]
+                **options  # type: Any
+                ):
+        # type: (...) -> Any
+        '''
+        Convert a single ONNX model (ModelProto or path to an .onnx file).
+        Accepts the same keyword arguments as onnx_coreml.convert.
+        '''
+        onnx_model, key = self._load(model, options)
+        kwargs = dict(self.default_options)
+        kwargs.update(options)
+        if key is not None:
+            with self._lock:
+                spec = self._cache.get(key, None)
+                if spec is not None:
+                    self._cache.move_to_end(key)
+                    self._stats['cache_hits'] += 1
+            if spec is not None:
+                return self._from_spec(spec, kwargs.get('return_spec', False))
+
+        from .converter import convert
+
+        start = time.time()
+        try:
+            mlmodel = convert(onnx_model, **kwargs)
+        except Exception:
+            with self._lock:
+                self._stats['failures'] += 1
+                self._stats['conversion_time'] += time.time() - start
+            raise
+
+        with self._lock:
+            self._stats['conversions'] += 1
+            self._stats['conversion_time'] += time.time() - start
+            if key is not None:
+                self._cache[key] = _copy_spec(mlmodel) if kwargs.get('return_spec', False) else mlmodel.get_spec()
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return mlmodel
+
+    def convert_many(self,
+                     models,  # type: Iterable[Union[onnx.ModelProto, Text]]
+                     **options  # type: Any
+                     ):
+        # type: (...) -> List[Any]
+        '''
+        Convert several models concurrently on the session thread pool.
+        Results are returned in the order of `models`; the first failure is re-raised.
+        '''
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            pool = self._pool
+        futures = [pool.submit(self.convert, model, **options) for model in models]
+        return [future.result() for future in futures]
+
+    def clear_cache(self):  # type: () -> None
+        with self._lock:
+            self._cache.clear()
+
+    def close(self):  # type: () -> None
+        '''
+        Shut down the thread pool and drop the cached models.
+        '''
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+            self._cache.clear()
+        if pool is not None:
+            pool.shutdown()
+
+    def __enter__(self):  # type: () -> ConversionSession
+        return self
+
+    def __exit__(self, *args):  # type: (*Any) -> None
+        self.close()
+
+    @staticmethod
+    def _from_spec(spec, return_spec):  # type: (Any, bool) -> Any
+        '''
+        Returns a copy of a cached spec, as a spec or as an MLModel like convert.
+        '''
+        spec = _copy_spec(spec)
+        if return_spec:
+            return spec
+        from coremltools.models import MLModel  # type: ignore
+        return MLModel(spec)
+
+    def _load(self,
+              model,  # type: Union[onnx.ModelProto, Text]
+              options,  # type: Dict[Text, Any]
+              ):
+        # type: (...) -> Tuple[onnx.ModelProto, Optional[Tuple[Text, Text]]]
+        if isinstance(model, Text):
+            with open(model, 'rb') as f:
+                serialized = f.read()
+            onnx_model = onnx.load_model_from_string(serialized)
+        elif isinstance(model, onnx.ModelProto):
+            onnx_model = model
+            serialized = model.SerializeToString() if self.cache_size > 0 else b''
+        else:
+            raise TypeError(
+                "Model must be file path to .onnx file or onnx loaded model"
+            )
+        if self.cache_size <= 0:
+            return onnx_model, None
+        kwargs = dict(self.default_options)
+        kwargs.update(options)
+        key = (hashlib.sha1(serialized).hexdigest(), repr(sorted(kwargs.items())))
+        return onnx_model, key
+
+
+def _copy_spec(spec):  # type: (Any) -> Any
+    copy = type(spec)()
+    copy.CopyFrom(spec)
+    return copy
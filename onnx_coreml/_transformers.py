@@ -3,7 +3,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from typing import Sequence, Text, Dict, List, Tuple
+from typing import Sequence, Text, Dict, List, Tuple, Any, Optional
 import numpy as np
 
 from onnx import TensorProto
@@ -20,6 +20,79 @@ def _get_fully_defined_shape(shape, blob_name, graph):
         return graph.shape_dict[blob_name]
 
 
+def _connect_nodes(nodes):  # type: (Sequence[Node]) -> None
+    '''
+    Rebuilds the parents/children links of the nodes from the names of their
+    inputs and outputs. Inputs that are constants of a node do not create a link.
+    '''
+    producers = {}  # type: Dict[Text, Node]
+    for node in nodes:
+        node.parents = []
+        node.children = []
+        for output in node.outputs:
+            producers[output] = node
+    for node in nodes:
+        for input_ in node.inputs:
+            if input_ in node.input_tensors or input_ not in producers:
+                continue
+            parent = producers[input_]
+            if parent not in node.parents:
+                node.parents.append(parent)
+            if node not in parent.children:
+                parent.children.append(node)
+
+
+def _get_consumers(nodes):  # type: (Sequence[Node]) -> Dict[Text, List[Node]]
+    '''
+    Maps every data blob to the list of nodes reading it.
+    '''
+    consumers = {}  # type: Dict[Text, List[Node]]
+    for node in nodes:
+        for input_ in node.inputs:
+            consumers.setdefault(input_, [])
+            if node not in consumers[input_]:
+                consumers[input_].append(node)
+    return consumers
+
+
+def _get_producers(nodes):  # type: (Sequence[Node]) -> Dict[Text, Node]
+    producers = {}  # type: Dict[Text, Node]
+    for node in nodes:
+        for output in node.outputs:
+            producers[output] = node
+    return producers
+
+
+def _bypass_node(graph, nodes, node):  # type: (Graph, List[Node], Node) -> bool
+    '''
+    Removes from `nodes` a node whose single output is equal to its first input,
+    by making the consumers of its output read its first input instead.
+    If the output is a graph output, the producer of the input is renamed instead,
+    so that the names of the graph outputs are preserved.
+    Returns False, without modifying anything, if the node cannot be removed.
+    The parents/children links have to be rebuilt afterwards, see _connect_nodes.
+    '''
+    src, dst = node.inputs[0], node.outputs[0]
+    graph_outputs = set(output[0] for output in graph.outputs)
+    consumers = _get_consumers(nodes)
+    if dst not in graph_outputs:
+        for consumer in consumers.get(dst, []):
+            consumer.inputs = [src if i == dst else i for i in consumer.inputs]
+            if src in node.input_tensors:
+                consumer.input_tensors[src] = node.input_tensors[src]
+        nodes.remove(node)
+        return True
+
+    producer = _get_producers(nodes).get(src, None)
+    if producer is None or src in graph_outputs or src in node.input_tensors:
+        return False
+    producer.outputs = [dst if o == src else o for o in producer.outputs]
+    for consumer in consumers.get(src, []):
+        consumer.inputs = [dst if i == src else i for i in consumer.inputs]
+    nodes.remove(node)
+    return True
+
+
 class NodesFuser(object):
     '''
     An abstract helper for merging nodes
@@ -221,10 +294,317 @@ class BNBroadcastedAddFuser(NodesFuser):
         child.parents.remove(parent)
         return [parent]
 
+class BNFolder(NodesFuser):
+    '''
+    Folds an inference mode BatchNormalization into the weights and bias of the
+    Conv, ConvTranspose or Gemm producing its input.
+    '''
+    def __init__(self):  # type: () -> None
+        super(BNFolder, self).__init__(2)
+
+    def is_eligible(self, graph, nodes):  # type: (Graph, Sequence[Node]) -> bool
+        parent, child = nodes[0], nodes[1]
+        if parent.op_type not in ('Conv', 'ConvTranspose', 'Gemm'):
+            return False
+        if child.op_type != 'BatchNormalization':
+            return False
+        if len(child.outputs) != 1 or child.attrs.get('spatial', 1) != 1:
+            return False
+        if child.inputs[0] != parent.outputs[0]:
+            return False
+        for input_ in child.inputs[1:5]:
+            if input_ not in child.input_tensors:
+                return False
+        for input_ in parent.inputs[1:]:
+            if input_ not in parent.input_tensors:
+                return False
+        if len(parent.inputs) < 2:
+            return False
+        W = parent.input_tensors[parent.inputs[1]]
+        channels = child.input_tensors[child.inputs[1]].size
+        if parent.op_type == 'Gemm':
+            return len(W.shape) == 2 and W.shape[0 if parent.attrs.get('transB', 0) else 1] == channels
+        if parent.op_type == 'ConvTranspose':
+            return W.shape[1] * parent.attrs.get('group', 1) == channels
+        return W.shape[0] == channels
+
+    def merge(self, graph, nodes):  # type: (Graph, Sequence[Node]) -> Sequence[Node]
+        parent, child = nodes[0], nodes[1]
+        gamma, beta, mean, var = [child.input_tensors[i].flatten() for i in child.inputs[1:5]]
+        scale = gamma / np.sqrt(var + child.attrs.get('epsilon', 1e-5))
+        shift = beta - mean * scale
+
+        W = parent.input_tensors[parent.inputs[1]]
+        if parent.op_type == 'Gemm':
+            if parent.attrs.get('transB', 0):
+                W = W * scale[:, None]
+            else:
+                W = W * scale[None, :]
+        elif parent.op_type == 'ConvTranspose':
+            # weights are (C_in, C_out / group, k1, k2, ...)
+            group = parent.attrs.get('group', 1)
+            grouped_shape = (group, W.shape[0] // group) + W.shape[1:]
+            scale_shape = (group, 1, W.shape[1]) + (1,) * (len(W.shape) - 2)
+            W = (W.reshape(grouped_shape) * scale.reshape(scale_shape)).reshape(W.shape)
+        else:
+            # weights are (C_out, C_in / group, k1, k2, ...), also for grouped and depthwise conv
+            W = W * scale.reshape((-1,) + (1,) * (len(W.shape) - 1))
+        parent.input_tensors[parent.inputs[1]] = W.astype(np.float32)
+
+        if parent.op_type == 'Gemm':
+            beta_gemm = parent.attrs.get('beta', 1.0)
+            if len(parent.inputs) > 2 and beta_gemm != 0:
+                bias = parent.input_tensors[parent.inputs[2]] * scale + shift / beta_gemm
+            else:
+                parent.attrs['beta'] = 1.0
+                bias = shift
+        else:
+            bias = parent.input_tensors[parent.inputs[2]] * scale + shift if len(parent.inputs) > 2 else shift
+        if len(parent.inputs) > 2:
+            bias_input_name = parent.inputs[2]
+        else:
+            bias_input_name = "{}_bias".format(parent.name,)
+            parent.inputs.append(bias_input_name)
+        parent.input_tensors[bias_input_name] = bias.astype(np.float32)
+
+        parent.outputs = child.outputs
+        parent.children.remove(child)
+        child.parents.remove(parent)
+        return [parent]
+
+class PadFolder(NodesFuser):
+    '''
+    Folds a constant mode Pad of the spatial axes into the pads attribute of the
+    Conv, MaxPool or AveragePool consuming it. The padding value has to be 0 for Conv
+    and AveragePool (which then counts the padded area, as the Pad did), and either -inf
+    or irrelevant (0 after a non negative op) for MaxPool.
+    '''
+    _NON_NEGATIVE_OPS = ('Relu', 'Sigmoid', 'Softmax', 'Softplus', 'Abs')
+
+    def __init__(self):  # type: () -> None
+        super(PadFolder, self).__init__(2)
+
+    def is_eligible(self, graph, nodes):  # type: (Graph, Sequence[Node]) -> bool
+        parent, child = nodes[0], nodes[1]
+        if parent.op_type != 'Pad' or child.op_type not in ('Conv', 'MaxPool', 'AveragePool'):
+            return False
+        if child.inputs[0] != parent.outputs[0] or parent.outputs[0] in [o[0] for o in graph.outputs]:
+            return False
+        if parent.inputs[0] in parent.input_tensors or len(child.outputs) != 1:
+            return False
+        mode = parent.attrs.get('mode', 'constant')
+        if mode not in ('constant', b'constant'):
+            return False
+        if child.attrs.get('auto_pad', 'NOTSET') not in ('NOTSET', b'NOTSET', 'VALID', b'VALID'):
+            return False
+        pads = self._get_pads(parent)
+        value = self._get_value(parent)
+        if pads is None or value is None or any(p < 0 for p in pads):
+            return False
+        rank = len(pads) // 2
+        # batch and channel axes must not be padded
+        if pads[0] or pads[1] or pads[rank] or pads[rank + 1]:
+            return False
+        if child.op_type == 'Conv':
+            if len(child.inputs) < 2 or child.inputs[1] not in child.input_tensors:
+                return False
+            kernel_shape = child.input_tensors[child.inputs[1]].shape[2:]
+        else:
+            kernel_shape = child.attrs.get('kernel_shape', [])
+        if len(kernel_shape) != rank - 2:
+            return False
+
+        if child.op_type == 'Conv':
+            return value == 0
+        if len(child.attrs.get('dilations', [])) and any(d != 1 for d in child.attrs['dilations']):
+            return False
+        new_pads = self._merge_pads(child, pads)
+        # every pooling window must still contain a value of the input
+        if any(p >= k for p, k in zip(new_pads, list(kernel_shape) * 2)):
+            return False
+        if child.op_type == 'AveragePool':
+            # the padded values are counted by the pool if count_include_pad is set, which
+            # can only be done if the pool does not already exclude its own padding
+            own_pads = child.attrs.get('pads', [])
+            return value == 0 and (child.attrs.get('count_include_pad', 0) == 1 or not any(own_pads))
+        if value == -np.inf:
+            return True
+        return value == 0 and len(parent.parents) == 1 and parent.parents[0].op_type in self._NON_NEGATIVE_OPS
+
+    @staticmethod
+    def _get_pads(node):  # type: (Node) -> Any
+        if 'pads' in node.attrs:
+            return list(node.attrs['pads'])
+        if len(node.inputs) > 1 and node.inputs[1] in node.input_tensors:
+            if len(node.inputs) > 3 and node.inputs[3] != '':
+                # padded axes given explicitly
+                return None
+            return [int(p) for p in node.input_tensors[node.inputs[1]].flatten()]
+        return None
+
+    @staticmethod
+    def _get_value(node):  # type: (Node) -> Any
+        if 'value' in node.attrs:
+            return float(node.attrs['value'])
+        if len(node.inputs) < 3 or node.inputs[2] == '':
+            return 0.0
+        if node.inputs[2] in node.input_tensors:
+            return float(node.input_tensors[node.inputs[2]].flatten()[0])
+        return None
+
+    @staticmethod
+    def _merge_pads(node, pads):  # type: (Node, List[int]) -> List[int]
+        rank = len(pads) // 2
+        spatial_pads = pads[2:rank] + pads[rank + 2:]
+        own_pads = node.attrs.get('pads', [0] * len(spatial_pads))
+        return [p + q for p, q in zip(own_pads, spatial_pads)]
+
+    def merge(self, graph, nodes):  # type: (Graph, Sequence[Node]) -> Sequence[Node]
+        parent, child = nodes[0], nodes[1]
+        child.attrs['pads'] = self._merge_pads(child, self._get_pads(parent))
+        child.attrs.pop('auto_pad', None)
+        if child.op_type == 'AveragePool':
+            child.attrs['count_include_pad'] = 1
+        child.inputs[0] = parent.inputs[0]
+        child.parents.remove(parent)
+        for p in parent.parents:
+            child.parents.append(p)
+            p.children.remove(parent)
+            p.children.append(child)
+        parent.parents = []
+        return [child]
+
+class MatMulAddFuser(NodesFuser):
+    '''
+    Fuses the Add of a constant bias into the MatMul or Gemm with constant 2-D weights
+    producing its input. The bias becomes the third input of the MatMul (which is not
+    an ONNX input, the MatMul converters map it to the bias of the layer) or is added
+    to the C input of the Gemm.
+    '''
+    def __init__(self):  # type: () -> None
+        super(MatMulAddFuser, self).__init__(2)
+
+    def is_eligible(self, graph, nodes):  # type: (Graph, Sequence[Node]) -> bool
+        parent, child = nodes[0], nodes[1]
+        if parent.op_type not in ('MatMul', 'Gemm') or child.op_type != 'Add':
+            return False
+        if len(child.inputs) != 2 or parent.outputs[0] not in child.inputs or \
+                parent.outputs[0] in [o[0] for o in graph.outputs]:
+            return False
+        if len(parent.inputs) < 2 or parent.inputs[1] not in parent.input_tensors:
+            return False
+        if parent.op_type == 'MatMul' and len(parent.inputs) != 2:
+            return False
+        if parent.op_type == 'Gemm' and len(parent.inputs) > 2 and parent.inputs[2] != '' and \
+                parent.inputs[2] not in parent.input_tensors:
+            return False
+        W = parent.input_tensors[parent.inputs[1]]
+        bias_name = _get_other_input(child, parent.outputs[0])
+        if len(W.shape) != 2 or bias_name not in child.input_tensors:
+            return False
+        b = child.input_tensors[bias_name]
+        # the bias must only be broadcast along the last axis, without changing the output shape
+        n = W.shape[0] if parent.attrs.get('transB', 0) else W.shape[1]
+        output_rank = len(graph.shape_dict.get(parent.outputs[0], ()))
+        if len(b.shape) > 1 and len(b.shape) > output_rank:
+            return False
+        return b.size == 1 or (b.size == n and b.shape[-1] == n)
+
+    def merge(self, graph, nodes):  # type: (Graph, Sequence[Node]) -> Sequence[Node]
+        parent, child = nodes[0], nodes[1]
+        W = parent.input_tensors[parent.inputs[1]]
+        n = W.shape[0] if parent.attrs.get('transB', 0) else W.shape[1]
+        bias_name = _get_other_input(child, parent.outputs[0])
+        b = np.broadcast_to(child.input_tensors[bias_name].flatten(), (n,))
+
+        if parent.op_type == 'Gemm':
+            beta = parent.attrs.get('beta', 1.0)
+            if len(parent.inputs) > 2 and parent.inputs[2] != '' and beta != 0:
+                b = beta * parent.input_tensors[parent.inputs[2]] + b
+                bias_name = graph.get_unique_edge_name(parent.name + '_bias')
+                parent.inputs[2] = bias_name
+            else:
+                parent.inputs = parent.inputs[:2] + [bias_name]
+            parent.attrs['beta'] = 1.0
+        else:
+            parent.inputs.append(bias_name)
+        parent.input_tensors[bias_name] = np.array(b, dtype=np.float32)
+
+        parent.outputs = child.outputs
+        parent.children.remove(child)
+        child.parents.remove(parent)
+        return [parent]
+
+class ChannelMatMulToConv(NodesFuser):
+    '''
+    Replaces Transpose -> MatMul -> Transpose, where the MatMul multiplies the channel axis
+    of a 4-D (N, C, H, W) tensor with constant weights and the second Transpose restores
+    the layout, by a 1x1 Conv. The channels are moved either to the last axis, with the
+    weights on the right (x @ W), or to the second to last axis, with the weights on
+    the left (W @ x).
+    '''
+    def __init__(self):  # type: () -> None
+        super(ChannelMatMulToConv, self).__init__(3)
+
+    @staticmethod
+    def _weights(matmul):  # type: (Node) -> Any
+        '''
+        Returns (data index, weights as (C_out, C_in)) or None.
+        '''
+        if len(matmul.inputs) == 3 and matmul.inputs[2] in matmul.input_tensors and \
+                matmul.inputs[1] in matmul.input_tensors:
+            # bias fused by MatMulAddFuser, weights on the right
+            W = matmul.input_tensors[matmul.inputs[1]]
+            return (0, W if matmul.attrs.get('transB', 0) else W.T) if len(W.shape) == 2 else None
+        if len(matmul.inputs) != 2:
+            return None
+        for index in (0, 1):
+            W = matmul.input_tensors.get(matmul.inputs[1 - index], None)
+            if W is None or len(W.shape) != 2 or matmul.inputs[index] in matmul.input_tensors:
+                continue
+            if index == 0:
+                return None if matmul.attrs.get('transA', 0) else (0, W if matmul.attrs.get('transB', 0) else W.T)
+            return None if matmul.attrs.get('transB', 0) else (1, W.T if matmul.attrs.get('transA', 0) else W)
+        return None
+
+    def is_eligible(self, graph, nodes):  # type: (Graph, Sequence[Node]) -> bool
+        first, matmul, last = nodes
+        if first.op_type != 'Transpose' or matmul.op_type != 'MatMul' or last.op_type != 'Transpose':
+            return False
+        graph_outputs = set(o[0] for o in graph.outputs)
+        if first.outputs[0] in graph_outputs or matmul.outputs[0] in graph_outputs:
+            return False
+        params = self._weights(matmul)
+        if params is None or matmul.inputs[params[0]] != first.outputs[0]:
+            return False
+        p1, p2 = list(first.attrs.get('perm', [])), list(last.attrs.get('perm', []))
+        if len(p1) != 4 or len(p2) != 4 or p1[0] != 0:
+            return False
+        # channels on the contracted axis of x: last for x @ W, second to last for W @ x
+        if p1[3 - params[0]] != 1:
+            return False
+        if [p1[p] for p in p2] != [0, 1, 2, 3]:
+            return False
+        shape = graph.shape_dict.get(first.inputs[0], None)
+        return shape is None or (len(shape) == 4 and shape[1] == params[1].shape[1])
+
+    def merge(self, graph, nodes):  # type: (Graph, Sequence[Node]) -> Sequence[Node]
+        first, matmul, last = nodes
+        _, W = self._weights(matmul)
+        weight_name = graph.get_unique_edge_name(matmul.name + '_weight')
+        conv = Node(matmul.name, 'Conv', {'kernel_shape': [1, 1]}, [first.inputs[0], weight_name], last.outputs)
+        conv.input_tensors[weight_name] = W.reshape(W.shape + (1, 1)).astype(np.float32)
+        if len(matmul.inputs) == 3:
+            conv.inputs.append(matmul.inputs[2])
+            conv.input_tensors[matmul.inputs[2]] = matmul.input_tensors[matmul.inputs[2]].flatten()
+        return [conv]
+
 class DropoutRemover(NodesFuser):
     '''
     Removes Dropout layer
     '''
+    removed_op_types = ('Dropout',)
+
     def __init__(self):  # type: () -> None
         super(DropoutRemover, self).__init__(2)
 
@@ -244,6 +624,7 @@ class ReshapeInitTensorFuser(object):
     Fuses Reshape operator if it is used only to reshape blob in
     graph initializer. We can reshape here instead of runtime.
     '''
+    constant_folded_op_types = ('Reshape',)
 
     def __call__(self, graph):  # type: (Graph) -> Graph
         nodes = graph.nodes
@@ -549,6 +930,8 @@ class ConstantsToInitializers(object):
     '''
     Takes onnx Constant nodes and puts the tensor into graph initializers instead.
     '''
+    removed_op_types = ('Constant',)
+
     def __call__(self, graph):  # type: (Graph) -> Graph
         output_names = [str(output_[0]) for output_ in graph.outputs]
         nodes_to_be_removed = []
@@ -571,6 +954,8 @@ class ConstantFillToInitializers(object):
     '''
     Takes onnx ConstantFill nodes and puts the tensor into graph initializers instead, for simple cases only.
     '''
+    removed_op_types = ('ConstantFill',)
+
     def __call__(self, graph):  # type: (Graph) -> Graph
         output_names = [str(output_[0]) for output_ in graph.outputs]
         nodes_to_be_removed = []
@@ -628,6 +1013,7 @@ class ImageScalerRemover(object):
     '''
     Removes ImageScaler layer if connected to a model input and single parent child nodes
     '''
+    removed_op_types = ('ImageScaler',)
 
     def __call__(self, graph):  # type: (Graph) -> Graph
         input_names = [str(input_[0]) for input_ in graph.inputs]
@@ -649,10 +1035,136 @@ class ImageScalerRemover(object):
                 transformed_nodes.append(node)
         return Graph(transformed_nodes, graph.inputs, graph.outputs, graph.shape_dict)
 
+class InputNormalizationFolder(object):
+    '''
+    Folds a chain of per-channel Add, Sub, Mul, Div (and Affine) ops applied to a 4-D
+    model input, e.g. (x - mean) / std, so that it does not run as full-tensor layers.
+    If the input is an image input and the scale is the same for all channels, the chain
+    becomes an ImageScaler node, later turned into CoreML preprocessing parameters.
+    Otherwise, if all the consumers of the normalized tensor are convolutions with
+    constant weights, the chain is folded into their weights and bias.
+    '''
+    def __init__(self, image_input_names=()):  # type: (Sequence[Text]) -> None
+        self.image_input_names = list(image_input_names)
+
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = list(graph.nodes)
+        graph_outputs = set(output[0] for output in graph.outputs)
+        for input_ in graph.inputs:
+            x = str(input_[0])
+            shape = graph.shape_dict.get(x, input_[2])
+            if len(shape) != 4 or not isinstance(shape[1], int) or shape[1] <= 0:
+                continue
+            consumers = _get_consumers(nodes)
+            chain, scale, bias = self._match_chain(graph, consumers, x, shape[1])
+            if len(chain) == 0:
+                continue
+            y = chain[-1].outputs[0]
+            if x in self.image_input_names and len(consumers[x]) == 1 and shape[1] in (1, 3) and \
+                    np.all(scale == scale[0]) and y not in graph_outputs:
+                scaler = Node(chain[-1].name, 'ImageScaler',
+                              {'scale': float(scale[0]), 'bias': [float(b) for b in bias]}, [x], [y])
+                nodes[nodes.index(chain[-1])] = scaler
+            else:
+                convs = consumers.get(y, [])
+                if y in graph_outputs or len(convs) == 0 or \
+                        not all(self._is_foldable_conv(conv, y, shape[1], bias) for conv in convs):
+                    continue
+                for conv in convs:
+                    self._fold_into_conv(conv, x, scale, bias)
+                nodes.remove(chain[-1])
+            for node in chain[:-1]:
+                nodes.remove(node)
+        _print_node_count(self, len(graph.nodes), len(nodes))
+        _connect_nodes(nodes)
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    @staticmethod
+    def _channel_params(graph, node, x, channels):  # type: (Graph, Node, Text, int) -> Any
+        '''
+        Returns (scale, bias) if node computes scale * x + bias with per-channel vectors,
+        None otherwise.
+        '''
+        if node.op_type == 'Affine':
+            if node.inputs[0] != x:
+                return None
+            return np.full(channels, node.attrs.get('alpha', 1.0)), np.full(channels, node.attrs.get('beta', 0.0))
+        if node.op_type not in ('Add', 'Sub', 'Mul', 'Div') or len(node.inputs) != 2 or \
+                len(node.outputs) != 1 or x not in node.inputs:
+            return None
+        c_name = _get_other_input(node, x)
+        if c_name is None or c_name not in node.input_tensors:
+            return None
+        c = node.input_tensors[c_name].astype(np.float64)
+        # only scalars and (C, 1, 1) shaped constants, with optional leading ones
+        if len(c.shape) > 4 or (c.size != 1 and (len(c.shape) < 3 or c.shape[-3] != channels or c.size != channels)):
+            return None
+        c = np.full(channels, c.flatten()[0]) if c.size == 1 else c.flatten()
+        if node.op_type == 'Add':
+            return np.ones(channels), c
+        if node.op_type == 'Mul':
+            return c, np.zeros(channels)
+        if node.op_type == 'Sub':
+            return (np.ones(channels), -c) if node.inputs[0] == x else (-np.ones(channels), c)
+        if node.inputs[0] == x and np.all(c != 0):
+            return 1.0 / c, np.zeros(channels)
+        return None
+
+    def _match_chain(self, graph, consumers, x, channels):
+        # type: (Graph, Dict[Text, List[Node]], Text, int) -> Tuple[List[Node], Any, Any]
+        graph_outputs = set(output[0] for output in graph.outputs)
+        chain = []  # type: List[Node]
+        scale, bias = np.ones(channels), np.zeros(channels)
+        blob = x
+        while blob not in graph_outputs and len(consumers.get(blob, [])) == 1:
+            node = consumers[blob][0]
+            params = self._channel_params(graph, node, blob, channels)
+            if params is None:
+                break
+            # a * (scale * x + bias) + b
+            scale, bias = params[0] * scale, params[0] * bias + params[1]
+            chain.append(node)
+            blob = node.outputs[0]
+        return chain, scale, bias
+
+    @staticmethod
+    def _is_foldable_conv(conv, y, channels, bias):  # type: (Node, Text, int, Any) -> bool
+        if conv.op_type != 'Conv' or conv.inputs[0] != y or y in conv.inputs[1:]:
+            return False
+        for input_ in conv.inputs[1:]:
+            if input_ not in conv.input_tensors:
+                return False
+        W = conv.input_tensors[conv.inputs[1]]
+        if len(W.shape) != 4 or W.shape[1] * conv.attrs.get('group', 1) != channels:
+            return False
+        # zero padding happens after the normalization: it can only be folded if it maps 0 to 0
+        padded = any(conv.attrs.get('pads', [])) or conv.attrs.get('auto_pad', 'NOTSET') not in ('NOTSET', 'VALID')
+        return not padded or bool(np.all(bias == 0))
+
+    @staticmethod
+    def _fold_into_conv(conv, x, scale, bias):  # type: (Node, Text, Any, Any) -> None
+        W = conv.input_tensors[conv.inputs[1]]
+        group = conv.attrs.get('group', 1)
+        # input channel read by each (C_out, C_in / group) weight
+        channel = (np.arange(W.shape[0]) // (W.shape[0] // group))[:, None] * W.shape[1] + np.arange(W.shape[1])[None, :]
+        conv_bias = conv.input_tensors[conv.inputs[2]] if len(conv.inputs) > 2 else np.zeros(W.shape[0])
+        conv_bias = conv_bias + np.sum(W * bias[channel][:, :, None, None], axis=(1, 2, 3))
+        W = W * scale[channel][:, :, None, None]
+        if len(conv.inputs) > 2:
+            bias_input_name = conv.inputs[2]
+        else:
+            bias_input_name = "{}_bias".format(conv.name,)
+            conv.inputs.append(bias_input_name)
+        conv.input_tensors[conv.inputs[1]] = W.astype(np.float32)
+        conv.input_tensors[bias_input_name] = conv_bias.astype(np.float32)
+        conv.inputs[0] = x
+
 class UnsqueezeConstantRemover(object):
     '''
     Removes Unsqueeze or Squeeze op, if its input is constant
     '''
+    constant_folded_op_types = ('Unsqueeze', 'Squeeze')
+
     def __call__(self, graph):  # type: (Graph) -> Graph
         nodes_to_be_removed = []
         for node in graph.nodes:
@@ -683,6 +1195,8 @@ class ConcatConstantRemover(object):
     '''
     Removes Concat op, if its input is constant
     '''
+    constant_folded_op_types = ('Concat',)
+
     def __call__(self, graph):  # type: (Graph) -> Graph
         nodes_to_be_removed = []
         for node in graph.nodes:
@@ -713,6 +1227,8 @@ class TransposeConstantRemover(object):
     '''
     Removes Transpose op, if its input is constant
     '''
+    constant_folded_op_types = ('Transpose',)
+
     def __call__(self, graph):  # type: (Graph) -> Graph
         nodes_to_be_removed = []
         for node in graph.nodes:
@@ -736,6 +1252,8 @@ class SliceConstantRemover(object):
     '''
     Removes Slice op, if its input is constant
     '''
+    constant_folded_op_types = ('Slice',)
+
     def __call__(self, graph):  # type: (Graph) -> Graph
         nodes_to_be_removed = []
         for node in graph.nodes:
@@ -767,6 +1285,8 @@ class GatherConstantRemover(object):
     '''
     Removes Gather op, if its input is constant
     '''
+    constant_folded_op_types = ('Gather',)
+
     def __call__(self, graph):  # type: (Graph) -> Graph
         nodes_to_be_removed = []
         for node in graph.nodes:
@@ -793,6 +1313,8 @@ class DivMulConstantRemover(object):
     '''
     Removes Slice op, if its input is constant
     '''
+    constant_folded_op_types = ('Div', 'Mul')
+
     def __call__(self, graph):  # type: (Graph) -> Graph
         nodes_to_be_removed = []
         for node in graph.nodes:
@@ -814,3 +1336,970 @@ class DivMulConstantRemover(object):
                 transformed_nodes.append(node)
         return Graph(transformed_nodes, graph.inputs, graph.outputs, graph.shape_dict)
 
+
+class TransposeOptimizer(object):
+    '''
+    Sinks Transpose ops below elementwise, activation and broadcasting ops, so that
+    transposes meet each other and can be merged: two consecutive Transposes become a
+    single one, and are removed altogether when their permutations cancel out.
+    Constants feeding a broadcasting op are transposed instead of the data.
+    With the rank 5 mapping, which only translates constants of rank 3 or less, the
+    transposed constants must be scalars or hold one value per channel (the third
+    axis from the end).
+    '''
+    # ops applied to each element independently, other inputs must be scalar constants
+    _UNARY_OPS = {'Abs', 'Acos', 'Acosh', 'Asin', 'Asinh', 'Atan', 'Atanh', 'Cast', 'Ceil', 'Clip',
+                  'Cos', 'Cosh', 'Elu', 'Erf', 'Exp', 'Floor', 'HardSigmoid', 'Identity', 'IsNaN',
+                  'LeakyRelu', 'Log', 'Neg', 'Not', 'Reciprocal', 'Relu', 'Round', 'Selu',
+                  'Sigmoid', 'Sign', 'Sin', 'Sinh', 'Softplus', 'Softsign', 'Sqrt', 'Tan', 'Tanh',
+                  'ThresholdedRelu', 'Affine'}
+    # ops with multidirectional (numpy style) broadcasting
+    _BROADCAST_OPS = {'Add', 'And', 'Div', 'Equal', 'Greater', 'Less', 'Max', 'Mean', 'Min',
+                      'Mod', 'Mul', 'Or', 'Pow', 'PRelu', 'Sub', 'Sum', 'Where', 'Xor'}
+
+    def __init__(self,
+                 rank5_mapping=False,  # type: bool
+                 ):
+        # type: (...) -> None
+        self.rank5_mapping = rank5_mapping
+        self.num_removed = 0
+
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = list(graph.nodes)
+        num_transposes = len([n for n in nodes if n.op_type == 'Transpose'])
+        changed = True
+        while changed:
+            changed = False
+            for node in nodes:
+                if node.op_type != 'Transpose' or 'perm' not in node.attrs:
+                    continue
+                if self._merge(graph, nodes, node) or self._sink(graph, nodes, node):
+                    changed = True
+                    break
+
+        num_removed = num_transposes - len([n for n in nodes if n.op_type == 'Transpose'])
+        if num_removed > 0:
+            self.num_removed += num_removed
+            print('TransposeOptimizer: removed {} Transpose layers'.format(num_removed))
+        _connect_nodes(nodes)
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    def _merge(self, graph, nodes, node):  # type: (Graph, List[Node], Node) -> bool
+        '''
+        Merges the Transpose `node` with the Transpose producing its input, if any,
+        and removes it if its permutation is the identity.
+        '''
+        perm = list(node.attrs['perm'])
+        graph_outputs = set(output[0] for output in graph.outputs)
+        parent = _get_producers(nodes).get(node.inputs[0], None)
+        if parent is not None and parent.op_type == 'Transpose' and 'perm' in parent.attrs:
+            parent_perm = parent.attrs['perm']
+            perm = [parent_perm[p] for p in perm]
+            node.inputs = [parent.inputs[0]]
+            node.attrs['perm'] = perm
+            if parent.inputs[0] in parent.input_tensors:
+                node.input_tensors[parent.inputs[0]] = parent.input_tensors[parent.inputs[0]]
+            if len(_get_consumers(nodes).get(parent.outputs[0], [])) == 0 and \
+                    parent.outputs[0] not in graph_outputs:
+                nodes.remove(parent)
+            if perm != list(range(len(perm))):
+                return True
+        if perm == list(range(len(perm))):
+            return _bypass_node(graph, nodes, node)
+        return False
+
+    def _sink(self, graph, nodes, node):  # type: (Graph, List[Node], Node) -> bool
+        '''
+        Swaps the Transpose `node` with the elementwise op consuming its output:
+        op(transpose(x), c) becomes transpose(op(x, transpose^-1(c))).
+        Other inputs of the op must be constants or Transposes with the same permutation.
+        '''
+        perm = list(node.attrs['perm'])
+        rank = len(perm)
+        inverse_perm = list(np.argsort(perm))
+        graph_outputs = set(output[0] for output in graph.outputs)
+        consumers = _get_consumers(nodes)
+        producers = _get_producers(nodes)
+        output = node.outputs[0]
+        if output in graph_outputs or len(consumers.get(output, [])) != 1:
+            return False
+        op = consumers[output][0]
+        if op.op_type not in self._UNARY_OPS and op.op_type not in self._BROADCAST_OPS:
+            return False
+        if len(op.outputs) != 1 or 'axis' in op.attrs or 'broadcast' in op.attrs:
+            return False
+
+        new_inputs = []  # type: List[Text]
+        new_tensors = {}  # type: Dict[Text, np._ArrayLike[Any]]
+        transposes = []  # type: List[Node]
+        for input_ in op.inputs:
+            if input_ == output:
+                new_inputs.append(node.inputs[0])
+                if node.inputs[0] in node.input_tensors:
+                    new_tensors[node.inputs[0]] = node.input_tensors[node.inputs[0]]
+            elif input_ == '':
+                new_inputs.append(input_)
+            elif input_ in op.input_tensors:
+                x = op.input_tensors[input_]
+                if x.size == 1:
+                    new_inputs.append(input_)
+                    continue
+                if op.op_type not in self._BROADCAST_OPS or len(x.shape) > rank:
+                    return False
+                x = np.transpose(x.reshape((1,) * (rank - len(x.shape)) + x.shape), inverse_perm)
+                if self.rank5_mapping:
+                    if rank < 3 or any(d != 1 for i, d in enumerate(x.shape) if i != rank - 3):
+                        return False
+                    # (C,1,1) broadcasts like (1,C,1,1) and maps to [C,H,W]
+                    x = x.reshape(x.shape[rank - 3:])
+                name = graph.get_unique_edge_name(input_ + '_transposed')
+                new_inputs.append(name)
+                new_tensors[name] = x
+            elif input_ in producers and producers[input_].op_type == 'Transpose' and \
+                    list(producers[input_].attrs.get('perm', [])) == perm:
+                transpose = producers[input_]
+                new_inputs.append(transpose.inputs[0])
+                if transpose.inputs[0] in transpose.input_tensors:
+                    new_tensors[transpose.inputs[0]] = transpose.input_tensors[transpose.inputs[0]]
+                transposes.append(transpose)
+            else:
+                return False
+
+        new_output = graph.get_unique_edge_name(op.outputs[0] + '_transposed')
+        if op.outputs[0] in graph.shape_dict:
+            shape = graph.shape_dict[op.outputs[0]]
+            if len(shape) == rank:
+                graph.shape_dict[new_output] = tuple(shape[p] for p in inverse_perm)
+        op.inputs = new_inputs
+        op.input_tensors.update(new_tensors)
+        node.inputs = [new_output]
+        node.outputs = [op.outputs[0]]
+        op.outputs = [new_output]
+        nodes.remove(node)
+        nodes.insert(nodes.index(op) + 1, node)
+
+        consumers = _get_consumers(nodes)
+        for transpose in transposes:
+            if transpose in nodes and transpose.outputs[0] not in graph_outputs and \
+                    len(consumers.get(transpose.outputs[0], [])) == 0:
+                nodes.remove(transpose)
+        return True
+
+def _get_scalar_constant(node, input_name):  # type: (Node, Text) -> Any
+    '''
+    Returns the value of a constant input holding a single element, None otherwise.
+    '''
+    if input_name not in node.input_tensors or node.input_tensors[input_name].size != 1:
+        return None
+    return float(node.input_tensors[input_name].flatten()[0])
+
+
+def _get_only_consumer(graph, consumers, node, op_types):
+    # type: (Graph, Dict[Text, List[Node]], Node, Optional[Sequence[Text]]) -> Any
+    '''
+    Returns the node consuming the output of `node`, if it is the only consumer of
+    that output, the output is not a graph output and the consumer type is in op_types
+    (any type if op_types is None).
+    '''
+    output = node.outputs[0]
+    if output in [o[0] for o in graph.outputs] or len(consumers.get(output, [])) != 1:
+        return None
+    consumer = consumers[output][0]
+    return consumer if op_types is None or consumer.op_type in op_types else None
+
+
+def _get_other_input(node, input_name):  # type: (Node, Text) -> Any
+    '''
+    For a node with two inputs, returns the input that is not `input_name`.
+    '''
+    if len(node.inputs) != 2 or input_name not in node.inputs:
+        return None
+    return node.inputs[1] if node.inputs[0] == input_name else node.inputs[0]
+
+
+class LayerNormFuser(object):
+    '''
+    Fuses the decomposed layer normalization exported by most frameworks:
+
+        mean = ReduceMean(x), d = x - mean
+        var = ReduceMean(Pow(d, 2)) (or d * d)
+        y = d / Sqrt(var + epsilon) (or d * Reciprocal(Sqrt(var + epsilon)))
+        y = y * gamma + beta (optional)
+
+    into a single LayerNormalization op, when the reduced axes are the last axes of x.
+    '''
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = list(graph.nodes)
+        for node in graph.nodes:
+            if node.op_type == 'ReduceMean' and node in nodes:
+                self._fuse(graph, nodes, node)
+        _connect_nodes(nodes)
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    @staticmethod
+    def _reduce_axes(node):  # type: (Node) -> Any
+        if node.attrs.get('keepdims', 1) != 1:
+            return None
+        if 'axes' in node.attrs:
+            return list(node.attrs['axes'])
+        if len(node.inputs) > 1 and node.inputs[1] in node.input_tensors:
+            return [int(a) for a in node.input_tensors[node.inputs[1]].flatten()]
+        return None
+
+    def _fuse(self, graph, nodes, mean):  # type: (Graph, List[Node], Node) -> bool
+        graph_outputs = set(output[0] for output in graph.outputs)
+        consumers = _get_consumers(nodes)
+
+        def only_consumer(node, op_types):  # type: (Node, Tuple[Text, ...]) -> Any
+            return _get_only_consumer(graph, consumers, node, op_types)
+
+        x = mean.inputs[0]
+        axes = self._reduce_axes(mean)
+        if axes is None or x not in graph.shape_dict:
+            return False
+        shape = graph.shape_dict[x]
+        rank = len(shape)
+        axes = sorted([a + rank if a < 0 else a for a in axes])
+        if len(axes) == 0 or axes != list(range(rank - len(axes), rank)):
+            return False
+        normalized_shape = tuple(shape[rank - len(axes):])
+        if any(d <= 0 for d in normalized_shape):
+            return False
+
+        sub = only_consumer(mean, ('Sub',))
+        if sub is None or sub.inputs != [x, mean.outputs[0]]:
+            return False
+        d = sub.outputs[0]
+        if d in graph_outputs or len(consumers.get(d, [])) != 2:
+            return False
+        square = [n for n in consumers[d] if (n.op_type == 'Pow' and n.inputs[0] == d and
+                                              _get_scalar_constant(n, n.inputs[1]) == 2.0) or
+                  (n.op_type == 'Mul' and n.inputs == [d, d])]
+        if len(square) != 1:
+            return False
+        square = square[0]
+        var = only_consumer(square, ('ReduceMean',))
+        if var is None or var.inputs[0] != square.outputs[0] or self._reduce_axes(var) is None or \
+                sorted([a + rank if a < 0 else a for a in self._reduce_axes(var)]) != axes:
+            return False
+        add_eps = only_consumer(var, ('Add',))
+        if add_eps is None:
+            return False
+        epsilon = _get_scalar_constant(add_eps, _get_other_input(add_eps, var.outputs[0]))
+        if epsilon is None:
+            return False
+        sqrt = only_consumer(add_eps, ('Sqrt',))
+        if sqrt is None:
+            return False
+        normalize = only_consumer(sqrt, ('Div', 'Reciprocal'))
+        matched = [mean, sub, square, var, add_eps, sqrt]
+        if normalize is None:
+            return False
+        if normalize.op_type == 'Div':
+            if normalize.inputs != [d, sqrt.outputs[0]]:
+                return False
+        else:
+            matched.append(normalize)
+            normalize = only_consumer(normalize, ('Mul',))
+            if normalize is None or _get_other_input(normalize, matched[-1].outputs[0]) != d:
+                return False
+        matched.append(normalize)
+        if [n for n in consumers[d] if n not in matched]:
+            return False
+
+        gamma = np.ones(normalized_shape, dtype=np.float32)
+        beta = np.zeros(normalized_shape, dtype=np.float32)
+        last = normalize
+        for op_type in ('Mul', 'Add'):
+            affine = only_consumer(last, (op_type,))
+            if affine is None:
+                continue
+            param_name = _get_other_input(affine, last.outputs[0])
+            if param_name not in affine.input_tensors:
+                continue
+            param = affine.input_tensors[param_name]
+            # the parameter must only broadcast along the normalized axes
+            while len(param.shape) > 0 and param.shape[0] == 1 and len(param.shape) > len(normalized_shape):
+                param = param.reshape(param.shape[1:])
+            try:
+                param = np.broadcast_to(param, normalized_shape)
+            except ValueError:
+                continue
+            if len(param.shape) != len(normalized_shape):
+                continue
+            if op_type == 'Mul':
+                gamma = param
+                beta = beta * param
+            else:
+                beta = beta + param
+            matched.append(affine)
+            last = affine
+
+        name = last.name
+        scale_name = graph.get_unique_edge_name(name + '_scale')
+        bias_name = graph.get_unique_edge_name(name + '_bias')
+        layer_norm = Node(name, 'LayerNormalization', {'axis': rank - len(axes), 'epsilon': epsilon},
+                          [x, scale_name, bias_name], [last.outputs[0]])
+        layer_norm.input_tensors[scale_name] = np.array(gamma, dtype=np.float32)
+        layer_norm.input_tensors[bias_name] = np.array(beta, dtype=np.float32)
+        nodes[nodes.index(last)] = layer_norm
+        for node in matched[:-1]:
+            nodes.remove(node)
+        return True
+
+
+def _is_close(value, expected):  # type: (Any, float) -> bool
+    return value is not None and abs(value - expected) <= 1e-3 * abs(expected)
+
+
+class ActivationFuser(object):
+    '''
+    Fuses the elementwise decompositions of activations into a single op:
+
+    - GELU, x * 0.5 * (1 + Erf(x / sqrt(2))), into Gelu
+    - GELU tanh approximation, x * 0.5 * (1 + Tanh(sqrt(2 / pi) * (x + 0.044715 * x^3))),
+      into Gelu with approximate='tanh'
+    - HardSwish, x * HardSigmoid(x) or x * Clip(x + 3, 0, 6) / 6, into HardSwish
+    '''
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = list(graph.nodes)
+        for node in graph.nodes:
+            if node not in nodes:
+                continue
+            if node.op_type == 'Erf':
+                self._fuse_gelu(graph, nodes, node, self._match_erf_input)
+            elif node.op_type == 'Tanh':
+                self._fuse_gelu(graph, nodes, node, self._match_tanh_input)
+            elif node.op_type in ('HardSigmoid', 'Add'):
+                self._fuse_hard_swish(graph, nodes, node)
+        _connect_nodes(nodes)
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    @staticmethod
+    def _producer(graph, nodes, blob, op_types):  # type: (Graph, List[Node], Text, Sequence[Text]) -> Any
+        '''
+        The node computing `blob`, if it is used only once and has one of the op types.
+        '''
+        producer = _get_producers(nodes).get(blob, None)
+        if producer is None or producer.op_type not in op_types:
+            return None
+        if _get_only_consumer(graph, _get_consumers(nodes), producer, None) is None:
+            return None
+        return producer
+
+    def _match_erf_input(self, graph, nodes, erf):  # type: (Graph, List[Node], Node) -> Any
+        # x / sqrt(2) or x * (1 / sqrt(2))
+        node = self._producer(graph, nodes, erf.inputs[0], ('Div', 'Mul'))
+        if node is None or len(node.inputs) != 2:
+            return None
+        if node.op_type == 'Div':
+            if _is_close(_get_scalar_constant(node, node.inputs[1]), np.sqrt(2.0)):
+                return node.inputs[0], [node], b'none'
+            return None
+        for x, c in (node.inputs, node.inputs[::-1]):
+            if _is_close(_get_scalar_constant(node, c), np.sqrt(0.5)):
+                return x, [node], b'none'
+        return None
+
+    def _match_tanh_input(self, graph, nodes, tanh):  # type: (Graph, List[Node], Node) -> Any
+        # sqrt(2 / pi) * (x + 0.044715 * x^3)
+        scale = self._producer(graph, nodes, tanh.inputs[0], ('Mul',))
+        if scale is None or len(scale.inputs) != 2:
+            return None
+        for a, c in (scale.inputs, scale.inputs[::-1]):
+            if not _is_close(_get_scalar_constant(scale, c), np.sqrt(2.0 / np.pi)):
+                continue
+            add = self._producer(graph, nodes, a, ('Add',))
+            if add is None or len(add.inputs) != 2:
+                return None
+            for x, b in (add.inputs, add.inputs[::-1]):
+                cube_scale = self._producer(graph, nodes, b, ('Mul',))
+                if cube_scale is None or len(cube_scale.inputs) != 2:
+                    continue
+                for p, k in (cube_scale.inputs, cube_scale.inputs[::-1]):
+                    if not _is_close(_get_scalar_constant(cube_scale, k), 0.044715):
+                        continue
+                    cube = self._producer(graph, nodes, p, ('Pow',))
+                    if cube is not None and cube.inputs[0] == x and \
+                            _get_scalar_constant(cube, cube.inputs[1]) == 3.0:
+                        return x, [cube, cube_scale, add, scale], b'tanh'
+        return None
+
+    def _fuse_gelu(self, graph, nodes, node, match_input):
+        # type: (Graph, List[Node], Node, Any) -> bool
+        match = match_input(graph, nodes, node)
+        if match is None:
+            return False
+        x, matched, approximate = match
+        matched.append(node)
+        consumers = _get_consumers(nodes)
+
+        # 0.5 * x * (1 + f), whatever the order of the multiplications
+        add_one = _get_only_consumer(graph, consumers, node, ('Add',))
+        if add_one is None or not _is_close(_get_scalar_constant(
+                add_one, _get_other_input(add_one, node.outputs[0])), 1.0):
+            return False
+        matched.append(add_one)
+        mul = _get_only_consumer(graph, consumers, add_one, ('Mul',))
+        if mul is None:
+            return False
+        matched.append(mul)
+        other = _get_other_input(mul, add_one.outputs[0])
+        half = self._producer(graph, nodes, other, ('Mul',)) if other is not None else None
+        if other == x or _is_close(_get_scalar_constant(mul, other), 0.5):
+            last = _get_only_consumer(graph, consumers, mul, ('Mul',))
+            if last is None:
+                return False
+            expected = 0.5 if other == x else None
+            last_other = _get_other_input(last, mul.outputs[0])
+            if expected is None and last_other != x:
+                return False
+            if expected is not None and not _is_close(_get_scalar_constant(last, last_other), expected):
+                return False
+            matched.append(last)
+        elif half is not None and len(half.inputs) == 2 and x in half.inputs and \
+                _is_close(_get_scalar_constant(half, _get_other_input(half, x)), 0.5):
+            matched.insert(0, half)
+        else:
+            return False
+        self._replace(graph, nodes, matched, 'Gelu', {'approximate': approximate}, x)
+        return True
+
+    def _fuse_hard_swish(self, graph, nodes, node):  # type: (Graph, List[Node], Node) -> bool
+        consumers = _get_consumers(nodes)
+        if node.op_type == 'HardSigmoid':
+            # x * HardSigmoid(x, alpha=1/6, beta=0.5)
+            x = node.inputs[0]
+            if not _is_close(node.attrs.get('alpha', 0.2), 1.0 / 6) or not _is_close(node.attrs.get('beta', 0.5), 0.5):
+                return False
+            mul = _get_only_consumer(graph, consumers, node, ('Mul',))
+            if mul is None or _get_other_input(mul, node.outputs[0]) != x:
+                return False
+            self._replace(graph, nodes, [node, mul], 'HardSwish', {}, x)
+            return True
+
+        # x * Clip(x + 3, 0, 6) / 6, the division may happen before or after the multiplication
+        if len(node.inputs) != 2:
+            return False
+        x = None
+        for a, c in (node.inputs, node.inputs[::-1]):
+            if _is_close(_get_scalar_constant(node, c), 3.0):
+                x = a
+        clip = _get_only_consumer(graph, consumers, node, ('Clip',))
+        if x is None or clip is None:
+            return False
+        clip_min = clip.attrs.get('min', _get_scalar_constant(clip, clip.inputs[1]) if len(clip.inputs) > 1 else None)
+        clip_max = clip.attrs.get('max', _get_scalar_constant(clip, clip.inputs[2]) if len(clip.inputs) > 2 else None)
+        if clip_min != 0.0 or clip_max != 6.0:
+            return False
+        matched = [node, clip]
+        last = clip
+        found_mul, found_div = False, False
+        for _ in range(2):
+            n = _get_only_consumer(graph, consumers, last, ('Mul', 'Div'))
+            if n is None:
+                return False
+            other = _get_other_input(n, last.outputs[0])
+            if n.op_type == 'Mul' and other == x and not found_mul:
+                found_mul = True
+            elif n.op_type == 'Mul' and _is_close(_get_scalar_constant(n, other), 1.0 / 6) and not found_div:
+                found_div = True
+            elif n.op_type == 'Div' and n.inputs[0] == last.outputs[0] and \
+                    _is_close(_get_scalar_constant(n, other), 6.0) and not found_div:
+                found_div = True
+            else:
+                return False
+            matched.append(n)
+            last = n
+        self._replace(graph, nodes, matched, 'HardSwish', {}, x)
+        return True
+
+    @staticmethod
+    def _replace(graph, nodes, matched, op_type, attrs, x):
+        # type: (Graph, List[Node], List[Node], Text, Dict[Text, Any], Text) -> None
+        last = matched[-1]
+        fused = Node(last.name, op_type, attrs, [x], [last.outputs[0]])
+        nodes[nodes.index(last)] = fused
+        for node in matched[:-1]:
+            nodes.remove(node)
+
+
+class AttentionFuser(object):
+    '''
+    Simplifies the multi-head attention blocks exported by most frameworks:
+
+    - the Q, K and V projections, i.e. MatMuls (and bias Adds) sharing their input and
+      with constant weights, are fused into a single MatMul followed by a Split
+    - the scaling of the attention scores, MatMul(Q, K) / c, is folded into the
+      weights and bias of the Q (or K) projection
+    - a Transpose swapping the last two axes of a MatMul input is replaced by the
+      transA/transB attribute of the MatMul, which maps to the transpose flags of
+      CoreML batched_mat_mul
+    '''
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = list(graph.nodes)
+        for node in graph.nodes:
+            if node.op_type == 'MatMul' and node in nodes:
+                self._fold_scale(graph, nodes, node)
+                self._fold_transposes(graph, nodes, node)
+        for node in graph.nodes:
+            if node.op_type == 'MatMul' and node in nodes:
+                self._fuse_projections(graph, nodes, node.inputs[0])
+        _connect_nodes(nodes)
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    @staticmethod
+    def _projection(graph, nodes, blob):  # type: (Graph, List[Node], Text) -> Any
+        '''
+        Walks back from `blob` through Reshapes and Transposes to a MatMul with constant
+        weights, optionally followed by a bias Add. Returns (matmul, add) or None.
+        Every node on the way must only be used once.
+        '''
+        producers = _get_producers(nodes)
+        consumers = _get_consumers(nodes)
+        node = producers.get(blob, None)
+        while node is not None and node.op_type in ('Reshape', 'Transpose') and \
+                _get_only_consumer(graph, consumers, node, None) is not None:
+            node = producers.get(node.inputs[0], None)
+        if node is None or _get_only_consumer(graph, consumers, node, None) is None:
+            return None
+        add = None
+        if node.op_type == 'Add':
+            add = node
+            matmul = [producers[i] for i in node.inputs if i in producers and i not in node.input_tensors]
+            if len(matmul) != 1 or len(node.inputs) != 2 or \
+                    _get_other_input(node, matmul[0].outputs[0]) not in node.input_tensors:
+                return None
+            node = matmul[0]
+            if _get_only_consumer(graph, consumers, node, None) is None:
+                return None
+        if node.op_type != 'MatMul' or node.inputs[1] not in node.input_tensors:
+            return None
+        return node, add
+
+    def _fold_scale(self, graph, nodes, node):  # type: (Graph, List[Node], Node) -> bool
+        consumers = _get_consumers(nodes)
+        scale = _get_only_consumer(graph, consumers, node, ('Div', 'Mul'))
+        if scale is None or len(scale.inputs) != 2:
+            return False
+        other = _get_other_input(scale, node.outputs[0])
+        factor = _get_scalar_constant(scale, other)
+        if factor is None or factor == 0 or (scale.op_type == 'Div' and scale.inputs[1] != other):
+            return False
+        if scale.op_type == 'Div':
+            factor = 1.0 / factor
+
+        for input_ in node.inputs:
+            projection = self._projection(graph, nodes, input_)
+            if projection is None:
+                continue
+            for n in projection:
+                if n is None:
+                    continue
+                # the bias of an Add, or the weights (and bias fused by MatMulAddFuser) of a MatMul
+                parameters = n.inputs if n.op_type == 'Add' else n.inputs[1:]
+                for name in [i for i in parameters if i in n.input_tensors]:
+                    scaled_name = graph.get_unique_edge_name(name + '_scaled')
+                    n.input_tensors[scaled_name] = (n.input_tensors[name] * factor).astype(np.float32)
+                    n.inputs = [scaled_name if i == name else i for i in n.inputs]
+            node.outputs = scale.outputs
+            nodes.remove(scale)
+            return True
+        return False
+
+    def _fold_transposes(self, graph, nodes, node):  # type: (Graph, List[Node], Node) -> None
+        producers = _get_producers(nodes)
+        consumers = _get_consumers(nodes)
+        for i, flag in enumerate(('transA', 'transB')):
+            transpose = producers.get(node.inputs[i], None)
+            if transpose is None or transpose.op_type != 'Transpose' or \
+                    _get_only_consumer(graph, consumers, transpose, None) is None:
+                continue
+            perm = list(transpose.attrs.get('perm', []))
+            rank = len(perm)
+            if rank < 2 or perm != list(range(rank - 2)) + [rank - 1, rank - 2]:
+                continue
+            node.inputs[i] = transpose.inputs[0]
+            if transpose.inputs[0] in transpose.input_tensors:
+                node.input_tensors[transpose.inputs[0]] = transpose.input_tensors[transpose.inputs[0]]
+            node.attrs[flag] = 1 - node.attrs.get(flag, 0)
+            nodes.remove(transpose)
+
+    def _fuse_projections(self, graph, nodes, x):  # type: (Graph, List[Node], Text) -> bool
+        graph_outputs = set(output[0] for output in graph.outputs)
+        consumers = _get_consumers(nodes)
+        projections = []  # type: List[Tuple[Node, Any, np._ArrayLike[Any], np._ArrayLike[Any]]]
+        for matmul in consumers.get(x, []):
+            if matmul.op_type != 'MatMul' or matmul.inputs[0] != x or matmul.inputs[1] not in matmul.input_tensors:
+                continue
+            W = matmul.input_tensors[matmul.inputs[1]]
+            if len(W.shape) != 2 or len(matmul.inputs) != 2 or matmul.attrs or matmul.outputs[0] in graph_outputs:
+                continue
+            if len(projections) > 0 and W.shape[0] != projections[0][2].shape[0]:
+                continue
+            add = _get_only_consumer(graph, consumers, matmul, ('Add',))
+            bias_name = _get_other_input(add, matmul.outputs[0]) if add is not None else None
+            if add is not None and (bias_name not in add.input_tensors or
+                                    add.input_tensors[bias_name].shape != (W.shape[1],)):
+                add = None
+            b = add.input_tensors[bias_name] if add is not None else np.zeros((W.shape[1],), dtype=np.float32)
+            projections.append((matmul, add, W, b))
+        if len(projections) < 2:
+            return False
+
+        first = projections[0][0]
+        name = first.name + '_fused'
+        weight_name = graph.get_unique_edge_name(name + '_weight')
+        bias_name = graph.get_unique_edge_name(name + '_bias')
+        matmul_output = graph.get_unique_edge_name(name + '_matmul')
+        bias_output = graph.get_unique_edge_name(name + '_add')
+        fused = Node(name, 'MatMul', {}, [x, weight_name], [matmul_output])
+        fused.input_tensors[weight_name] = np.concatenate([p[2] for p in projections], axis=1).astype(np.float32)
+        bias = Node(name + '_bias', 'Add', {}, [matmul_output, bias_name], [bias_output])
+        bias.input_tensors[bias_name] = np.concatenate([p[3] for p in projections]).astype(np.float32)
+        outputs = [(p[1] if p[1] is not None else p[0]).outputs[0] for p in projections]
+        split = Node(name + '_split', 'Split', {'axis': -1, 'split': [p[2].shape[1] for p in projections]},
+                     [bias_output], outputs)
+        if x in graph.shape_dict and len(graph.shape_dict[x]) > 0:
+            shape = tuple(graph.shape_dict[x][:-1]) + (fused.input_tensors[weight_name].shape[1],)
+            graph.shape_dict[matmul_output] = shape
+            graph.shape_dict[bias_output] = shape
+
+        position = min(nodes.index(p[0]) for p in projections)
+        for p in projections:
+            nodes.remove(p[0])
+            if p[1] is not None:
+                nodes.remove(p[1])
+        nodes[position:position] = [fused, bias, split]
+        return True
+
+
+def _print_node_count(transformer, before, after):  # type: (object, int, int) -> None
+    if before != after:
+        print('{}: {} nodes before, {} nodes after'.format(type(transformer).__name__, before, after))
+
+
+class DeadCodeEliminator(object):
+    '''
+    Removes the nodes none of whose outputs contribute to the graph outputs.
+    '''
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        needed = set(output[0] for output in graph.outputs)
+        kept_nodes = []  # type: List[Node]
+        for node in reversed(graph.nodes):
+            if any(output in needed for output in node.outputs):
+                kept_nodes.insert(0, node)
+                needed.update(node.inputs)
+        _print_node_count(self, len(graph.nodes), len(kept_nodes))
+        if len(kept_nodes) == len(graph.nodes):
+            return graph
+        _connect_nodes(kept_nodes)
+        return Graph(kept_nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+
+def _hashable(value):  # type: (Any) -> Any
+    '''
+    Converts an attribute value into something that can be used in a dict key,
+    or raises TypeError (e.g. for subgraphs).
+    '''
+    if isinstance(value, np.ndarray):
+        return ('ndarray', value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    hash(value)
+    return value
+
+
+class CommonSubexpressionEliminator(object):
+    '''
+    Merges nodes computing the same value: same op type, same inputs (including the values
+    of constant inputs) and same attributes. Consumers of a duplicate node read the outputs
+    of the first such node instead.
+    '''
+    _NONDETERMINISTIC_OPS = {'RandomNormal', 'RandomNormalLike', 'RandomUniform', 'RandomUniformLike',
+                             'Multinomial', 'Dropout'}
+
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        graph_outputs = set(output[0] for output in graph.outputs)
+        renamed = {}  # type: Dict[Text, Text]
+        seen = {}  # type: Dict[Any, List[Node]]
+        kept_nodes = []  # type: List[Node]
+        for node in graph.nodes:
+            node.inputs = [renamed.get(i, i) for i in node.inputs]
+            key = self._key(node)
+            duplicate = None
+            if key is not None and not any(output in graph_outputs for output in node.outputs):
+                for other in seen.get(key, []):
+                    if self._same_constants(node, other):
+                        duplicate = other
+                        break
+            if duplicate is not None:
+                for output, other_output in zip(node.outputs, duplicate.outputs):
+                    renamed[output] = other_output
+                continue
+            if key is not None:
+                seen.setdefault(key, []).append(node)
+            kept_nodes.append(node)
+        _print_node_count(self, len(graph.nodes), len(kept_nodes))
+        _connect_nodes(kept_nodes)
+        return Graph(kept_nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    def _key(self, node):  # type: (Node) -> Any
+        if node.op_type in self._NONDETERMINISTIC_OPS:
+            return None
+        try:
+            attrs = tuple(sorted((k, _hashable(v)) for k, v in node.attrs.items()))
+        except TypeError:
+            return None
+        constants = tuple((i, node.input_tensors[i].dtype.str, node.input_tensors[i].shape)
+                          for i in node.inputs if i in node.input_tensors)
+        return (node.op_type, tuple(node.inputs), tuple(o == '' for o in node.outputs), attrs, constants)
+
+    @staticmethod
+    def _same_constants(node, other):  # type: (Node, Node) -> bool
+        # constants are only compared by name in the key, the same name may hold
+        # different values once a transformer has folded something into it
+        for i in node.inputs:
+            if i in node.input_tensors and not np.array_equal(node.input_tensors[i], other.input_tensors[i]):
+                return False
+        return True
+
+
+class NoOpRemover(object):
+    '''
+    Removes the ops that return their (first) input unchanged, by making their consumers
+    read that input instead. Names of the graph outputs are preserved.
+    '''
+    # CoreML tensors are float, casting to a float type does nothing
+    _FLOAT_TYPES = {TensorProto.FLOAT, TensorProto.FLOAT16, TensorProto.DOUBLE}
+    # ops that are a no-op when given a single input
+    _VARIADIC_OPS = ('Concat', 'Sum', 'Max', 'Min', 'Mean')
+    removed_op_types = ('Identity', 'Dropout')
+
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = list(graph.nodes)
+        for node in graph.nodes:
+            if self._is_no_op(graph, nodes, node):
+                _bypass_node(graph, nodes, node)
+        _print_node_count(self, len(graph.nodes), len(nodes))
+        _connect_nodes(nodes)
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    def _has_same_shape(self, graph, node):  # type: (Graph, Node) -> bool
+        input_shape = graph.shape_dict.get(node.inputs[0], None)
+        output_shape = graph.shape_dict.get(node.outputs[0], None)
+        if input_shape is None or output_shape is None or len(input_shape) == 0:
+            return False
+        return tuple(input_shape) == tuple(output_shape) and all(d > 0 for d in input_shape)
+
+    def _constant_or_attr(self, node, attr, index):  # type: (Node, Text, int) -> Any
+        if attr in node.attrs:
+            return list(node.attrs[attr])
+        if len(node.inputs) > index and node.inputs[index] in node.input_tensors:
+            return [int(v) for v in node.input_tensors[node.inputs[index]].flatten()]
+        return None
+
+    def _is_no_op(self, graph, nodes, node):  # type: (Graph, List[Node], Node) -> bool
+        if len(node.inputs) == 0 or node.inputs[0] == '' or node.inputs[0] in node.input_tensors:
+            return False
+        if len(node.outputs) > 1:
+            # only Dropout has an optional output that may be left unused
+            if node.op_type != 'Dropout':
+                return False
+            consumers = _get_consumers(nodes)
+            graph_outputs = set(output[0] for output in graph.outputs)
+            if any(o != '' and (o in graph_outputs or len(consumers.get(o, [])) > 0) for o in node.outputs[1:]):
+                return False
+        op_type = node.op_type
+        if op_type in self.removed_op_types:
+            return True
+        if op_type == 'Cast':
+            return node.attrs.get('to', None) in self._FLOAT_TYPES
+        if op_type in self._VARIADIC_OPS:
+            return len(node.inputs) == 1
+        if op_type == 'Transpose':
+            perm = node.attrs.get('perm', None)
+            return perm is not None and list(perm) == list(range(len(perm)))
+        if op_type == 'Pad':
+            pads = self._constant_or_attr(node, 'pads', 1)
+            return pads is not None and all(p == 0 for p in pads)
+        if op_type == 'Tile':
+            repeats = self._constant_or_attr(node, 'repeats', 1)
+            return repeats is not None and all(r == 1 for r in repeats)
+        if op_type in ('Reshape', 'Expand', 'Flatten'):
+            return self._has_same_shape(graph, node)
+        if op_type == 'Slice':
+            # the steps input is optional, a runtime one may be negative and reverse the data
+            if len(node.inputs) > 4 and node.inputs[4] != '':
+                steps = self._constant_or_attr(node, 'steps', 4)
+                if steps is None or any(s != 1 for s in steps):
+                    return False
+            return self._has_same_shape(graph, node)
+        return False
+
+
+class ReshapeChainFuser(object):
+    '''
+    Collapses a chain of shape-only ops (Reshape, Flatten, Squeeze, Unsqueeze) into a single
+    Reshape to the final shape of the chain, or removes the chain if it does not change the shape.
+    The final shape must be fully known.
+    '''
+    _SHAPE_OPS = ('Reshape', 'Flatten', 'Squeeze', 'Unsqueeze')
+
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = list(graph.nodes)
+        producers = _get_producers(nodes)
+        consumers = _get_consumers(nodes)
+        for node in graph.nodes:
+            if node not in nodes or not self._is_shape_op(node):
+                continue
+            parent = producers.get(node.inputs[0], None)
+            if parent is not None and self._is_shape_op(parent) and \
+                    _get_only_consumer(graph, consumers, parent, self._SHAPE_OPS) is not None:
+                # not the start of a chain
+                continue
+            chain = [node]
+            while True:
+                child = _get_only_consumer(graph, consumers, chain[-1], self._SHAPE_OPS)
+                if child is None or not self._is_shape_op(child):
+                    break
+                chain.append(child)
+            self._collapse(graph, nodes, chain)
+        _print_node_count(self, len(graph.nodes), len(nodes))
+        _connect_nodes(nodes)
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    def _is_shape_op(self, node):  # type: (Node) -> bool
+        if node.op_type not in self._SHAPE_OPS or len(node.outputs) != 1:
+            return False
+        # parameters given as inputs must be constants
+        return all(i in node.input_tensors for i in node.inputs[1:])
+
+    def _collapse(self, graph, nodes, chain):  # type: (Graph, List[Node], List[Node]) -> None
+        if chain[0].inputs[0] in chain[0].input_tensors:
+            return
+        input_shape = graph.shape_dict.get(chain[0].inputs[0], None)
+        output_shape = graph.shape_dict.get(chain[-1].outputs[0], None)
+        if output_shape is None or len(output_shape) == 0 or any(d <= 0 for d in output_shape):
+            return
+        last = chain[-1]
+        if input_shape is not None and tuple(input_shape) == tuple(output_shape):
+            last.inputs = [chain[0].inputs[0]]
+            if _bypass_node(graph, nodes, last):
+                for node in chain[:-1]:
+                    nodes.remove(node)
+                return
+        elif len(chain) == 1:
+            return
+        shape_name = graph.get_unique_edge_name(last.name + '_shape')
+        reshape = Node(last.name, 'Reshape', {}, [chain[0].inputs[0], shape_name], [last.outputs[0]])
+        reshape.input_tensors[shape_name] = np.array(output_shape, dtype=np.int64)
+        nodes[nodes.index(last)] = reshape
+        for node in chain[:-1]:
+            nodes.remove(node)
+
+
+class AffineFuser(object):
+    '''
+    Replaces Add, Sub, Mul and Div of a tensor with a scalar constant by an Affine node
+    (y = alpha * x + beta, the experimental ONNX op), which is converted to a linear activation
+    instead of a constant loading layer and a broadcasting op. Chains of such ops are
+    merged into a single Affine node, and removed if they amount to the identity.
+    '''
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = list(graph.nodes)
+        graph_outputs = set(output[0] for output in graph.outputs)
+        producers = _get_producers(nodes)
+        consumers = _get_consumers(nodes)
+        for node in list(nodes):
+            params = self._affine_params(graph, node)
+            if params is None:
+                continue
+            x, alpha, beta = params
+            parent = producers.get(x, None)
+            if parent is not None and parent.op_type == 'Affine' and parent in nodes and \
+                    parent.outputs[0] not in graph_outputs and len(consumers.get(x, [])) == 1:
+                # alpha * (a * y + b) + beta
+                x = parent.inputs[0]
+                beta = alpha * parent.attrs.get('beta', 0.0) + beta
+                alpha = alpha * parent.attrs.get('alpha', 1.0)
+                nodes.remove(parent)
+            affine = Node(node.name, 'Affine', {'alpha': alpha, 'beta': beta}, [x], node.outputs)
+            nodes[nodes.index(node)] = affine
+            producers[node.outputs[0]] = affine
+            if alpha == 1.0 and beta == 0.0:
+                _bypass_node(graph, nodes, affine)
+        _print_node_count(self, len(graph.nodes), len(nodes))
+        _connect_nodes(nodes)
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    @staticmethod
+    def _affine_params(graph, node):  # type: (Graph, Node) -> Any
+        '''
+        Returns (x, alpha, beta) if node computes alpha * x + beta, None otherwise.
+        '''
+        if node.op_type == 'Affine':
+            return node.inputs[0], node.attrs.get('alpha', 1.0), node.attrs.get('beta', 0.0)
+        if node.op_type not in ('Add', 'Sub', 'Mul', 'Div') or len(node.inputs) != 2 or len(node.outputs) != 1:
+            return None
+        constants = [i for i in node.inputs if i in node.input_tensors]
+        if len(constants) != 1:
+            return None
+        c = _get_scalar_constant(node, constants[0])
+        x = _get_other_input(node, constants[0])
+        if c is None or x is None:
+            return None
+        # the constant must not broadcast x to a higher rank
+        rank = len(graph.shape_dict.get(x, ()))
+        if len(node.input_tensors[constants[0]].shape) > max(rank, 1):
+            return None
+        if node.op_type == 'Add':
+            return x, 1.0, c
+        if node.op_type == 'Mul':
+            return x, c, 0.0
+        if node.op_type == 'Sub':
+            return (x, 1.0, -c) if node.inputs[0] == x else (x, -1.0, c)
+        if node.inputs[0] == x and c != 0:
+            return x, 1.0 / c, 0.0
+        return None
+
+
+class SpatialReduceToGlobalPool(object):
+    '''
+    Replaces ReduceMean and ReduceMax over the H and W axes of a 4-D (N, C, H, W) tensor
+    by GlobalAveragePool and GlobalMaxPool, which are converted to pooling layers instead
+    of generic reductions. Without keepdims, the pooled (N, C, 1, 1) tensor is flattened
+    to (N, C).
+    '''
+    _POOL_TYPES = {'ReduceMean': 'GlobalAveragePool', 'ReduceMax': 'GlobalMaxPool'}
+
+    def __call__(self, graph):  # type: (Graph) -> Graph
+        nodes = list(graph.nodes)
+        for node in graph.nodes:
+            if node.op_type not in self._POOL_TYPES or len(node.outputs) != 1:
+                continue
+            shape = graph.shape_dict.get(node.inputs[0], ())
+            axes = self._reduce_axes(node)
+            if len(shape) != 4 or axes is None or sorted(a % 4 for a in axes) != [2, 3]:
+                continue
+            pool_type = self._POOL_TYPES[node.op_type]
+            if node.attrs.get('keepdims', 1):
+                nodes[nodes.index(node)] = Node(node.name, pool_type, {}, [node.inputs[0]], node.outputs)
+                continue
+            pooled = graph.get_unique_edge_name(node.outputs[0] + '_pooled')
+            graph.shape_dict[pooled] = tuple(shape[:2]) + (1, 1)
+            pool = Node(node.name, pool_type, {}, [node.inputs[0]], [pooled])
+            flatten = Node(node.name + '_flatten', 'Flatten', {'axis': 1}, [pooled], node.outputs)
+            index = nodes.index(node)
+            nodes[index:index + 1] = [pool, flatten]
+        _print_node_count(self, len(graph.nodes), len(nodes))
+        _connect_nodes(nodes)
+        return Graph(nodes, graph.inputs, graph.outputs, graph.shape_dict)
+
+    @staticmethod
+    def _reduce_axes(node):  # type: (Node) -> Any
+        if 'axes' in node.attrs:
+            return list(node.attrs['axes'])
+        if len(node.inputs) > 1 and node.inputs[1] in node.input_tensors:
+            return [int(a) for a in node.input_tensors[node.inputs[1]].flatten()]
+        return None
@@ -0,0 +1,56 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import contextlib
+import json
+import sys
+
+import click
+from onnx import onnx_pb
+from onnx_coreml import analyze, analyze_memory
+from typing import Text, IO
+
+
+@click.command(
+    help='report how the nodes of an ONNX model would be converted to CoreML, without converting it',
+    context_settings={
+        'help_option_names': ['-h', '--help']
+    }
+)
+@click.argument('onnx_model', type=click.File('rb'))
+@click.option('--disable-rank5-mapping', is_flag=True, default=False,
+              help='Analyze for a conversion with disable_coreml_rank5_mapping=True')
+@click.option('--add-custom-layers', is_flag=True, default=False,
+              help='Analyze for a conversion with add_custom_layers=True')
+@click.option('--infer-shapes', is_flag=True, default=False,
+              help='Run ONNX shape inference before reporting inputs without shapes')
+@click.option('--json', 'as_json', is_flag=True, default=False,
+              help='Print the report as JSON')
+@click.option('--memory', is_flag=True, default=False,
+              help='Report the size and live range of the activations of the converted model instead')
+def analyze_onnx_model(onnx_model, disable_rank5_mapping, add_custom_layers, infer_shapes, as_json, memory):
+    # type: (IO[str], bool, bool, bool, bool, bool) -> None
+    onnx_model_proto = onnx_pb.ModelProto()
+    onnx_model_proto.ParseFromString(onnx_model.read())
+    if memory:
+        # the graph transformations print their progress, keep stdout for the report
+        with contextlib.redirect_stdout(sys.stderr):
+            memory_report = analyze_memory(onnx_model_proto, disable_coreml_rank5_mapping=disable_rank5_mapping)
+        click.echo(json.dumps(memory_report.to_dict(), indent=2) if as_json else memory_report.summary())
+        return
+    report = analyze(onnx_model_proto,
+                     disable_coreml_rank5_mapping=disable_rank5_mapping,
+                     add_custom_layers=add_custom_layers,
+                     infer_shapes=infer_shapes)
+    if as_json:
+        click.echo(json.dumps(report.to_dict(), indent=2))
+    else:
+        click.echo(report.summary())
+    if not report.is_compatible:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    analyze_onnx_model()
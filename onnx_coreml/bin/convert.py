@@ -5,7 +5,7 @@ from __future__ import unicode_literals
 
 import click
 from onnx import onnx_pb
-from onnx_coreml import convert
+from onnx_coreml import ConversionSession
 from typing import Text, IO
 
 
@@ -19,11 +19,19 @@ from typing import Text, IO
 @click.option('-o', '--output', required=True,
               type=str,
               help='Output path for the CoreML *.mlmodel file')
-def onnx_to_coreml(onnx_model, output):  # type: (IO[str], str) -> None
+@click.option('--spec-only', is_flag=True, default=False,
+              help='Write the CoreML model spec without compiling the model '
+                   '(faster, and does not require macOS)')
+def onnx_to_coreml(onnx_model, output, spec_only):  # type: (IO[str], str, bool) -> None
     onnx_model_proto = onnx_pb.ModelProto()
     onnx_model_proto.ParseFromString(onnx_model.read())
-    coreml_model = convert(onnx_model_proto)
-    coreml_model.save(output)
+    with ConversionSession(cache_size=0) as session:
+        coreml_model = session.convert(onnx_model_proto, return_spec=spec_only)
+    if spec_only:
+        with open(output, 'wb') as f:
+            f.write(coreml_model.SerializeToString())
+    else:
+        coreml_model.save(output)
 
 
 if __name__ == '__main__':
@@ -4,6 +4,9 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from typing import Text, Union, Optional, Dict, Any, Iterable, Sequence, Callable, List
 
+import copy
+import json
+
 import onnx
 import numpy as np
 
@@ -17,7 +20,6 @@ from coremltools.proto import FeatureTypes_pb2 as ft  #type: ignore
 from typing import Tuple
 
 from ._operators import _convert_node, _SEQUENCE_LAYERS_REGISTRY, _ONNX_NODE_REGISTRY, _add_const_inputs_if_required
-from ._operators_nd import _ONNX_NODE_REGISTRY_ND, _convert_node_nd
 
 from ._graph import Graph, EdgeInfo, Transformer
 
@@ -26,14 +28,16 @@ from ._transformers import ConvAddFuser, DropoutRemover, \
     PixelShuffleFuser, OutputRenamer, AddModelInputsOutputs, \
     ConstantsToInitializers, ImageScalerRemover, UnsqueezeConstantRemover, TransposeConstantRemover, \
     ShapeOpRemover, SliceConstantRemover, ConcatConstantRemover, DivMulConstantRemover, GatherConstantRemover, \
-    ConstantFillToInitializers, ReshapeTransposeReshape_pattern1
+    ConstantFillToInitializers, ReshapeTransposeReshape_pattern1, TransposeOptimizer, \
+    BNFolder, LayerNormFuser, ActivationFuser, AttentionFuser, DeadCodeEliminator, CommonSubexpressionEliminator, \
+    NoOpRemover, ReshapeChainFuser, PadFolder, MatMulAddFuser, \
+    AffineFuser, InputNormalizationFolder, SpatialReduceToGlobalPool, ChannelMatMulToConv
 
 from ._error_utils import ErrorHandling
-from .graph_viz import plot_graph # type: ignore
 
-USE_SHAPE_MAPPING = True
+from ._memory import MemoryAwareScheduler
 
-DEBUG = True
+DEBUG = False
 
 '''
 inputs: list of tuples.
@@ -65,7 +69,7 @@ def _make_coreml_input_features(graph, onnx_coreml_input_shape_map, disable_core
                 features.append((str(input_[0]), datatypes.Array(*shape)))
             continue
 
-        if USE_SHAPE_MAPPING and input_[0] in onnx_coreml_input_shape_map:
+        if input_[0] in onnx_coreml_input_shape_map:
             mapp = onnx_coreml_input_shape_map[input_[0]]
             if len(mapp) != len(shape):
                 raise ValueError('Incorrect value in onnx_coreml_input_shape_map argument')
@@ -80,38 +84,31 @@ def _make_coreml_input_features(graph, onnx_coreml_input_shape_map, disable_core
                 shape = [1, 1, 1]
             elif len(shape) == 1:
                 # assume [C]
-                if USE_SHAPE_MAPPING:
-                    graph.onnx_coreml_shape_mapping[input_[0]] = [2]
+                graph.onnx_coreml_shape_mapping[input_[0]] = [2]
             elif len(shape) == 2:
                 # assume [Batch,C]
                 shape = [shape[1]]
-                if USE_SHAPE_MAPPING:
-                    graph.onnx_coreml_shape_mapping[input_[0]] = [1,2]
+                graph.onnx_coreml_shape_mapping[input_[0]] = [1,2]
             elif len(shape) == 3:
                 # assume [C,H,W] unless its connected an op that bestows another mapping
                 if input_[0] in op_types and len(op_types[input_[0]]) == 1:
                     if str(op_types[input_[0]][0]) in _SEQUENCE_LAYERS_REGISTRY:
                         # (Seq,B,C)
                         shape = [shape[2]]
-                        if USE_SHAPE_MAPPING:
-                            graph.onnx_coreml_shape_mapping[input_[0]] = [0, 1, 2]
+                        graph.onnx_coreml_shape_mapping[input_[0]] = [0, 1, 2]
                     elif str(op_types[input_[0]][0]) in ['MaxPool','AveragePool','BatchNormalization',
                                                          'GlobalAveragePool','GlobalLpPool','GlobalMaxPool',
                                                          'InstanceNormalization','LRN','LpPool','Conv','ConvTranspose']:
                         # (B,C,W)
                         shape = [shape[1],1,shape[2]]
-                        if USE_SHAPE_MAPPING:
-                            graph.onnx_coreml_shape_mapping[input_[0]] = [1, 2, 4]
+                        graph.onnx_coreml_shape_mapping[input_[0]] = [1, 2, 4]
                     else:
-                        if USE_SHAPE_MAPPING:
-                            graph.onnx_coreml_shape_mapping[input_[0]] = [2, 3, 4]
-                else:
-                    if USE_SHAPE_MAPPING:
                         graph.onnx_coreml_shape_mapping[input_[0]] = [2, 3, 4]
+                else:
+                    graph.onnx_coreml_shape_mapping[input_[0]] = [2, 3, 4]
             elif len(shape) == 4:  # (B,C,H,W) --> (C,H,W)
                 shape = shape[1:]
-                if USE_SHAPE_MAPPING:
-                    graph.onnx_coreml_shape_mapping[input_[0]] = [1,2,3,4]
+                graph.onnx_coreml_shape_mapping[input_[0]] = [1,2,3,4]
             else:
                 raise ValueError("CoreML input cannot be more than rank 4. Input shape: %s, input: '%s' " % (str(shape), str(input_[0])))
         features.append((str(input_[0]), datatypes.Array(*shape)))
@@ -157,8 +154,125 @@ def _make_coreml_output_features(graph, forceShape=False, disable_coreml_rank5_m
                 features.append((str(output_[0]), datatypes.Array(*shape)))
     return features
 
+'''
+Candidate mappings of the model inputs to the CoreML rank 5 (S,B,C,H,W) layout,
+tried by _optimize_input_shape_map in addition to the mapping given by the default heuristics.
+'''
+_SUPPORTED_IOS_DEPLOYMENT_TARGETS = ('12', '13', '14')
+
+# the layer converters raise TypeError or ValueError for configurations they cannot translate,
+# the rank 5 shape mapping code may also fail on unusual mappings with the other errors
+_INPUT_SHAPE_MAP_CANDIDATE_ERRORS = (TypeError, ValueError, KeyError, IndexError, AssertionError)
+
+_INPUT_SHAPE_MAP_CANDIDATES = {
+    2: [[1, 2], [0, 2], [2, 3], [3, 4], [2, 4]],
+    3: [[2, 3, 4], [0, 1, 2], [1, 2, 4], [1, 3, 4], [0, 3, 4]],
+    4: [[1, 2, 3, 4], [0, 2, 3, 4]],
+}  # type: Dict[int, List[List[int]]]
+
+def _convert_with_input_shape_map(graph, # type: Graph
+                                  onnx_coreml_input_shape_map, # type: Dict[Text, List[int]]
+                                  output_features, # type: Sequence[Tuple[Text, datatypes.Array]]
+                                  mode, # type: Optional[Text]
+                                  add_custom_layers, # type: bool
+                                  custom_conversion_functions, # type: Dict[Text, Any]
+                                  errors=(TypeError, ValueError), # type: Tuple[type, ...]
+                                  ):
+    # type: (...) -> Any
+    '''
+    Converts a copy of the graph in rank 5 mode with the given input mappings.
+    Returns (number of custom layers, number of permute layers, output mappings),
+    or None if the conversion fails with one of the given errors.
+    '''
+    graph = copy.deepcopy(graph)
+    err = ErrorHandling(add_custom_layers, custom_conversion_functions)
+    try:
+        input_features = _make_coreml_input_features(graph, onnx_coreml_input_shape_map)
+        builder = NeuralNetworkBuilder(input_features, output_features, mode=mode)
+        for node in graph.nodes:
+            _add_const_inputs_if_required(builder, node, graph, err)
+            _convert_node(builder, node, graph, err)
+    except errors:
+        return None
+    layer_types = [layer.WhichOneof('layer') for layer in builder.spec.neuralNetwork.layers]
+    output_mappings = [graph.onnx_coreml_shape_mapping.get(output_[0], None) for output_ in graph.outputs]
+    return layer_types.count('custom'), layer_types.count('permute'), output_mappings
+
+def _same_output_order(mappings, other_mappings):  # type: (List[Any], List[Any]) -> bool
+    '''
+    True if the outputs have the same mappings, up to increasing mappings which all
+    keep the ONNX order of the elements (e.g. [2,3,4] and [0,1,2]).
+    '''
+    for mapp, other in zip(mappings, other_mappings):
+        if mapp != other and (mapp is None or other is None or
+                              mapp != sorted(set(mapp)) or other != sorted(set(other))):
+            return False
+    return True
+
+def _optimize_input_shape_map(graph, # type: Graph
+                              onnx_coreml_input_shape_map, # type: Dict[Text, List[int]]
+                              fixed_input_names, # type: Sequence[Text]
+                              output_features, # type: Sequence[Tuple[Text, datatypes.Array]]
+                              mode, # type: Optional[Text]
+                              add_custom_layers, # type: bool
+                              custom_conversion_functions, # type: Dict[Text, Any]
+                              ):
+    # type: (...) -> Dict[Text, List[int]]
+    '''
+    Chooses the rank 5 mapping of the model inputs that minimizes the number of permute layers
+    of the converted model. The mappings of the other tensors follow from the input mappings
+    through the layer converters, so the inputs are the free variables of the layout: each input,
+    in turn, is tried with the candidate mappings of its rank while the others are kept.
+    A candidate is only kept if the conversion succeeds, without adding custom layers and without
+    changing the order of the elements of the model outputs. Inputs in onnx_coreml_input_shape_map or
+    fixed_input_names keep their mapping, and the default heuristics are used if no candidate is better.
+    '''
+    # start from the mappings given by the default heuristics
+    default_graph = copy.deepcopy(graph)
+    _make_coreml_input_features(default_graph, onnx_coreml_input_shape_map)
+    shape_map = dict(onnx_coreml_input_shape_map)
+    for input_ in graph.inputs:
+        if input_[0] not in shape_map and input_[0] not in fixed_input_names and \
+                len(input_[2]) in _INPUT_SHAPE_MAP_CANDIDATES:
+            shape_map[input_[0]] = default_graph.onnx_coreml_shape_mapping[input_[0]]
+    free_inputs = [name for name in shape_map if name not in onnx_coreml_input_shape_map]
+    if len(free_inputs) == 0:
+        return onnx_coreml_input_shape_map
+
+    baseline = _convert_with_input_shape_map(graph, shape_map, output_features, mode,
+                                             add_custom_layers, custom_conversion_functions)
+    # if the default mapping cannot be converted, the first candidate that can is kept
+    best = baseline
+    for name in free_inputs:
+        for mapp in _INPUT_SHAPE_MAP_CANDIDATES[len(shape_map[name])]:
+            if mapp == shape_map[name]:
+                continue
+            candidate_map = dict(shape_map)
+            candidate_map[name] = mapp
+            result = _convert_with_input_shape_map(graph, candidate_map, output_features, mode,
+                                                   add_custom_layers, custom_conversion_functions,
+                                                   _INPUT_SHAPE_MAP_CANDIDATE_ERRORS)
+            if result is not None and (best is None or
+                                       (result[0] <= best[0] and result[1] < best[1] and
+                                        _same_output_order(result[2], best[2]))):
+                best = result
+                shape_map = candidate_map
+
+    if best is None or best is baseline:
+        print('Input shape mapping: the default mapping is kept')
+        return onnx_coreml_input_shape_map
+    if baseline is None:
+        print('Input shape mapping: {} permute layers with {}, the default mapping cannot be converted'.format(
+            best[1], {name: shape_map[name] for name in free_inputs}))
+    else:
+        print('Input shape mapping: {} permute layers with the default mapping, {} with {} ({} eliminated)'.format(
+            baseline[1], best[1], {name: shape_map[name] for name in free_inputs}, baseline[1] - best[1]))
+    return shape_map
+
 def _check_unsupported_ops(nodes, disable_coreml_rank5_mapping=False): # type: (...) -> None
     unsupported_op_types = [] # type: List[Text]
+    if disable_coreml_rank5_mapping:
+        from ._operators_nd import _ONNX_NODE_REGISTRY_ND
     for node in nodes:
 
         if disable_coreml_rank5_mapping:
@@ -322,12 +436,118 @@ def _set_deprocessing(is_grayscale,  # type: bool
 def _prepare_onnx_graph(graph, transformers):  # type: (Graph, Iterable[Transformer]) -> Graph
     graph_ = Graph.from_onnx(graph)
     if DEBUG:
+        from .graph_viz import plot_graph # type: ignore
         plot_graph(graph_, graph_img_path='/tmp/graph_raw.pdf')
     graph_ = graph_.transformed(transformers)
     if DEBUG:
         plot_graph(graph_, graph_img_path='/tmp/graph_opt.pdf')
     return graph_
 
+# Using Dummy transformation to conditionally disable certain transformation
+class DummyTransformation(object):
+    def __call__(self, graph):
+        return graph
+
+def _graph_transformers(disable_coreml_rank5_mapping,  # type: bool
+                        image_input_names,  # type: List[Text]
+                        preprocessing_args,  # type: Dict[Text, Any]
+                        ):
+    # type: (...) -> List[Transformer]
+    '''
+    The optimizations applied to the ONNX graph, in order, in preparation for conversion to CoreML.
+    '''
+    return [
+        ConstantsToInitializers(),
+        DeadCodeEliminator(),
+        CommonSubexpressionEliminator(),
+        NoOpRemover(),
+        ShapeOpRemover(),
+        ReshapeInitTensorFuser(),
+        DropoutRemover(),
+        UnsqueezeConstantRemover(),
+        TransposeConstantRemover(),
+        TransposeOptimizer(rank5_mapping=not disable_coreml_rank5_mapping),
+        SliceConstantRemover(),
+        ConcatConstantRemover(),
+        PadFolder(),
+        ConvAddFuser(),
+        BNBroadcastedMulFuser(),
+        BNBroadcastedAddFuser(),
+        BNFolder(),
+        # user provided preprocessing parameters take precedence over the ones found in the graph
+        InputNormalizationFolder(image_input_names if not preprocessing_args else []),
+        ReshapeTransposeReshape_pattern1(),
+        PixelShuffleFuser(),
+        AddModelInputsOutputs() if not disable_coreml_rank5_mapping else DummyTransformation(),
+        DivMulConstantRemover(),
+        GatherConstantRemover(),
+        LayerNormFuser() if disable_coreml_rank5_mapping else DummyTransformation(),
+        ActivationFuser() if disable_coreml_rank5_mapping else DummyTransformation(),
+        AttentionFuser() if disable_coreml_rank5_mapping else DummyTransformation(),
+        MatMulAddFuser(),
+        ChannelMatMulToConv(),
+        AffineFuser(),
+        SpatialReduceToGlobalPool(),
+        ReshapeChainFuser() if disable_coreml_rank5_mapping else DummyTransformation(),
+        ConstantFillToInitializers(),
+    ]
+
+def _prepare_graph_for_conversion(onnx_model,  # type: onnx.ModelProto
+                                  disable_coreml_rank5_mapping,  # type: bool
+                                  image_input_names,  # type: List[Text]
+                                  preprocessing_args,  # type: Dict[Text, Any]
+                                  ):
+    # type: (...) -> Graph
+    '''
+    Returns the graph whose nodes are converted, in the order their layers are added, by convert().
+    The preprocessing parameters of the ImageScaler nodes found in the graph are added to
+    image_input_names and preprocessing_args (if empty), which are modified in place.
+    '''
+    transformers = _graph_transformers(disable_coreml_rank5_mapping, image_input_names, preprocessing_args)
+
+    onnx_model = onnx.shape_inference.infer_shapes(onnx_model)
+    graph = _prepare_onnx_graph(onnx_model.graph, transformers)
+
+    '''
+    Check for ImageScalar nodes in ONNX, this will indicate whether input image preprocessing needs
+    to be added to the CoreML graph or not. 
+    '''
+    # are there ImageScaler nodes in the Graph?
+    # If yes then add the info from it to the "preprocessing_args" dictionary, if the dictionary is not
+    # already provided by the user
+    if not bool(preprocessing_args):
+        for node in graph.nodes:
+            if node.op_type == 'ImageScaler':
+                inp_name = node.inputs[0]
+                scale = node.attrs.get('scale', 1.0)
+                bias = node.attrs.get('bias', [0,0,0])
+                if not (len(bias) == 1 or len(bias) == 3):
+                    continue
+                if 'image_scale' in preprocessing_args:
+                    preprocessing_args['image_scale'][inp_name] = scale
+                else:
+                    preprocessing_args['image_scale'] = {inp_name: scale}
+                if len(bias) == 3:
+                    for i, color in enumerate(['red', 'green', 'blue']):
+                        if color + '_bias' in preprocessing_args:
+                            preprocessing_args[color + '_bias'][inp_name] = bias[i]
+                        else:
+                            preprocessing_args[color + '_bias'] = {inp_name: bias[i]}
+                else:
+                    if 'gray_bias' in preprocessing_args:
+                        preprocessing_args['gray_bias'][inp_name] = bias[0]
+                    else:
+                        preprocessing_args['gray_bias'] = {inp_name: bias[0]}
+                if inp_name not in image_input_names:
+                    image_input_names.append(inp_name)
+
+    # remove all ImageScaler ops
+    graph = graph.transformed([ImageScalerRemover()])
+
+    # layers are emitted in the order of graph.nodes
+    graph = MemoryAwareScheduler()(graph)
+    return graph
+
 def convert(model,  # type: Union[onnx.ModelProto, Text]
             mode=None,  # type: Optional[Text]
             image_input_names=[],  # type: Sequence[Text]
@@ -339,8 +559,12 @@ def convert(model,  # type: Union[onnx.ModelProto, Text]
             add_custom_layers = False,  # type: bool
             custom_conversion_functions = {}, #type: Dict[Text, Any]
             onnx_coreml_input_shape_map = {}, # type: Dict[Text, List[int,...]]
-            disable_coreml_rank5_mapping = False):
-    # type: (...) -> MLModel
+            disable_coreml_rank5_mapping = False,
+            return_spec = False, # type: bool
+            optimize_input_shape_mapping = False, # type: bool
+            minimum_ios_deployment_target = '13', # type: Text
+            ):
+    # type: (...) -> Union[MLModel, Any]
     """
     Convert ONNX model to CoreML.
     Parameters
@@ -387,11 +611,34 @@ def convert(model,  # type: Union[onnx.ModelProto, Text]
         Thus, no longer, onnx tensors are forced to map to rank 5 CoreML tensors.
         With this flag on, a rank r ONNX tensor, (1<=r<=5), will map to a rank r tensor in CoreML as well.
         This flag must be on to utilize any of the new layers added in CoreML 3 (i.e. specification version 4, iOS13)
+    return_spec: bool
+        If True, the CoreML model spec (protobuf message) is returned without building an MLModel,
+        which compiles the model. This is faster and works on any platform. The spec can be
+        written to disk with coremltools.utils.save_spec or spec.SerializeToString().
+    optimize_input_shape_mapping: bool
+        If True, the mapping of the model inputs that are not in "onnx_coreml_input_shape_map" (and are
+        not image inputs) is chosen to minimize the number of permute layers of the converted model,
+        by converting it with several candidate mappings. This changes the interface of the model: the
+        shape of the CoreML input features, and so the arrays callers have to feed, follows the chosen
+        mappings. The order of the elements of the inputs and outputs is not changed, only how their axes
+        are spread over the CoreML (S,B,C,H,W) axes. When the mapping of an input is changed, the chosen
+        mappings are stored, as JSON, in the 'onnx_coreml_input_shape_map' key of the user defined metadata
+        of the model (spec.description.metadata.userDefined); passing them back as "onnx_coreml_input_shape_map"
+        gives the same model without the search.
+        This is ignored if "disable_coreml_rank5_mapping" is set to True.
+    minimum_ios_deployment_target: str
+        '12', '13' (default) or '14'. With '14', ops that can be converted to a layer added in CoreML 4
+        (i.e. specification version 5, iOS14), such as Gelu, use it instead of an equivalent chain of
+        layers available on iOS13, and the specification version of the model is raised accordingly.
 
     Returns
     -------
-    model: A coreml model.
+    model: A coreml model, or its spec if "return_spec" is True.
     """
+    if minimum_ios_deployment_target not in _SUPPORTED_IOS_DEPLOYMENT_TARGETS:
+        raise ValueError("minimum_ios_deployment_target must be one of {}".format(
+            ', '.join(_SUPPORTED_IOS_DEPLOYMENT_TARGETS)))
+
     if isinstance(model, Text):
         onnx_model = onnx.load(model)
     elif isinstance(model, onnx.ModelProto):
@@ -401,80 +648,13 @@ def convert(model,  # type: Union[onnx.ModelProto, Text]
             "Model must be file path to .onnx file or onnx loaded model"
         )
 
-    global USE_SHAPE_MAPPING
-    if disable_coreml_rank5_mapping:
-        USE_SHAPE_MAPPING = False
+    # convert() may run concurrently in several threads: never mutate module state or
+    # the caller's (possibly default) arguments, work on private copies instead.
+    image_input_names = list(image_input_names)
+    preprocessing_args = copy.deepcopy(preprocessing_args)
 
-
-    '''
-    First, apply a few optimizations to the ONNX graph,
-    in preparation for conversion to CoreML. 
-    '''
-
-    # Using Dummy transformation to conditionally disable certain transformation
-    class  DummyTransformation(object):
-        def __call__(self, graph):
-            return graph
-
-    transformers = [
-        ConstantsToInitializers(),
-        ShapeOpRemover(),
-        ReshapeInitTensorFuser(),
-        DropoutRemover(),
-        UnsqueezeConstantRemover(),
-        TransposeConstantRemover(),
-        SliceConstantRemover(),
-        ConcatConstantRemover(),
-        ConvAddFuser(),
-        BNBroadcastedMulFuser(),
-        BNBroadcastedAddFuser(),
-        ReshapeTransposeReshape_pattern1(),
-        PixelShuffleFuser(),
-        AddModelInputsOutputs() if not disable_coreml_rank5_mapping else DummyTransformation(),
-        DivMulConstantRemover(),
-        GatherConstantRemover(),
-        ConstantFillToInitializers(),
-    ]  # type: Iterable[Transformer]
-
-
-    onnx_model = onnx.shape_inference.infer_shapes(onnx_model)
-    graph = _prepare_onnx_graph(onnx_model.graph, transformers)
-
-    '''
-    Check for ImageScalar nodes in ONNX, this will indicate whether input image preprocessing needs
-    to be added to the CoreML graph or not. 
-    '''
-    # are there ImageScaler nodes in the Graph?
-    # If yes then add the info from it to the "preprocessing_args" dictionary, if the dictionary is not
-    # already provided by the user
-    if not bool(preprocessing_args):
-        for node in graph.nodes:
-            if node.op_type == 'ImageScaler':
-                inp_name = node.inputs[0]
-                scale = node.attrs.get('scale', 1.0)
-                bias = node.attrs.get('bias', [0,0,0])
-                if not (len(bias) == 1 or len(bias) == 3):
-                    continue
-                if 'image_scale' in preprocessing_args:
-                    preprocessing_args['image_scale'][inp_name] = scale
-                else:
-                    preprocessing_args['image_scale'] = {inp_name: scale}
-                if len(bias) == 3:
-                    for i, color in enumerate(['red', 'green', 'blue']):
-                        if color + '_bias' in preprocessing_args:
-                            preprocessing_args[color + '_bias'][inp_name] = bias[i]
-                        else:
-                            preprocessing_args[color + '_bias'] = {inp_name: bias[i]}
-                else:
-                    if 'gray_bias' in preprocessing_args:
-                        preprocessing_args['gray_bias'][inp_name] = bias[0]
-                    else:
-                        preprocessing_args['gray_bias'] = {inp_name: bias[0]}
-                if inp_name not in image_input_names:
-                    image_input_names.append(inp_name) # type: ignore
-
-    # remove all ImageScaler ops
-    graph = graph.transformed([ImageScalerRemover()])
+    graph = _prepare_graph_for_conversion(onnx_model, disable_coreml_rank5_mapping,
+                                          image_input_names, preprocessing_args)
 
     '''
     Gather information (name, shape) for model inputs and outputs
@@ -484,6 +664,17 @@ def convert(model,  # type: Union[onnx.ModelProto, Text]
 
     #Make CoreML input and output features by gathering shape info and
     #interpreting it for CoreML
+    optimized_input_shape_map = None  # type: Optional[Dict[Text, List[int]]]
+    if optimize_input_shape_mapping and not disable_coreml_rank5_mapping:
+        optimized_input_shape_map = _optimize_input_shape_map(
+            graph, onnx_coreml_input_shape_map, image_input_names,
+            _make_coreml_output_features(graph, forceShape=len(image_output_names) > 0),
+            mode, add_custom_layers, custom_conversion_functions)
+        if optimized_input_shape_map is onnx_coreml_input_shape_map:
+            optimized_input_shape_map = None
+        else:
+            onnx_coreml_input_shape_map = optimized_input_shape_map
+
     input_features = _make_coreml_input_features(graph, onnx_coreml_input_shape_map, disable_coreml_rank5_mapping)
 
     if DEBUG: print('Collected input_features: ', input_features)
@@ -497,6 +688,11 @@ def convert(model,  # type: Union[onnx.ModelProto, Text]
     
     builder = NeuralNetworkBuilder(input_features, output_features, mode=mode, disable_rank5_shape_mapping=disable_coreml_rank5_mapping)
 
+    if optimized_input_shape_map is not None:
+        # the input shapes differ from the default ones, record how they were chosen
+        builder.spec.description.metadata.userDefined['onnx_coreml_input_shape_map'] = \
+            json.dumps(optimized_input_shape_map, sort_keys=True)
+
     '''
     Set CoreML input,output types (float, double, int) same as onnx types, if supported
     '''
@@ -525,16 +721,14 @@ def convert(model,  # type: Union[onnx.ModelProto, Text]
         print('SETTING IMAGE INPUT NAMES')
         builder.set_pre_processing_parameters(
             image_input_names=image_input_names,
-            # is_bgr=preprocessing_args.get('is_bgr', False),
-            # red_bias=preprocessing_args.get('red_bias', 0.0),
-            # green_bias=preprocessing_args.get('green_bias', 0.0),
-            # blue_bias=preprocessing_args.get('blue_bias', 0.0),
-            # gray_bias=preprocessing_args.get('gray_bias', 0.0),
-            # image_scale=preprocessing_args.get('image_scale', 1.0)
+            is_bgr=preprocessing_args.get('is_bgr', False),
+            red_bias=preprocessing_args.get('red_bias', 0.0),
+            green_bias=preprocessing_args.get('green_bias', 0.0),
+            blue_bias=preprocessing_args.get('blue_bias', 0.0),
+            gray_bias=preprocessing_args.get('gray_bias', 0.0),
+            image_scale=preprocessing_args.get('image_scale', 1.0)
         )
 
-    preprocessing_args.clear()
-
     if len(image_output_names) > 0:
         print('SETTING IMAGE OUTPUT NAMES')
         for f in output_features:
@@ -564,9 +758,14 @@ def convert(model,  # type: Union[onnx.ModelProto, Text]
     '''
     err = ErrorHandling(add_custom_layers,
                         custom_conversion_functions,
-                        disable_coreml_rank5_mapping=disable_coreml_rank5_mapping)
+                        disable_coreml_rank5_mapping=disable_coreml_rank5_mapping,
+                        minimum_ios_deployment_target=minimum_ios_deployment_target)
 
 
+    if disable_coreml_rank5_mapping:
+        # the ND layer converters are only needed (and loaded) for EXACT_ARRAY_MAPPING conversions
+        from ._operators_nd import _convert_node_nd
+
     for i, node in enumerate(graph.nodes):
         print("%d/%d: Converting Node Type %s" %(i+1, len(graph.nodes), node.op_type))
         if disable_coreml_rank5_mapping:
@@ -576,6 +775,7 @@ def convert(model,  # type: Union[onnx.ModelProto, Text]
             _convert_node(builder, node, graph, err)
 
     if DEBUG:
+        from .graph_viz import plot_graph # type: ignore
         plot_graph(graph, graph_img_path='/tmp/after_conversion.pdf', show_coreml_mapped_shapes=not disable_coreml_rank5_mapping) 
 
     if add_deprocess:
@@ -662,17 +862,22 @@ def convert(model,  # type: Union[onnx.ModelProto, Text]
     if len(graph.optional_inputs) > 0 or len(graph.optional_outputs):
         builder.add_optionals(graph.optional_inputs, graph.optional_outputs)
 
-    print("Translation to CoreML spec completed. Now compiling the CoreML model.")
-    try:
-        if DEBUG:
-            import coremltools
-            coremltools.models.utils.save_spec(builder.spec, '/tmp/node_model_raw_spec.mlmodel')
-            from  coremltools.models.neural_network.printer import print_network_spec
-            print_network_spec(builder.spec, style='coding')
-        mlmodel = MLModel(builder.spec)
-    except RuntimeError as e:
-        raise ValueError('Compilation failed: {}'.format(str(e)))
-    print('Model Compilation done.')
+    if DEBUG:
+        import coremltools
+        coremltools.models.utils.save_spec(builder.spec, '/tmp/node_model_raw_spec.mlmodel')
+        from  coremltools.models.neural_network.printer import print_network_spec
+        print_network_spec(builder.spec, style='coding')
+
+    if return_spec:
+        print("Translation to CoreML spec completed.")
+        mlmodel = builder.spec
+    else:
+        print("Translation to CoreML spec completed. Now compiling the CoreML model.")
+        try:
+            mlmodel = MLModel(builder.spec)
+        except RuntimeError as e:
+            raise ValueError('Compilation failed: {}'.format(str(e)))
+        print('Model Compilation done.')
 
 
     # print information about all ops for which custom layers have been added
@@ -64,7 +64,8 @@ setup(
     },
     entry_points={
         'console_scripts': [
-            'convert-onnx-to-coreml = onnx_coreml.bin.convert:onnx_to_coreml'
+            'convert-onnx-to-coreml = onnx_coreml.bin.convert:onnx_to_coreml',
+            'analyze-onnx-for-coreml = onnx_coreml.bin.analyze:analyze_onnx_model',
         ]
     },
 )
@@ -0,0 +1,120 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+import numpy as np
+
+from click.testing import CliRunner
+from onnx import helper, numpy_helper, TensorProto
+from typing import Any
+
+from onnx_coreml import analyze
+from onnx_coreml._backend import CoreMLBackend, CoreMLBackendND
+from onnx_coreml.bin.analyze import analyze_onnx_model
+from tests._test_utils import _onnx_create_model, _random_array
+
+
+def _conv_erf_model(constant_weight=True):  # type: (bool) -> Any
+    inputs = [('input', (1, 3, 8, 8))]
+    if not constant_weight:
+        inputs.append(('weight', (4, 3, 1, 1)))
+    outputs = [('out', (1, 4, 8, 8), TensorProto.FLOAT)]
+    weight = numpy_helper.from_array(_random_array((4, 3, 1, 1)), name='weight')
+    nodes = [
+        helper.make_node('Dropout', inputs=['input'], outputs=['drop'], name='drop'),
+        helper.make_node('Conv', inputs=['drop', 'weight'], outputs=['conv'], kernel_shape=(1, 1), name='conv'),
+        helper.make_node('Erf', inputs=['conv'], outputs=['out'], name='erf'),
+    ]
+    return _onnx_create_model(nodes, inputs, outputs, [weight] if constant_weight else [])
+
+
+class AnalysisTest(unittest.TestCase):
+    def test_rank5(self):  # type: () -> None
+        report = analyze(_conv_erf_model())
+        self.assertFalse(report.is_compatible)
+        self.assertEqual(report.unsupported_op_types, ['Erf'])
+        statuses = [(n.op_type, n.status, n.converter) for n in report.nodes]
+        self.assertEqual(statuses, [('Dropout', 'transformed', None),
+                                    ('Conv', 'converted', '_convert_conv'),
+                                    ('Erf', 'unsupported', None)])
+        self.assertEqual(report.nodes[2].missing_shapes, ['conv'])
+        self.assertEqual(analyze(_conv_erf_model(), infer_shapes=True).nodes[2].missing_shapes, [])
+
+        report = analyze(_conv_erf_model(), add_custom_layers=True)
+        self.assertTrue(report.is_compatible)
+        self.assertEqual([n.name for n in report.custom_layer_nodes], ['erf'])
+
+    def test_dynamic_weights(self):  # type: () -> None
+        model = _conv_erf_model(constant_weight=False)
+        self.assertEqual(analyze(model).nodes[1].status, 'unsupported')
+        report = analyze(model, disable_coreml_rank5_mapping=True)
+        self.assertTrue(report.is_compatible)
+        self.assertEqual([n.name for n in report.dynamic_layer_nodes], ['conv'])
+
+    def test_dynamic_batchnorm_parameters(self):  # type: () -> None
+        params = [numpy_helper.from_array(_random_array((3,)), name=name) for name in ('bias', 'mean', 'var')]
+        nodes = [helper.make_node('BatchNormalization', inputs=['input', 'scale', 'bias', 'mean', 'var'],
+                                  outputs=['out'], name='bn')]
+        model = _onnx_create_model(nodes, [('input', (1, 3, 8, 8)), ('scale', (3,))],
+                                   [('out', (1, 3, 8, 8), TensorProto.FLOAT)], params)
+        for disable_coreml_rank5_mapping in (False, True):
+            report = analyze(model, disable_coreml_rank5_mapping=disable_coreml_rank5_mapping)
+            self.assertEqual(report.unsupported_op_types, ['BatchNormalization'])
+            self.assertEqual(report.nodes[0].message, 'inputs scale must be constants')
+
+    def test_constant_folding(self):  # type: () -> None
+        shape = numpy_helper.from_array(_random_array((2,)), name='shape')
+        nodes = [
+            helper.make_node('Unsqueeze', inputs=['shape'], outputs=['shape_1'], axes=[0]),
+            helper.make_node('Add', inputs=['input', 'shape_1'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 2))], [('out', (1, 2), TensorProto.FLOAT)], [shape])
+        report = analyze(model)
+        self.assertEqual([n.status for n in report.nodes], ['transformed', 'converted'])
+        self.assertEqual(report.nodes[1].missing_shapes, [])
+
+        # declared by ReshapeInitTensorFuser
+        shape = numpy_helper.from_array(_random_array((1, 2)), name='shape')
+        new_shape = numpy_helper.from_array(np.array([2, 1], dtype=np.int64), name='new_shape')
+        nodes = [
+            helper.make_node('Reshape', inputs=['shape', 'new_shape'], outputs=['shape_1']),
+            helper.make_node('MatMul', inputs=['input', 'shape_1'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 2))], [('out', (1, 1), TensorProto.FLOAT)],
+                                   [shape, new_shape])
+        self.assertEqual([n.status for n in analyze(model).nodes], ['transformed', 'converted'])
+
+    def test_dead_nodes(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Relu', inputs=['input'], outputs=['out']),
+            helper.make_node('Erf', inputs=['input'], outputs=['unused']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 2))], [('out', (1, 2), TensorProto.FLOAT)])
+        report = analyze(model)
+        self.assertTrue(report.is_compatible)
+        self.assertEqual([n.status for n in report.nodes], ['converted', 'transformed'])
+
+    def test_backend_is_compatible(self):  # type: () -> None
+        model = _conv_erf_model()
+        self.assertFalse(CoreMLBackend.is_compatible(model))
+        self.assertTrue(CoreMLBackendND.is_compatible(model))
+
+    def test_cli(self):  # type: () -> None
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('model.onnx', 'wb') as f:
+                f.write(_conv_erf_model().SerializeToString())
+            result = runner.invoke(analyze_onnx_model, ['model.onnx', '--json'])
+            self.assertEqual(result.exit_code, 1)
+            self.assertEqual(json.loads(result.output)['unsupported_op_types'], ['Erf'])
+            result = runner.invoke(analyze_onnx_model, ['model.onnx', '--disable-rank5-mapping'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn('_convert_erf', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
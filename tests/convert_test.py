@@ -3,15 +3,21 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import unittest
 import numpy as np
 import numpy.testing as npt  # type: ignore
 import numpy.random as npr
 
 from PIL import Image  # type: ignore
+from concurrent.futures import ThreadPoolExecutor
 
+from click.testing import CliRunner
+from coremltools.proto import Model_pb2  # type: ignore
+from onnx import helper, numpy_helper, TensorProto
 from onnx_coreml import convert
-from tests._test_utils import _onnx_create_single_node_model
+from onnx_coreml.bin.convert import onnx_to_coreml
+from tests._test_utils import _onnx_create_single_node_model, _onnx_create_model
 
 
 class ConvertTest(unittest.TestCase):
@@ -87,6 +93,124 @@ class ConvertTest(unittest.TestCase):
         expected_output = self.img_arr[:, :, ::-1].transpose((2, 0, 1))
         npt.assert_equal(output, expected_output)
 
+    def test_convert_does_not_mutate_arguments(self):  # type: () -> None
+        inputs = [('input', (1, 3, 10, 10))]
+        outputs = [('out', (1, 3, 10, 10), TensorProto.FLOAT)]
+        im_scaler = helper.make_node("ImageScaler",
+                                     inputs=['input'],
+                                     outputs=['scaler_out'],
+                                     bias=[10, -6, 20], scale=3.0)
+        exp = helper.make_node("Exp", inputs=['scaler_out'], outputs=['out'])
+        onnx_model = _onnx_create_model([im_scaler, exp], inputs, outputs)
+
+        image_input_names = []  # type: ignore
+        preprocessing_args = {}  # type: ignore
+        convert(onnx_model,
+                image_input_names=image_input_names,
+                preprocessing_args=preprocessing_args)
+        self.assertEqual(image_input_names, [])
+        self.assertEqual(preprocessing_args, {})
+
+        # default arguments must not leak the image input of the previous call
+        spec = convert(self.onnx_model).get_spec()
+        for input_ in spec.description.input:
+            self.assertEqual(input_.type.WhichOneof('Type'), 'multiArrayType')
+
+    def test_convert_concurrently(self):  # type: () -> None
+        onnx_model = _onnx_create_single_node_model(
+            "Relu",
+            [(1, 16)],
+            [(1, 16)]
+        )
+
+        def _convert(disable_coreml_rank5_mapping):  # type: (bool) -> bytes
+            spec = convert(onnx_model,
+                           disable_coreml_rank5_mapping=disable_coreml_rank5_mapping).get_spec()
+            return spec.SerializeToString()
+
+        expected = {flag: _convert(flag) for flag in [False, True]}
+        flags = [False, True] * 4
+        pool = ThreadPoolExecutor(max_workers=4)
+        try:
+            results = list(pool.map(_convert, flags))
+        finally:
+            pool.shutdown()
+        for flag, result in zip(flags, results):
+            self.assertEqual(result, expected[flag])
+        # a rank-5 conversion after an ND one still maps the (B,C) input to [C]
+        spec = convert(onnx_model).get_spec()
+        self.assertEqual(list(spec.description.input[0].type.multiArrayType.shape), [16])
+
+    def test_convert_return_spec(self):  # type: () -> None
+        spec = convert(self.onnx_model, return_spec=True)
+        self.assertIsInstance(spec, Model_pb2.Model)
+        self.assertEqual(len(spec.neuralNetwork.layers), 1)
+        self.assertEqual(spec.description.input[0].name, self.input_names[0])
+
+    def test_optimize_input_shape_mapping(self):  # type: () -> None
+        concat = helper.make_node('Concat', inputs=['input', 'input'], outputs=['out'], axis=2)
+        onnx_model = _onnx_create_model([concat], [('input', (2, 5, 4))], [('out', (2, 5, 8), TensorProto.FLOAT)])
+        spec = convert(onnx_model, return_spec=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers],
+                         ['permute', 'permute', 'concat', 'permute'])
+        # (Seq, B, C) puts the concatenation axis on the channels
+        spec = convert(onnx_model, return_spec=True, optimize_input_shape_mapping=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['concat'])
+        self.assertEqual(list(spec.description.input[0].type.multiArrayType.shape), [4, 1, 1])
+        # the shape of the input feature changes, the chosen mapping is recorded in the model
+        self.assertEqual(json.loads(spec.description.metadata.userDefined['onnx_coreml_input_shape_map']),
+                         {'input': [0, 1, 2]})
+
+        # a mapping given by the user is kept
+        spec = convert(onnx_model, return_spec=True, optimize_input_shape_mapping=True,
+                       onnx_coreml_input_shape_map={'input': [2, 3, 4]})
+        self.assertEqual(len(spec.neuralNetwork.layers), 4)
+        self.assertNotIn('onnx_coreml_input_shape_map', spec.description.metadata.userDefined)
+
+    def test_transposed_input_matmul_constant_weight(self):  # type: () -> None
+        W = np.random.rand(4, 5).astype(np.float32)
+        nodes = [
+            helper.make_node('Transpose', inputs=['input'], outputs=['input_t'], perm=[0, 2, 1]),
+            helper.make_node('MatMul', inputs=['input_t', 'W'], outputs=['out']),
+        ]
+        onnx_model = _onnx_create_model(nodes, [('input', (1, 4, 3))], [('out', (1, 3, 5), TensorProto.FLOAT)],
+                                        [numpy_helper.from_array(W, name='W')])
+        spec = convert(onnx_model, return_spec=True, disable_coreml_rank5_mapping=True)
+        layers = [l for l in spec.neuralNetwork.layers if l.WhichOneof('layer') == 'batchedMatmul']
+        self.assertEqual(len(layers), 1)
+        # transposeA is ignored by CoreML for a single input layer, the weight must be a second input
+        self.assertTrue(layers[0].batchedMatmul.transposeA)
+        self.assertEqual(len(layers[0].input), 2)
+
+    def test_transpose_broadcast_constant_rank5(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Transpose', inputs=['input'], outputs=['nhwc'], perm=[0, 2, 3, 1]),
+            helper.make_node('Add', inputs=['nhwc', 'bias'], outputs=['add']),
+            helper.make_node('Mul', inputs=['add', 'scale'], outputs=['mul']),
+            helper.make_node('Relu', inputs=['mul'], outputs=['relu']),
+            helper.make_node('Transpose', inputs=['relu'], outputs=['out'], perm=[0, 3, 1, 2]),
+        ]
+        initializer = [numpy_helper.from_array(np.random.rand(3).astype(np.float32), name='bias'),
+                       numpy_helper.from_array(np.random.rand(5, 1).astype(np.float32), name='scale')]
+        onnx_model = _onnx_create_model(nodes, [('input', (1, 3, 4, 5))], [('out', (1, 3, 4, 5), TensorProto.FLOAT)],
+                                        initializer)
+        # the (5,1) scale is not sunk into a rank 4 constant the rank 5 mapping cannot translate
+        spec = convert(onnx_model, return_spec=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers],
+                         ['bias', 'permute', 'loadConstant', 'multiply', 'activation', 'permute'])
+
+    def test_cli_spec_only(self):  # type: () -> None
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('model.onnx', 'wb') as f:
+                f.write(self.onnx_model.SerializeToString())
+            result = runner.invoke(onnx_to_coreml, ['model.onnx', '-o', 'model.mlmodel', '--spec-only'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            spec = Model_pb2.Model()
+            with open('model.mlmodel', 'rb') as f:
+                spec.ParseFromString(f.read())
+        self.assertEqual(len(spec.neuralNetwork.layers), 1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,59 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import subprocess
+import sys
+import unittest
+
+from typing import Dict, Any, Text
+
+# modules that must only be loaded once a conversion actually needs them
+_HEAVY_MODULES = [
+    'coremltools',
+    'onnx_coreml.converter',
+    'onnx_coreml._operators',
+    'onnx_coreml._operators_nd',
+    'onnx_coreml._transformers',
+    'onnx_coreml.graph_viz',
+]
+
+# generous wall time budget (in seconds) for importing the package itself,
+# importing the converter takes several times longer than this
+_IMPORT_TIME_BUDGET = 0.25
+
+
+def _import_in_subprocess(statement):  # type: (Text) -> Dict[Text, Any]
+    script = '\n'.join([
+        'import json, sys, time',
+        'start = time.time()',
+        statement,
+        'elapsed = time.time() - start',
+        'heavy = [m for m in %r if m in sys.modules]' % (_HEAVY_MODULES,),
+        'print(json.dumps({"elapsed": elapsed, "heavy": heavy}))',
+    ])
+    output = subprocess.check_output([sys.executable, '-c', script])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])  # type: ignore
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'the package is only loaded lazily on Python 3.7+')
+class ImportTest(unittest.TestCase):
+    def test_import_package(self):  # type: () -> None
+        result = _import_in_subprocess('import onnx_coreml')
+        self.assertEqual(result['heavy'], [])
+        self.assertLess(result['elapsed'], _IMPORT_TIME_BUDGET)
+
+    def test_import_backend(self):  # type: () -> None
+        result = _import_in_subprocess('from onnx_coreml._backend import CoreMLBackend')
+        self.assertEqual(result['heavy'], [])
+
+    def test_lazy_convert(self):  # type: () -> None
+        result = _import_in_subprocess('from onnx_coreml import convert')
+        self.assertIn('onnx_coreml.converter', result['heavy'])
+        self.assertNotIn('onnx_coreml._operators_nd', result['heavy'])
+
+
+if __name__ == '__main__':
+    unittest.main()
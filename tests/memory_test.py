@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+import numpy as np
+from click.testing import CliRunner
+from onnx import helper, numpy_helper, shape_inference, TensorProto
+from typing import Any
+
+from onnx_coreml import analyze_memory
+from onnx_coreml._graph import Graph
+from onnx_coreml._memory import MemoryAwareScheduler, estimate_peak_memory, memory_report
+from onnx_coreml.bin.analyze import analyze_onnx_model
+from tests._test_utils import _onnx_create_model
+
+
+def _two_branch_graph(nodes):  # type: (Any) -> Graph
+    model = _onnx_create_model(nodes, [('input', (1,))], [('out', (1,), TensorProto.FLOAT)])
+    graph = Graph.from_onnx(model.graph)
+    # the first op of each branch produces a large blob
+    graph.shape_dict.update({'input': (1,), 'a1': (100,), 'b1': (100,), 'a2': (1,), 'b2': (1,), 'out': (1,)})
+    return graph
+
+
+class MemoryAwareSchedulerTest(unittest.TestCase):
+    def setUp(self):  # type: () -> None
+        self.nodes = [
+            helper.make_node('Relu', inputs=['input'], outputs=['a1'], name='a1'),
+            helper.make_node('Relu', inputs=['input'], outputs=['b1'], name='b1'),
+            helper.make_node('Relu', inputs=['a1'], outputs=['a2'], name='a2'),
+            helper.make_node('Relu', inputs=['b1'], outputs=['b2'], name='b2'),
+            helper.make_node('Add', inputs=['a2', 'b2'], outputs=['out'], name='out'),
+        ]
+
+    def test_lower_peak(self):  # type: () -> None
+        graph = _two_branch_graph(self.nodes)
+        self.assertEqual(estimate_peak_memory(graph), 201 * 4)
+        new_graph = MemoryAwareScheduler()(graph)
+        self.assertEqual([n.name for n in new_graph.nodes], ['a1', 'a2', 'b1', 'b2', 'out'])
+        self.assertEqual(estimate_peak_memory(new_graph), 102 * 4)
+
+        # the order is kept when it is already as good
+        self.assertIs(MemoryAwareScheduler()(new_graph), new_graph)
+
+    def test_topological_sort(self):  # type: () -> None
+        nodes = [self.nodes[4], self.nodes[2], self.nodes[0], self.nodes[3], self.nodes[1]]
+        new_graph = MemoryAwareScheduler()(_two_branch_graph(nodes))
+        self.assertEqual([n.name for n in new_graph.nodes], ['a1', 'a2', 'b1', 'b2', 'out'])
+
+
+class MemoryReportTest(unittest.TestCase):
+    def _expand_model(self):  # type: () -> Any
+        shape = numpy_helper.from_array(np.array([64, 3], dtype=np.int64), name='shape')
+        nodes = [
+            helper.make_node('Expand', inputs=['input', 'shape'], outputs=['expand'], name='expand'),
+            helper.make_node('Relu', inputs=['expand'], outputs=['out'], name='relu'),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 3))], [('out', (64, 3), TensorProto.FLOAT)], [shape])
+        # the int64 initializer is not a float input of the graph
+        del model.graph.input[0]
+        return model
+
+    def test_live_ranges(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Relu', inputs=['input'], outputs=['a'], name='a'),
+            helper.make_node('Relu', inputs=['a'], outputs=['b'], name='b'),
+            helper.make_node('Add', inputs=['input', 'b'], outputs=['out'], name='out'),
+        ]
+        model = _onnx_create_model(nodes, [('input', (2, 3))], [('out', (2, 3), TensorProto.FLOAT)])
+        report = memory_report(Graph.from_onnx(shape_inference.infer_shapes(model).graph))
+        self.assertEqual([(b.name, b.size, b.first_layer, b.last_layer) for b in report.blobs],
+                         [('input', 24, -1, 2), ('a', 24, 0, 1), ('b', 24, 1, 2), ('out', 24, 2, 3)])
+        self.assertEqual([layer.live_bytes for layer in report.layers], [48, 72, 72])
+        self.assertEqual(report.peak_bytes, 72)
+        self.assertEqual(report.peak_layer.name, 'b')
+
+    def test_large_intermediate(self):  # type: () -> None
+        for disable_rank5_mapping in [False, True]:
+            report = analyze_memory(self._expand_model(), disable_coreml_rank5_mapping=disable_rank5_mapping)
+            self.assertEqual([layer.name for layer in report.large_intermediate_layers], ['expand'])
+            self.assertEqual(report.layers[0].output_bytes, 64 * 3 * 4)
+            self.assertEqual(report.peak_bytes, 2 * 64 * 3 * 4)
+            self.assertEqual(json.loads(json.dumps(report.to_dict()))['peak_layer'], 'relu')
+            self.assertIn('large intermediate', report.summary())
+
+    def test_cli(self):  # type: () -> None
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('model.onnx', 'wb') as f:
+                f.write(self._expand_model().SerializeToString())
+            result = runner.invoke(analyze_onnx_model, ['model.onnx', '--memory', '--json'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertEqual(json.loads(result.stdout)['large_intermediate_layers'], ['expand'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,11 +9,11 @@ from onnx.numpy_helper import from_array
 import onnx
 from onnx_coreml import convert
 
-from typing import Text
+from typing import Text, Any
 
 from tests._test_utils import _test_single_node, \
     _random_array, _conv_pool_output_size, \
-    _onnx_create_single_node_model, _assert_outputs
+    _onnx_create_single_node_model, _assert_outputs, _onnx_create_model
 
 from coremltools.models.utils import macos_version
 
@@ -246,6 +246,35 @@ class SingleOperatorTest(unittest.TestCase):
     def test_gemm_transB_off_disable_rank5_mapping(self):
         self.test_gemm_transB_off(True)
 
+    def test_gemm_alpha_beta_transA(self):  # type: () -> None
+        W = _random_array((5, 4))
+        C = _random_array((5,))
+        node = onnx.helper.make_node('Gemm', inputs=['input', 'weight', 'bias'], outputs=['out'],
+                                     alpha=2.0, beta=0.5, transA=1, transB=1)
+        model = _onnx_create_model([node], [('input', (4, 3))], [('out', (3, 5), onnx.TensorProto.FLOAT)],
+                                   [from_array(W, name='weight'), from_array(C, name='bias')])
+        spec = convert(model, onnx_coreml_input_shape_map={'input': [0, 2]}, return_spec=True)
+        layers = spec.neuralNetwork.layers
+        self.assertEqual([l.WhichOneof('layer') for l in layers], ['permute', 'innerProduct'])
+        self.assertEqual(list(layers[0].permute.axis), [1, 0, 2, 3])
+        np.testing.assert_allclose(np.array(layers[1].innerProduct.weights.floatValue).reshape(5, 4), 2.0 * W, rtol=1e-6)
+        np.testing.assert_allclose(np.array(layers[1].innerProduct.bias.floatValue), 0.5 * C, rtol=1e-6)
+
+    def test_gemm_transA_shared_input(self):  # type: () -> None
+        nodes = [
+            onnx.helper.make_node('Gemm', inputs=['input', 'weight_' + c], outputs=['out_' + c], transA=1)
+            for c in 'ab'
+        ]
+        model = _onnx_create_model(nodes, [('input', (4, 3))],
+                                   [('out_' + c, (3, 5), onnx.TensorProto.FLOAT) for c in 'ab'],
+                                   [from_array(_random_array((4, 5)), name='weight_' + c) for c in 'ab'])
+        spec = convert(model, onnx_coreml_input_shape_map={'input': [0, 2]}, return_spec=True)
+        layers = spec.neuralNetwork.layers
+        self.assertEqual([l.WhichOneof('layer') for l in layers], ['permute', 'innerProduct'] * 2)
+        # each Gemm transposes the shared input into its own blob
+        outputs = [output for l in layers for output in l.output]
+        self.assertEqual(len(outputs), len(set(outputs)))
+
     def test_lrn(self):  # type: () -> None
         _test_single_node(
             "LRN",
@@ -325,6 +354,61 @@ class SingleOperatorTest(unittest.TestCase):
             disable_rank5_mapping=disable_rank5_mapping
         )
         
+    def test_nary_elementwise(self):  # type: () -> None
+        def _layers(op_type, shapes, disable_rank5_mapping):  # type: (Text, Any, bool) -> Any
+            inputs = [('input_{}'.format(i), shape) for i, shape in enumerate(shapes)]
+            model = _onnx_create_model([onnx.helper.make_node(op_type, [i[0] for i in inputs], ['out'])],
+                                       inputs, [('out', shapes[0], onnx.TensorProto.FLOAT)])
+            spec = convert(model, disable_coreml_rank5_mapping=disable_rank5_mapping, return_spec=True)
+            return [(l.WhichOneof('layer'), list(l.input)) for l in spec.neuralNetwork.layers]
+
+        for disable_rank5_mapping in [False, True]:
+            # a single layer when the shapes match
+            self.assertEqual(_layers('Mean', [(1, 3, 4, 4)] * 4, disable_rank5_mapping),
+                             [('average', ['input_0', 'input_1', 'input_2', 'input_3'])])
+            # otherwise a balanced tree of binary layers
+            layers = _layers('Sum', [(1, 3, 4, 4), (1, 3, 1, 1), (1, 1, 4, 4), (1, 3, 4, 4)], disable_rank5_mapping)
+            self.assertEqual([l[1] for l in layers],
+                             [['input_0', 'input_1'], ['input_2', 'input_3'], ['out_0', 'out_1']])
+
+        # unknown dimensions may broadcast at runtime
+        layers = _layers('Max', [('N', 8)] * 3, True)
+        self.assertEqual([l[1] for l in layers], [['input_0', 'input_1'], ['out_0', 'input_2']])
+
+    def test_gather_constant_table(self):  # type: () -> None
+        table = _random_array((10, 4))
+        node = onnx.helper.make_node('Gather', inputs=['table', 'indices'], outputs=['out'], axis=0)
+        graph = onnx.helper.make_graph(
+            [node], 'test',
+            [onnx.helper.make_tensor_value_info('indices', onnx.TensorProto.INT64, (2, 3))],
+            [onnx.helper.make_tensor_value_info('out', onnx.TensorProto.FLOAT, (2, 3, 4))],
+            initializer=[from_array(table, name='table')])
+        spec = convert(onnx.helper.make_model(graph), disable_coreml_rank5_mapping=True, return_spec=True)
+        layers = spec.neuralNetwork.layers
+        self.assertEqual([l.WhichOneof('layer') for l in layers], ['expandDims', 'embeddingND'])
+        self.assertEqual((layers[1].embeddingND.vocabSize, layers[1].embeddingND.embeddingSize), (10, 4))
+        # weights are stored as (embedding size, vocabulary size)
+        np.testing.assert_equal(np.array(layers[1].embeddingND.weights.floatValue).reshape(4, 10), table.T)
+
+    def test_gather_constant_tables_shared_indices(self):  # type: () -> None
+        nodes = [
+            onnx.helper.make_node('Gather', inputs=['table_' + c, 'ids'], outputs=['out_' + c], axis=0)
+            for c in 'ab'
+        ]
+        graph = onnx.helper.make_graph(
+            nodes, 'test',
+            [onnx.helper.make_tensor_value_info('ids', onnx.TensorProto.INT64, (2, 3))],
+            [onnx.helper.make_tensor_value_info('out_' + c, onnx.TensorProto.FLOAT, (2, 3, 4)) for c in 'ab'],
+            initializer=[from_array(_random_array((10, 4)), name='table_' + c) for c in 'ab'])
+        spec = convert(onnx.helper.make_model(graph), disable_coreml_rank5_mapping=True, return_spec=True)
+        layers = spec.neuralNetwork.layers
+        self.assertEqual([l.WhichOneof('layer') for l in layers], ['expandDims', 'embeddingND'] * 2)
+        # each lookup expands the shared indices into its own blob
+        outputs = [output for l in layers for output in l.output]
+        self.assertEqual(len(outputs), len(set(outputs)))
+        self.assertEqual([l.input[0] for l in layers if l.WhichOneof('layer') == 'embeddingND'],
+                         [layers[0].output[0], layers[2].output[0]])
+
     @unittest.skipIf(macos_version() < MIN_MACOS_VERSION_10_15,
                     'macOS 10.15+ required. Skipping test.')
     def test_reshape_same_rank(self, disable_rank5_mapping=True):  # type: () -> None
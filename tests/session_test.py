@@ -0,0 +1,60 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from onnx_coreml import ConversionSession
+from tests._test_utils import _onnx_create_single_node_model
+
+
+class ConversionSessionTest(unittest.TestCase):
+    def setUp(self):  # type: () -> None
+        self.models = [
+            _onnx_create_single_node_model(op_type, [(1, 3, 4, 4)], [(1, 3, 4, 4)])
+            for op_type in ['Relu', 'Sigmoid', 'Tanh']
+        ]
+
+    def test_convert_cache(self):  # type: () -> None
+        with ConversionSession() as session:
+            model_1 = session.convert(self.models[0])
+            model_1.short_description = 'changed by the caller'
+            model_2 = session.convert(self.models[0])
+            # cached models are copies, the changes of a caller do not leak into them
+            self.assertIsNot(model_1, model_2)
+            self.assertEqual(model_2.short_description, '')
+            self.assertEqual(model_2.get_spec().neuralNetwork, model_1.get_spec().neuralNetwork)
+            spec_1 = session.convert(self.models[1], return_spec=True)
+            spec_1.description.metadata.shortDescription = 'changed by the caller'
+            spec_2 = session.convert(self.models[1], return_spec=True)
+            self.assertEqual(spec_2.description.metadata.shortDescription, '')
+            session.convert(self.models[0], disable_coreml_rank5_mapping=True)
+            stats = session.stats
+        self.assertEqual(stats['conversions'], 3)
+        self.assertEqual(stats['cache_hits'], 2)
+        self.assertEqual(stats['failures'], 0)
+
+    def test_convert_many(self):  # type: () -> None
+        with ConversionSession(max_workers=3, cache_size=0) as session:
+            mlmodels = session.convert_many(self.models, disable_coreml_rank5_mapping=True)
+            stats = session.stats
+        self.assertEqual(len(mlmodels), 3)
+        for mlmodel, onnx_model in zip(mlmodels, self.models):
+            spec = mlmodel.get_spec()
+            self.assertEqual(len(spec.neuralNetwork.layers), 1)
+            self.assertEqual(spec.neuralNetwork.layers[0].name, onnx_model.graph.node[0].output[0])
+        self.assertEqual(stats['conversions'], 3)
+        self.assertEqual(stats['cache_hits'], 0)
+
+    def test_failure_stats(self):  # type: () -> None
+        model = _onnx_create_single_node_model('Erf', [(1, 3)], [(1, 3)])
+        session = ConversionSession()
+        with self.assertRaises(NotImplementedError):
+            session.convert(model)
+        self.assertEqual(session.stats['failures'], 1)
+        self.assertEqual(session.stats['conversions'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
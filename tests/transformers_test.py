@@ -7,11 +7,17 @@ import unittest
 import numpy as np
 import numpy.testing as npt  # type: ignore
 
+import onnx
 from onnx import helper, numpy_helper, TensorProto
+from typing import Any
 
 from onnx_coreml import convert
 from onnx_coreml._graph import Graph
-from onnx_coreml._transformers import ConvAddFuser, DropoutRemover, ImageScalerRemover
+from onnx_coreml._transformers import ConvAddFuser, DropoutRemover, ImageScalerRemover, TransposeOptimizer, \
+    BNFolder, LayerNormFuser, ActivationFuser, AttentionFuser, DeadCodeEliminator, \
+    CommonSubexpressionEliminator, NoOpRemover, ReshapeChainFuser, PadFolder, \
+    MatMulAddFuser, AffineFuser, InputNormalizationFolder, SpatialReduceToGlobalPool, \
+    ChannelMatMulToConv
 from tests._test_utils import _onnx_create_model, _test_onnx_model, \
     _conv_pool_output_size, _random_array
 
@@ -269,5 +275,592 @@ class PixelShuffleFuserTest(unittest.TestCase):
         _test_onnx_model(model, decimal=7)
 
 
+class TransposeOptimizerTest(unittest.TestCase):
+    def test_cancel_through_activation(self):  # type: () -> None
+        inputs = [('input', (1, 8, 8, 3))]
+        outputs = [('out', (1, 8, 8, 3), TensorProto.FLOAT)]
+        nodes = [
+            helper.make_node('Transpose', inputs=['input'], outputs=['nchw'], perm=[0, 3, 1, 2]),
+            helper.make_node('Relu', inputs=['nchw'], outputs=['relu']),
+            helper.make_node('Sigmoid', inputs=['relu'], outputs=['sigmoid']),
+            helper.make_node('Transpose', inputs=['sigmoid'], outputs=['out'], perm=[0, 2, 3, 1]),
+        ]
+        graph = Graph.from_onnx(_onnx_create_model(nodes, inputs, outputs).graph)
+        transformer = TransposeOptimizer()
+        new_graph = graph.transformed([transformer])
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Relu', 'Sigmoid'])
+        self.assertEqual(new_graph.nodes[0].inputs, ['input'])
+        self.assertEqual(new_graph.nodes[1].outputs, ['out'])
+        self.assertEqual(transformer.num_removed, 2)
+
+    def test_merge_consecutive(self):  # type: () -> None
+        inputs = [('input', (1, 2, 3, 4))]
+        outputs = [('out', (3, 1, 4, 2), TensorProto.FLOAT)]
+        nodes = [
+            helper.make_node('Transpose', inputs=['input'], outputs=['t1'], perm=[0, 2, 3, 1]),
+            helper.make_node('Transpose', inputs=['t1'], outputs=['out'], perm=[1, 0, 2, 3]),
+        ]
+        graph = Graph.from_onnx(_onnx_create_model(nodes, inputs, outputs).graph)
+        new_graph = graph.transformed([TransposeOptimizer()])
+        self.assertEqual(len(new_graph.nodes), 1)
+        self.assertEqual(new_graph.nodes[0].inputs, ['input'])
+        self.assertEqual(new_graph.nodes[0].outputs, ['out'])
+        self.assertEqual(new_graph.nodes[0].attrs['perm'], [2, 0, 3, 1])
+
+    def test_sink_through_broadcast(self):  # type: () -> None
+        inputs = [('input', (1, 3, 4, 5)), ('other', (1, 3, 4, 5))]
+        outputs = [('out', (1, 3, 4, 5), TensorProto.FLOAT)]
+        bias = _random_array((5, 1, 3))
+        nodes = [
+            helper.make_node('Transpose', inputs=['input'], outputs=['t1'], perm=[0, 3, 2, 1]),
+            helper.make_node('Transpose', inputs=['other'], outputs=['t2'], perm=[0, 3, 2, 1]),
+            helper.make_node('Mul', inputs=['t1', 't2'], outputs=['mul']),
+            helper.make_node('Add', inputs=['mul', 'bias'], outputs=['add']),
+            helper.make_node('Transpose', inputs=['add'], outputs=['out'], perm=[0, 3, 2, 1]),
+        ]
+        model = _onnx_create_model(nodes, inputs, outputs, [numpy_helper.from_array(bias, name='bias')])
+        graph = Graph.from_onnx(model.graph)
+        new_graph = graph.transformed([TransposeOptimizer()])
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Mul', 'Add'])
+        self.assertEqual(new_graph.nodes[0].inputs, ['input', 'other'])
+        self.assertEqual(new_graph.nodes[1].outputs, ['out'])
+        add = new_graph.nodes[1]
+        npt.assert_equal(add.input_tensors[add.inputs[1]], np.transpose(bias[None], (0, 3, 2, 1)))
+
+
+    def test_rank5_mapping_constants(self):  # type: () -> None
+        inputs = [('input', (1, 3, 4, 5))]
+        outputs = [('out', (1, 3, 4, 5), TensorProto.FLOAT)]
+        bias = _random_array((3,))
+        scale = _random_array((5, 1))
+        nodes = [
+            helper.make_node('Transpose', inputs=['input'], outputs=['nhwc'], perm=[0, 2, 3, 1]),
+            helper.make_node('Add', inputs=['nhwc', 'bias'], outputs=['add']),
+            helper.make_node('Mul', inputs=['add', 'scale'], outputs=['mul']),
+            helper.make_node('Relu', inputs=['mul'], outputs=['relu']),
+            helper.make_node('Transpose', inputs=['relu'], outputs=['out'], perm=[0, 3, 1, 2]),
+        ]
+        initializer = [numpy_helper.from_array(bias, name='bias'), numpy_helper.from_array(scale, name='scale')]
+        graph = Graph.from_onnx(_onnx_create_model(nodes, inputs, outputs, initializer).graph)
+        new_graph = graph.transformed([TransposeOptimizer(rank5_mapping=True)])
+        # the per channel bias becomes a (C,1,1) constant, the (W,) scale cannot be translated
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Add', 'Transpose', 'Mul', 'Relu', 'Transpose'])
+        add = new_graph.nodes[0]
+        self.assertEqual(add.inputs[0], 'input')
+        npt.assert_equal(add.input_tensors[add.inputs[1]], bias.reshape((3, 1, 1)))
+        mul = new_graph.nodes[2]
+        self.assertEqual(mul.inputs[1], 'scale')
+
+class BNFolderTest(unittest.TestCase):
+    def _bn_model(self, op_type, weight, group, **attrs):  # type: (...) -> Any
+        channels = weight.shape[1] * group if op_type == 'ConvTranspose' else weight.shape[0]
+        initializer = [numpy_helper.from_array(weight, name='weight')]
+        for name in ('scale', 'bias', 'mean', 'var'):
+            initializer.append(numpy_helper.from_array(_random_array((channels,)) + 0.5, name=name))
+        nodes = [
+            helper.make_node(op_type, inputs=['input', 'weight'], outputs=['conv'], group=group, **attrs),
+            helper.make_node('BatchNormalization', inputs=['conv', 'scale', 'bias', 'mean', 'var'],
+                             outputs=['out'], epsilon=1e-3),
+        ]
+        input_channels = weight.shape[0] if op_type == 'ConvTranspose' else weight.shape[1] * group
+        model = _onnx_create_model(nodes, [('input', (1, input_channels, 4, 4))],
+                                   [('out', (1, channels, 4, 4), TensorProto.FLOAT)], initializer)
+        scale, bias, mean, var = [numpy_helper.to_array(t) for t in initializer[1:]]
+        s = scale / np.sqrt(var + 1e-3)
+        return model, s, bias - mean * s
+
+    def test_fold_depthwise_conv(self):  # type: () -> None
+        weight = _random_array((6, 1, 3, 3))
+        model, s, b = self._bn_model('Conv', weight, group=6, kernel_shape=(3, 3), pads=(1, 1, 1, 1))
+        new_graph = Graph.from_onnx(model.graph).transformed([BNFolder()])
+        self.assertEqual(len(new_graph.nodes), 1)
+        conv = new_graph.nodes[0]
+        self.assertEqual(conv.outputs, ['out'])
+        npt.assert_allclose(conv.input_tensors['weight'], weight * s[:, None, None, None], rtol=1e-6)
+        npt.assert_allclose(conv.input_tensors[conv.inputs[2]], b, rtol=1e-6)
+
+    def test_fold_grouped_conv_transpose(self):  # type: () -> None
+        weight = _random_array((4, 3, 1, 1))
+        model, s, b = self._bn_model('ConvTranspose', weight, group=2, kernel_shape=(1, 1))
+        new_graph = Graph.from_onnx(model.graph).transformed([BNFolder()])
+        self.assertEqual(len(new_graph.nodes), 1)
+        conv = new_graph.nodes[0]
+        # output channel g * 3 + j is computed from weight[g * 2:(g + 1) * 2, j]
+        expected = np.concatenate([weight[:2] * s[None, :3, None, None],
+                                   weight[2:] * s[None, 3:, None, None]])
+        npt.assert_allclose(conv.input_tensors['weight'], expected, rtol=1e-6)
+        npt.assert_allclose(conv.input_tensors[conv.inputs[2]], b, rtol=1e-6)
+
+
+class LayerNormFuserTest(unittest.TestCase):
+    def test_fuse_layer_norm(self):  # type: () -> None
+        gamma = _random_array((8,))
+        beta = _random_array((8,))
+        initializer = [numpy_helper.from_array(np.array(2.0, dtype=np.float32), name='two'),
+                       numpy_helper.from_array(np.array(1e-5, dtype=np.float32), name='eps'),
+                       numpy_helper.from_array(gamma, name='gamma'),
+                       numpy_helper.from_array(beta, name='beta')]
+        nodes = [
+            helper.make_node('ReduceMean', inputs=['input'], outputs=['mean'], axes=[-1]),
+            helper.make_node('Sub', inputs=['input', 'mean'], outputs=['centered']),
+            helper.make_node('Pow', inputs=['centered', 'two'], outputs=['square']),
+            helper.make_node('ReduceMean', inputs=['square'], outputs=['var'], axes=[-1]),
+            helper.make_node('Add', inputs=['var', 'eps'], outputs=['var_eps']),
+            helper.make_node('Sqrt', inputs=['var_eps'], outputs=['std']),
+            helper.make_node('Div', inputs=['centered', 'std'], outputs=['normalized']),
+            helper.make_node('Mul', inputs=['normalized', 'gamma'], outputs=['scaled']),
+            helper.make_node('Add', inputs=['scaled', 'beta'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (2, 3, 8))], [('out', (2, 3, 8), TensorProto.FLOAT)],
+                                   initializer)
+        new_graph = Graph.from_onnx(model.graph).transformed([LayerNormFuser()])
+        self.assertEqual(len(new_graph.nodes), 1)
+        layer_norm = new_graph.nodes[0]
+        self.assertEqual(layer_norm.op_type, 'LayerNormalization')
+        self.assertEqual(layer_norm.inputs[0], 'input')
+        self.assertEqual(layer_norm.outputs, ['out'])
+        self.assertEqual(layer_norm.attrs['axis'], 2)
+        npt.assert_allclose(layer_norm.attrs['epsilon'], 1e-5)
+        npt.assert_equal(layer_norm.input_tensors[layer_norm.inputs[1]], gamma)
+        npt.assert_equal(layer_norm.input_tensors[layer_norm.inputs[2]], beta)
+
+        spec = convert(model, disable_coreml_rank5_mapping=True, return_spec=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['layerNormalization'])
+
+
+class ActivationFuserTest(unittest.TestCase):
+    def _constants(self, **values):  # type: (**float) -> Any
+        return [numpy_helper.from_array(np.array(v, dtype=np.float32), name=k) for k, v in values.items()]
+
+    def test_fuse_gelu(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Div', inputs=['input', 'sqrt2'], outputs=['scaled']),
+            helper.make_node('Erf', inputs=['scaled'], outputs=['erf']),
+            helper.make_node('Add', inputs=['erf', 'one'], outputs=['erf_1']),
+            helper.make_node('Mul', inputs=['input', 'erf_1'], outputs=['mul']),
+            helper.make_node('Mul', inputs=['mul', 'half'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (2, 8))], [('out', (2, 8), TensorProto.FLOAT)],
+                                   self._constants(sqrt2=np.sqrt(2.0), one=1.0, half=0.5))
+        new_graph = Graph.from_onnx(model.graph).transformed([ActivationFuser()])
+        self.assertEqual([(n.op_type, n.inputs, n.outputs) for n in new_graph.nodes],
+                         [('Gelu', ['input'], ['out'])])
+        self.assertEqual(new_graph.nodes[0].attrs['approximate'], b'none')
+
+        # the Gelu layer needs iOS14, the model keeps targeting iOS13 unless asked otherwise
+        spec = convert(model, disable_coreml_rank5_mapping=True, return_spec=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers],
+                         ['activation', 'erf', 'activation', 'multiplyBroadcastable'])
+        self.assertEqual(spec.specificationVersion, 4)
+        spec = convert(model, disable_coreml_rank5_mapping=True, return_spec=True, minimum_ios_deployment_target='14')
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['gelu'])
+        self.assertEqual(spec.specificationVersion, 5)
+
+    def test_fuse_hard_swish(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Add', inputs=['input', 'three'], outputs=['shifted']),
+            helper.make_node('Clip', inputs=['shifted', 'zero', 'six'], outputs=['relu6']),
+            helper.make_node('Mul', inputs=['input', 'relu6'], outputs=['mul']),
+            helper.make_node('Div', inputs=['mul', 'six'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (2, 8))], [('out', (2, 8), TensorProto.FLOAT)],
+                                   self._constants(three=3.0, zero=0.0, six=6.0))
+        new_graph = Graph.from_onnx(model.graph).transformed([ActivationFuser()])
+        self.assertEqual([(n.op_type, n.inputs, n.outputs) for n in new_graph.nodes],
+                         [('HardSwish', ['input'], ['out'])])
+
+
+class AttentionFuserTest(unittest.TestCase):
+    def test_fuse_attention(self):  # type: () -> None
+        batch, seq, heads, head_size = 1, 5, 2, 4
+        hidden = heads * head_size
+        weights = dict((c, _random_array((hidden, hidden))) for c in 'qkv')
+        initializer = [numpy_helper.from_array(w, name='W' + c) for c, w in weights.items()]
+        initializer += [numpy_helper.from_array(_random_array((hidden,)), name='b' + c) for c in 'qkv']
+        initializer += [numpy_helper.from_array(np.array(2.0, dtype=np.float32), name='scale')]
+        nodes = []
+        for c in 'qkv':
+            nodes += [
+                helper.make_node('MatMul', inputs=['input', 'W' + c], outputs=[c + '_matmul']),
+                helper.make_node('Add', inputs=[c + '_matmul', 'b' + c], outputs=[c + '_add']),
+                helper.make_node('Reshape', inputs=[c + '_add'], outputs=[c + '_heads'],
+                                 shape=[batch, seq, heads, head_size]),
+                helper.make_node('Transpose', inputs=[c + '_heads'], outputs=[c], perm=[0, 2, 1, 3]),
+            ]
+        nodes += [
+            helper.make_node('Transpose', inputs=['k'], outputs=['k_t'], perm=[0, 1, 3, 2]),
+            helper.make_node('MatMul', inputs=['q', 'k_t'], outputs=['scores']),
+            helper.make_node('Div', inputs=['scores', 'scale'], outputs=['scaled_scores']),
+            helper.make_node('Softmax', inputs=['scaled_scores'], outputs=['probs'], axis=-1),
+            helper.make_node('MatMul', inputs=['probs', 'v'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (batch, seq, hidden))],
+                                   [('out', (batch, heads, seq, head_size), TensorProto.FLOAT)], initializer)
+        new_graph = Graph.from_onnx(model.graph).transformed([AttentionFuser()])
+        self.assertEqual([n.op_type for n in new_graph.nodes],
+                         ['MatMul', 'Add', 'Split'] + ['Reshape', 'Transpose'] * 3 + ['MatMul', 'Softmax', 'MatMul'])
+        fused_weight = new_graph.nodes[0].input_tensors[new_graph.nodes[0].inputs[1]]
+        npt.assert_allclose(fused_weight, np.concatenate([weights['q'] / 2.0, weights['k'], weights['v']], axis=1),
+                            rtol=1e-6)
+        self.assertEqual(new_graph.nodes[2].outputs, ['q_add', 'k_add', 'v_add'])
+        scores = new_graph.nodes[9]
+        self.assertEqual(scores.inputs, ['q', 'k'])
+        self.assertEqual(scores.outputs, ['scaled_scores'])
+        self.assertEqual(scores.attrs, {'transB': 1})
+
+
+class DeadCodeAndCSETest(unittest.TestCase):
+    def test_dead_code_elimination(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Relu', inputs=['input'], outputs=['relu']),
+            helper.make_node('Exp', inputs=['relu'], outputs=['unused']),
+            helper.make_node('Sigmoid', inputs=['unused'], outputs=['unused_head']),
+            helper.make_node('Tanh', inputs=['relu'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 4))], [('out', (1, 4), TensorProto.FLOAT)])
+        new_graph = Graph.from_onnx(model.graph).transformed([DeadCodeEliminator()])
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Relu', 'Tanh'])
+        self.assertEqual(new_graph.nodes[0].children, [new_graph.nodes[1]])
+
+    def test_common_subexpression_elimination(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Shape', inputs=['input'], outputs=['shape_1']),
+            helper.make_node('Shape', inputs=['input'], outputs=['shape_2']),
+            helper.make_node('Gather', inputs=['shape_1', 'index'], outputs=['dim_1'], axis=0),
+            helper.make_node('Gather', inputs=['shape_2', 'index'], outputs=['dim_2'], axis=0),
+            helper.make_node('Gather', inputs=['shape_2', 'other_index'], outputs=['dim_3'], axis=0),
+            helper.make_node('Concat', inputs=['dim_1', 'dim_2', 'dim_3'], outputs=['out'], axis=0),
+        ]
+        initializer = [numpy_helper.from_array(np.array([0]), name='index'),
+                       numpy_helper.from_array(np.array([1]), name='other_index')]
+        model = _onnx_create_model(nodes, [('input', (1, 4))], [('out', (3,), TensorProto.INT64)], initializer)
+        new_graph = Graph.from_onnx(model.graph).transformed([CommonSubexpressionEliminator()])
+        self.assertEqual([n.outputs[0] for n in new_graph.nodes], ['shape_1', 'dim_1', 'dim_3', 'out'])
+        self.assertEqual(new_graph.nodes[2].inputs[0], 'shape_1')
+        self.assertEqual(new_graph.nodes[3].inputs, ['dim_1', 'dim_1', 'dim_3'])
+
+
+class NoOpRemoverTest(unittest.TestCase):
+    def test_remove_no_ops(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Identity', inputs=['input'], outputs=['identity']),
+            helper.make_node('Cast', inputs=['identity'], outputs=['cast'], to=TensorProto.FLOAT),
+            helper.make_node('Concat', inputs=['cast'], outputs=['concat'], axis=1),
+            helper.make_node('Sum', inputs=['concat'], outputs=['sum']),
+            helper.make_node('Transpose', inputs=['sum'], outputs=['transpose'], perm=[0, 1]),
+            helper.make_node('Relu', inputs=['transpose'], outputs=['relu']),
+            helper.make_node('Dropout', inputs=['relu'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (2, 3))], [('out', (2, 3), TensorProto.FLOAT)])
+        new_graph = Graph.from_onnx(model.graph).transformed([NoOpRemover()])
+        self.assertEqual([(n.op_type, n.inputs, n.outputs) for n in new_graph.nodes],
+                         [('Relu', ['input'], ['out'])])
+
+        spec = convert(model, return_spec=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['activation'])
+        self.assertEqual(spec.description.output[0].name, 'out')
+
+
+    def test_keep_slice_with_runtime_steps(self):  # type: () -> None
+        initializer = [numpy_helper.from_array(np.array([0], dtype=np.int64), name='starts'),
+                       numpy_helper.from_array(np.array([3], dtype=np.int64), name='ends'),
+                       numpy_helper.from_array(np.array([1], dtype=np.int64), name='axes')]
+        nodes = [
+            helper.make_node('Slice', inputs=['input', 'starts', 'ends', 'axes', 'steps'], outputs=['slice']),
+            helper.make_node('Relu', inputs=['slice'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (2, 3)), ('steps', (1,))],
+                                   [('out', (2, 3), TensorProto.FLOAT)], initializer)
+        graph = Graph.from_onnx(model.graph)
+        graph.shape_dict.update({'input': (2, 3), 'slice': (2, 3), 'out': (2, 3)})
+        # the steps may be -1 at runtime, reversing the data without changing its shape
+        new_graph = graph.transformed([NoOpRemover()])
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Slice', 'Relu'])
+
+class ReshapeChainFuserTest(unittest.TestCase):
+    def test_collapse_chain(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Flatten', inputs=['input'], outputs=['flatten'], axis=1),
+            helper.make_node('Unsqueeze', inputs=['flatten'], outputs=['unsqueeze'], axes=[0]),
+            helper.make_node('Squeeze', inputs=['unsqueeze'], outputs=['squeeze'], axes=[0]),
+            helper.make_node('Flatten', inputs=['squeeze'], outputs=['flatten_1'], axis=0),
+            helper.make_node('Relu', inputs=['flatten_1'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 3, 4))], [('out', (1, 12), TensorProto.FLOAT)])
+        graph = Graph.from_onnx(model.graph)
+        graph.shape_dict.update({'flatten': (1, 12), 'unsqueeze': (1, 1, 12), 'squeeze': (1, 12), 'flatten_1': (1, 12)})
+        new_graph = graph.transformed([ReshapeChainFuser()])
+        self.assertEqual([(n.op_type, n.inputs[0], n.outputs) for n in new_graph.nodes],
+                         [('Reshape', 'input', ['flatten_1']), ('Relu', 'flatten_1', ['out'])])
+        npt.assert_equal(new_graph.nodes[0].input_tensors[new_graph.nodes[0].inputs[1]], [1, 12])
+
+    def test_remove_identity_chain(self):  # type: () -> None
+        nodes = [
+            helper.make_node('Flatten', inputs=['input'], outputs=['flatten'], axis=0),
+            helper.make_node('Flatten', inputs=['flatten'], outputs=['flatten_1'], axis=1),
+            helper.make_node('Relu', inputs=['flatten_1'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 6))], [('out', (1, 6), TensorProto.FLOAT)])
+        graph = Graph.from_onnx(onnx.shape_inference.infer_shapes(model).graph)
+        new_graph = graph.transformed([ReshapeChainFuser()])
+        self.assertEqual([(n.op_type, n.inputs, n.outputs) for n in new_graph.nodes],
+                         [('Relu', ['input'], ['out'])])
+
+        spec = convert(model, disable_coreml_rank5_mapping=True, return_spec=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['activation'])
+
+
+class PadFolderTest(unittest.TestCase):
+    def _transform(self, pool_node, value=0.0):  # type: (Any, float) -> Graph
+        pads = numpy_helper.from_array(np.array([0, 0, 1, 2, 0, 0, 2, 1], dtype=np.int64), name='pads')
+        value = numpy_helper.from_array(np.array(value, dtype=np.float32), name='value')
+        nodes = [
+            helper.make_node('Pad', inputs=['input', 'pads', 'value'], outputs=['pad']),
+            pool_node,
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 2, 6, 6))], [('out', (1, 2, 6, 6), TensorProto.FLOAT)],
+                                   [pads, value])
+        return Graph.from_onnx(model.graph).transformed([PadFolder()])
+
+    def test_fold_into_conv(self):  # type: () -> None
+        weight = numpy_helper.from_array(_random_array((3, 2, 3, 3)), name='weight')
+        conv = helper.make_node('Conv', inputs=['pad', 'weight'], outputs=['out'], pads=[1, 0, 0, 1])
+        pads = numpy_helper.from_array(np.array([0, 0, 1, 2, 0, 0, 2, 1], dtype=np.int64), name='pads')
+        model = _onnx_create_model([helper.make_node('Pad', inputs=['input', 'pads'], outputs=['pad']), conv],
+                                   [('input', (1, 2, 6, 6))], [('out', (1, 3, 7, 7), TensorProto.FLOAT)],
+                                   [pads, weight])
+        new_graph = Graph.from_onnx(model.graph).transformed([PadFolder()])
+        self.assertEqual([(n.op_type, n.inputs[0]) for n in new_graph.nodes], [('Conv', 'input')])
+        self.assertEqual(new_graph.nodes[0].attrs['pads'], [2, 2, 2, 2])
+
+    def test_fold_into_pool(self):  # type: () -> None
+        new_graph = self._transform(helper.make_node('AveragePool', inputs=['pad'], outputs=['out'],
+                                                     kernel_shape=[3, 3]))
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['AveragePool'])
+        self.assertEqual(new_graph.nodes[0].attrs['pads'], [1, 2, 2, 1])
+        self.assertEqual(new_graph.nodes[0].attrs['count_include_pad'], 1)
+
+        # the pool already excludes its own padding from the average
+        new_graph = self._transform(helper.make_node('AveragePool', inputs=['pad'], outputs=['out'],
+                                                     kernel_shape=[3, 3], pads=[1, 1, 1, 1]))
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Pad', 'AveragePool'])
+
+        new_graph = self._transform(helper.make_node('MaxPool', inputs=['pad'], outputs=['out'],
+                                                     kernel_shape=[3, 3]), value=-np.inf)
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['MaxPool'])
+
+        # zero padding may be larger than the input values
+        new_graph = self._transform(helper.make_node('MaxPool', inputs=['pad'], outputs=['out'],
+                                                     kernel_shape=[3, 3]))
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Pad', 'MaxPool'])
+
+
+class MatMulAddFuserTest(unittest.TestCase):
+    def test_fuse_bias(self):  # type: () -> None
+        weight = numpy_helper.from_array(_random_array((4, 3)), name='weight')
+        bias = numpy_helper.from_array(_random_array((3,)), name='bias')
+        nodes = [
+            helper.make_node('MatMul', inputs=['input', 'weight'], outputs=['matmul']),
+            helper.make_node('Add', inputs=['bias', 'matmul'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (2, 4))], [('out', (2, 3), TensorProto.FLOAT)], [weight, bias])
+        new_graph = Graph.from_onnx(model.graph).transformed([MatMulAddFuser()])
+        self.assertEqual([(n.op_type, n.inputs, n.outputs) for n in new_graph.nodes],
+                         [('MatMul', ['input', 'weight', 'bias'], ['out'])])
+
+        spec = convert(model, disable_coreml_rank5_mapping=True, return_spec=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['batchedMatmul'])
+        self.assertTrue(spec.neuralNetwork.layers[0].batchedMatmul.hasBias)
+        spec = convert(model, return_spec=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['innerProduct'])
+        self.assertTrue(spec.neuralNetwork.layers[0].innerProduct.hasBias)
+
+    def test_gemm_without_c(self):  # type: () -> None
+        weight = numpy_helper.from_array(_random_array((3, 4)), name='weight')
+        nodes = [helper.make_node('Gemm', inputs=['input', 'weight'], outputs=['out'], alpha=2.0, transB=1)]
+        model = _onnx_create_model(nodes, [('input', (2, 4))], [('out', (2, 3), TensorProto.FLOAT)], [weight])
+        spec = convert(model, disable_coreml_rank5_mapping=True, return_spec=True)
+        layer = spec.neuralNetwork.layers[0].batchedMatmul
+        self.assertEqual(len(spec.neuralNetwork.layers), 1)
+        self.assertFalse(layer.hasBias)
+        # alpha is folded into the weights, which are stored transposed
+        npt.assert_allclose(np.array(layer.weights.floatValue).reshape(3, 4),
+                            2.0 * numpy_helper.to_array(weight), rtol=1e-6)
+
+
+class AffineFuserTest(unittest.TestCase):
+    def test_fuse_affine_chain(self):  # type: () -> None
+        constants = [numpy_helper.from_array(np.array(v, dtype=np.float32), name=name)
+                     for name, v in [('a', 0.5), ('b', [1.0]), ('d', 4.0), ('e', 2.0)]]
+        nodes = [
+            helper.make_node('Mul', inputs=['input', 'a'], outputs=['mul']),
+            helper.make_node('Sub', inputs=['b', 'mul'], outputs=['sub']),
+            helper.make_node('Div', inputs=['sub', 'd'], outputs=['div']),
+            helper.make_node('Add', inputs=['div', 'e'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 3))], [('out', (1, 3), TensorProto.FLOAT)], constants)
+        new_graph = Graph.from_onnx(model.graph).transformed([AffineFuser()])
+        self.assertEqual([(n.op_type, n.inputs, n.outputs) for n in new_graph.nodes],
+                         [('Affine', ['input'], ['out'])])
+        # (1 - 0.5 * x) / 4 + 2
+        self.assertEqual(new_graph.nodes[0].attrs, {'alpha': -0.125, 'beta': 2.25})
+
+        for disable_rank5_mapping in [False, True]:
+            spec = convert(model, disable_coreml_rank5_mapping=disable_rank5_mapping, return_spec=True)
+            self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['activation'])
+            npt.assert_allclose([spec.neuralNetwork.layers[0].activation.linear.alpha,
+                                 spec.neuralNetwork.layers[0].activation.linear.beta], [-0.125, 2.25])
+
+    def test_remove_identity(self):  # type: () -> None
+        scale = numpy_helper.from_array(np.array(2.0, dtype=np.float32), name='scale')
+        nodes = [
+            helper.make_node('Relu', inputs=['input'], outputs=['relu']),
+            helper.make_node('Mul', inputs=['relu', 'scale'], outputs=['mul']),
+            helper.make_node('Div', inputs=['mul', 'scale'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 3))], [('out', (1, 3), TensorProto.FLOAT)], [scale])
+        new_graph = Graph.from_onnx(model.graph).transformed([AffineFuser()])
+        self.assertEqual([(n.op_type, n.inputs, n.outputs) for n in new_graph.nodes],
+                         [('Relu', ['input'], ['out'])])
+
+
+class InputNormalizationFolderTest(unittest.TestCase):
+    def _model(self, std, pads=(0, 0, 0, 0)):  # type: (Any, Any) -> Any
+        mean = numpy_helper.from_array(np.array([0.5, 0.4, 0.3], dtype=np.float32).reshape(3, 1, 1), name='mean')
+        std = numpy_helper.from_array(np.array(std, dtype=np.float32).reshape(-1, 1, 1), name='std')
+        weight = numpy_helper.from_array(_random_array((4, 3, 1, 1)), name='weight')
+        bias = numpy_helper.from_array(_random_array((4,)), name='bias')
+        nodes = [
+            helper.make_node('Sub', inputs=['input', 'mean'], outputs=['sub']),
+            helper.make_node('Div', inputs=['sub', 'std'], outputs=['div']),
+            helper.make_node('Conv', inputs=['div', 'weight', 'bias'], outputs=['out'],
+                             kernel_shape=[1, 1], pads=pads),
+        ]
+        return _onnx_create_model(nodes, [('input', (1, 3, 5, 5))], [('out', (1, 4, 5, 5), TensorProto.FLOAT)],
+                                  [mean, std, weight, bias])
+
+    def test_fold_into_preprocessing(self):  # type: () -> None
+        model = self._model([0.25])
+        new_graph = Graph.from_onnx(model.graph).transformed([InputNormalizationFolder(['input'])])
+        self.assertEqual([(n.op_type, n.inputs[0]) for n in new_graph.nodes],
+                         [('ImageScaler', 'input'), ('Conv', 'div')])
+        self.assertEqual(new_graph.nodes[0].attrs['scale'], 4.0)
+        npt.assert_allclose(new_graph.nodes[0].attrs['bias'], [-2.0, -1.6, -1.2], rtol=1e-6)
+
+        spec = convert(model, image_input_names=['input'], return_spec=True)
+        self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['convolution'])
+        scaler = spec.neuralNetwork.preprocessing[0].scaler
+        npt.assert_allclose([scaler.channelScale, scaler.redBias, scaler.greenBias, scaler.blueBias],
+                            [4.0, -2.0, -1.6, -1.2], rtol=1e-6)
+
+    def test_fold_into_conv(self):  # type: () -> None
+        # the scale differs per channel: not expressible as CoreML preprocessing
+        model = self._model([0.2, 0.25, 0.5])
+        x = _random_array((3, 5, 5))
+        W = numpy_helper.to_array(model.graph.initializer[2])[:, :, 0, 0]
+        b = numpy_helper.to_array(model.graph.initializer[3])
+        mean = np.array([0.5, 0.4, 0.3]).reshape(3, 1, 1)
+        std = np.array([0.2, 0.25, 0.5]).reshape(3, 1, 1)
+        expected = np.einsum('oc,chw->ohw', W, (x - mean) / std) + b.reshape(4, 1, 1)
+
+        new_graph = Graph.from_onnx(model.graph).transformed([InputNormalizationFolder(['input'])])
+        self.assertEqual([(n.op_type, n.inputs[0]) for n in new_graph.nodes], [('Conv', 'input')])
+        conv = new_graph.nodes[0]
+        output = np.einsum('oc,chw->ohw', conv.input_tensors['weight'][:, :, 0, 0], x) + \
+            conv.input_tensors['bias'].reshape(4, 1, 1)
+        npt.assert_allclose(output, expected, rtol=1e-4, atol=1e-4)
+
+        # the zero padding of the conv would be shifted by the mean
+        new_graph = Graph.from_onnx(self._model([0.2, 0.25, 0.5], pads=(1, 1, 1, 1)).graph).transformed(
+            [InputNormalizationFolder()])
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Sub', 'Div', 'Conv'])
+
+
+class SpatialReduceToGlobalPoolTest(unittest.TestCase):
+    def test_keepdims(self):  # type: () -> None
+        nodes = [
+            helper.make_node('ReduceMean', inputs=['input'], outputs=['mean'], axes=[2, 3]),
+            helper.make_node('ReduceMax', inputs=['input'], outputs=['max'], axes=[-1, -2]),
+            helper.make_node('Add', inputs=['mean', 'max'], outputs=['out']),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 3, 5, 5))], [('out', (1, 3, 1, 1), TensorProto.FLOAT)])
+        new_graph = Graph.from_onnx(model.graph).transformed([SpatialReduceToGlobalPool()])
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['GlobalAveragePool', 'GlobalMaxPool', 'Add'])
+
+        for disable_rank5_mapping in [False, True]:
+            spec = convert(model, disable_coreml_rank5_mapping=disable_rank5_mapping, return_spec=True)
+            layers = spec.neuralNetwork.layers
+            self.assertEqual([l.WhichOneof('layer') for l in layers][:2], ['pooling', 'pooling'])
+            self.assertTrue(layers[0].pooling.globalPooling)
+
+    def test_no_keepdims(self):  # type: () -> None
+        nodes = [helper.make_node('ReduceMean', inputs=['input'], outputs=['out'], axes=[2, 3], keepdims=0)]
+        model = _onnx_create_model(nodes, [('input', (1, 3, 5, 5))], [('out', (1, 3), TensorProto.FLOAT)])
+        new_graph = Graph.from_onnx(model.graph).transformed([SpatialReduceToGlobalPool()])
+        self.assertEqual([(n.op_type, n.outputs) for n in new_graph.nodes],
+                         [('GlobalAveragePool', ['out_pooled']), ('Flatten', ['out'])])
+
+        for disable_rank5_mapping in [False, True]:
+            spec = convert(model, disable_coreml_rank5_mapping=disable_rank5_mapping, return_spec=True)
+            self.assertEqual(spec.neuralNetwork.layers[0].WhichOneof('layer'), 'pooling')
+
+        # reduction over the channels is left alone
+        nodes = [helper.make_node('ReduceMean', inputs=['input'], outputs=['out'], axes=[1, 2, 3])]
+        model = _onnx_create_model(nodes, [('input', (1, 3, 5, 5))], [('out', (1, 1, 1, 1), TensorProto.FLOAT)])
+        new_graph = Graph.from_onnx(model.graph).transformed([SpatialReduceToGlobalPool()])
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['ReduceMean'])
+
+
+class ChannelMatMulToConvTest(unittest.TestCase):
+    def _conv_output(self, graph, x):  # type: (Graph, Any) -> Any
+        conv = graph.nodes[0]
+        W = conv.input_tensors[conv.inputs[1]][:, :, 0, 0]
+        b = conv.input_tensors[conv.inputs[2]] if len(conv.inputs) > 2 else np.zeros(W.shape[0])
+        return np.einsum('oc,nchw->nohw', W, x) + b.reshape(-1, 1, 1)
+
+    def test_weights_on_the_right(self):  # type: () -> None
+        x = _random_array((1, 3, 4, 5))
+        W = _random_array((3, 6))
+        b = _random_array((6,))
+        nodes = [
+            helper.make_node('Transpose', inputs=['input'], outputs=['nhwc'], perm=[0, 2, 3, 1]),
+            helper.make_node('MatMul', inputs=['nhwc', 'W'], outputs=['matmul']),
+            helper.make_node('Add', inputs=['matmul', 'b'], outputs=['add']),
+            helper.make_node('Transpose', inputs=['add'], outputs=['out'], perm=[0, 3, 1, 2]),
+        ]
+        model = _onnx_create_model(nodes, [('input', (1, 3, 4, 5))], [('out', (1, 6, 4, 5), TensorProto.FLOAT)],
+                                   [numpy_helper.from_array(W, name='W'), numpy_helper.from_array(b, name='b')])
+        new_graph = Graph.from_onnx(model.graph).transformed([MatMulAddFuser(), ChannelMatMulToConv()])
+        self.assertEqual([(n.op_type, n.inputs[0], n.outputs) for n in new_graph.nodes], [('Conv', 'input', ['out'])])
+        expected = np.matmul(x.transpose(0, 2, 3, 1), W).transpose(0, 3, 1, 2) + b.reshape(-1, 1, 1)
+        npt.assert_allclose(self._conv_output(new_graph, x), expected, rtol=1e-4, atol=1e-4)
+
+        for disable_rank5_mapping in [False, True]:
+            spec = convert(model, disable_coreml_rank5_mapping=disable_rank5_mapping, return_spec=True)
+            self.assertEqual([l.WhichOneof('layer') for l in spec.neuralNetwork.layers], ['convolution'])
+
+    def test_weights_on_the_left(self):  # type: () -> None
+        x = _random_array((2, 3, 4, 5))
+        W = _random_array((6, 3))
+        nodes = [
+            helper.make_node('Transpose', inputs=['input'], outputs=['nhcw'], perm=[0, 2, 1, 3]),
+            helper.make_node('MatMul', inputs=['W', 'nhcw'], outputs=['matmul']),
+            helper.make_node('Transpose', inputs=['matmul'], outputs=['out'], perm=[0, 2, 1, 3]),
+        ]
+        model = _onnx_create_model(nodes, [('input', (2, 3, 4, 5))], [('out', (2, 6, 4, 5), TensorProto.FLOAT)],
+                                   [numpy_helper.from_array(W, name='W')])
+        new_graph = Graph.from_onnx(model.graph).transformed([ChannelMatMulToConv()])
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Conv'])
+        expected = np.matmul(W, x.transpose(0, 2, 1, 3)).transpose(0, 2, 1, 3)
+        npt.assert_allclose(self._conv_output(new_graph, x), expected, rtol=1e-4, atol=1e-4)
+
+        # the second Transpose does not restore the layout
+        nodes[2] = helper.make_node('Transpose', inputs=['matmul'], outputs=['out'], perm=[0, 2, 3, 1])
+        model = _onnx_create_model(nodes, [('input', (2, 3, 4, 5))], [('out', (2, 6, 5, 4), TensorProto.FLOAT)],
+                                   [numpy_helper.from_array(W, name='W')])
+        new_graph = Graph.from_onnx(model.graph).transformed([ChannelMatMulToConv()])
+        self.assertEqual([n.op_type for n in new_graph.nodes], ['Transpose', 'MatMul', 'Transpose'])
+
+
 if __name__ == '__main__':
     unittest.main()